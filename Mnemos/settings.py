@@ -155,6 +155,70 @@ LOGGING = {
     },
 }
 
+# Maximum number of cards a user reviews per day in due review sessions (unlimited if not set)
+DAILY_REVIEW_LIMIT = int(os.environ["DAILY_REVIEW_LIMIT"]) if os.environ.get("DAILY_REVIEW_LIMIT") else None
+
+# Cache of AI generation results (see flashcards/generation_cache.py). The local-memory backend is per process;
+# point GENERATION_CACHE_BACKEND/LOCATION at Redis or Memcached to share it between workers.
+GENERATION_CACHE_ALIAS = "ai_generation"
+
+# Cache of the per-user FSRS parameters (see flashcards/scheduler_cache.py). It must be shared between all processes
+# (Redis or Memcached via SCHEDULER_CACHE_BACKEND/LOCATION) for parameters saved by one process (e.g. the
+# optimize_fsrs_parameters command) to be dropped in the others; with the per-process local-memory backend entries
+# are kept for at most SCHEDULER_LOCAL_CACHE_TTL seconds instead.
+SCHEDULER_CACHE_ALIAS = "scheduler"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    GENERATION_CACHE_ALIAS: {
+        "BACKEND": os.environ.get("GENERATION_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("GENERATION_CACHE_LOCATION", "ai-generation"),
+        "TIMEOUT": int(os.environ.get("GENERATION_CACHE_TTL", 7 * 24 * 3600)),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", 1000))},
+    },
+    SCHEDULER_CACHE_ALIAS: {
+        "BACKEND": os.environ.get("SCHEDULER_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("SCHEDULER_CACHE_LOCATION", "scheduler"),
+    },
+}
+
+# Spread the intervals of review cards over the least loaded days of their fuzz range (see flashcards/load_balancing.py)
+LOAD_BALANCING = os.environ.get("LOAD_BALANCING", "True").lower() == "true"
+
+# Per-user FSRS calculators (see flashcards/scheduler_cache.py): a process-local LRU of SCHEDULER_LOCAL_CACHE_SIZE
+# users whose entries expire after SCHEDULER_LOCAL_CACHE_TTL seconds, backed by the parameters stored in the
+# SCHEDULER_CACHE_ALIAS cache. Set the size to 0 to always read the shared cache.
+SCHEDULER_CACHE_TIMEOUT = int(os.environ.get("SCHEDULER_CACHE_TIMEOUT", 24 * 3600))
+SCHEDULER_LOCAL_CACHE_SIZE = int(os.environ.get("SCHEDULER_LOCAL_CACHE_SIZE", 10_000))
+SCHEDULER_LOCAL_CACHE_TTL = float(os.environ.get("SCHEDULER_LOCAL_CACHE_TTL", 60))
+
+# Long texts are split into sections of about AI_CHUNK_TOKENS tokens for AI generation (see flashcards/chunking.py)
+AI_CHUNK_TOKENS = int(os.environ.get("AI_CHUNK_TOKENS", 8000))
+AI_CHUNK_OVERLAP_TOKENS = int(os.environ.get("AI_CHUNK_OVERLAP_TOKENS", 200))
+AI_MAX_CONCURRENT_REQUESTS = int(os.environ.get("AI_MAX_CONCURRENT_REQUESTS", 4))
+
+# Budget for the text extracted from uploaded PDFs, and the process pool running the extraction
+# (see flashcards/pdf_extraction.py; 0 workers extracts in the web process)
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 500))
+PDF_MAX_CHARS = int(os.environ.get("PDF_MAX_CHARS", 400_000))
+PDF_EXTRACTION_WORKERS = int(os.environ.get("PDF_EXTRACTION_WORKERS", 2))
+PDF_EXTRACTION_TIMEOUT = float(os.environ.get("PDF_EXTRACTION_TIMEOUT", 60))
+
+# Gemini API client: timeouts in seconds, retries of failed requests and circuit breaker (see flashcards/gemini.py)
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", 5))
+GEMINI_READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", 60))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 3))
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 10))
+GEMINI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("GEMINI_CIRCUIT_FAILURE_THRESHOLD", 5))
+GEMINI_CIRCUIT_RESET_TIMEOUT = float(os.environ.get("GEMINI_CIRCUIT_RESET_TIMEOUT", 30))
+
+# Cards at least DUPLICATE_THRESHOLD similar to a card of the set (or to an earlier card of the same batch) are
+# skipped when generating or importing flashcards (see flashcards/dedup.py)
+DUPLICATE_FILTER = os.environ.get("DUPLICATE_FILTER", "True").lower() == "true"
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", 0.8))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -0,0 +1,47 @@
+"""
+Shared setup for the benchmark scripts, which are run as modules from the project root, e.g.:
+
+    python -m benchmarks.due_queue
+
+Benchmarks run against a fresh SQLite database in the temp directory, or against BENCHMARK_DATABASE_URL if set
+(for example a PostgreSQL database). The database is migrated before the benchmark starts.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+
+def setup_django():
+    default_path = os.path.join(tempfile.gettempdir(), "mnemos_benchmark.sqlite3")
+    database_url = os.environ.get("BENCHMARK_DATABASE_URL")
+    if database_url is None:
+        if os.path.exists(default_path):
+            os.remove(default_path)
+        database_url = f"sqlite:///{default_path}"
+
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Mnemos.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALLOWED_HOSTS", "localhost")
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def create_user(username):
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.create_user(username=username, email=f"{username}@example.com", password="password")
+
+
+def measure(function, repeat=5):
+    """ Runs function repeat times and returns the median wall-clock time in milliseconds. """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,56 @@
+"""
+Due queue latency from 1k to 1M due cards.
+
+Compares fetching one page of the keyset-paginated due queue (first page and a page deep in the queue)
+with materializing the whole ordered list of due card ids, as the review session used to do.
+
+    python -m benchmarks.due_queue [--sizes 1000 10000 100000 1000000]
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import setup_django, create_user, measure
+
+
+def populate(user, size, batch_size=10_000):
+    from django.utils import timezone
+    from flashcards.models import Flashcard, FlashcardSet, Review
+
+    flashcard_set = FlashcardSet.objects.create(title=f"Due {size}", description="Benchmark", created_by=user)
+    start = timezone.now() - timedelta(days=365)
+    for offset in range(0, size, batch_size):
+        count = min(batch_size, size - offset)
+        flashcards = Flashcard.objects.bulk_create(
+            [Flashcard(front=f"Front {offset + i}", back="Back", flashcard_set=flashcard_set) for i in range(count)]
+        )
+        Review.objects.bulk_create([
+            Review(user=user, flashcard=flashcard, next_review_date=start + timedelta(seconds=(offset + i) * 10))
+            for i, flashcard in enumerate(flashcards)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from flashcards.due_queue import due_reviews, get_due_page, encode_cursor
+
+    print(f"{'due cards':>10} {'first page':>12} {'middle page':>12} {'full id list':>13}")
+    for size in args.sizes:
+        user = create_user(f"due{size}")
+        populate(user, size)
+
+        middle = due_reviews(user)[size // 2]
+        middle_cursor = encode_cursor(middle.next_review_date, middle.flashcard_id)
+
+        first_page = measure(lambda: get_due_page(user, limit=args.page_size))
+        middle_page = measure(lambda: get_due_page(user, cursor=middle_cursor, limit=args.page_size))
+        full_list = measure(lambda: list(due_reviews(user).values_list("flashcard_id", flat=True)), repeat=3)
+        print(f"{size:>10} {first_page:>10.2f}ms {middle_page:>10.2f}ms {full_list:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
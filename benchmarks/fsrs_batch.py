@@ -0,0 +1,41 @@
+"""
+Throughput of the vectorized FSRS calculations used by bulk rescheduling and the workload simulator.
+
+Times FSRS.update_state_batch on cards in random states with random ratings, and FSRS.review_intervals_batch
+(rescheduling after the parameters changed), from 10k to 1M cards.
+
+    python -m benchmarks.fsrs_batch [--sizes 10000 100000 1000000]
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.common import setup_django, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    setup_django()
+    from flashcards.fsrs import FSRS
+
+    fsrs = FSRS()
+    rng = np.random.default_rng(42)
+    print(f"{'cards':>8} {'update_state_batch':>20} {'review_intervals':>18} {'cards/s':>12}")
+    for size in args.sizes:
+        states = rng.integers(0, len(FSRS.STATE_CODES), size)
+        stability = rng.lognormal(2, 1.5, size)
+        difficulty = rng.uniform(1, 10, size)
+        elapsed_days = np.where(states == 0, np.nan, stability * rng.uniform(0, 3, size))
+        ratings = rng.integers(1, 5, size)
+
+        update = measure(lambda: fsrs.update_state_batch(states, stability, difficulty, elapsed_days, ratings),
+                         repeat=9)
+        intervals = measure(lambda: fsrs.review_intervals_batch(stability), repeat=9)
+        print(f"{size:>8} {update:>18.2f}ms {intervals:>16.2f}ms {size / update * 1000:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+PDF text extraction on a 300-page fixture: wall-clock time and peak memory.
+
+Compares reading the whole upload into memory and joining the text of every page (as extract_text_for_ai used to)
+with the streaming extractor, without a budget and with the default character budget. Every method runs in a fresh
+process, so its peak RSS is measured on its own.
+
+    python -m benchmarks.pdf_extraction [--pages 300] [--max-chars 400000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+
+from benchmarks.common import measure
+
+
+def write_fixture(path, pages):
+    """
+    Writes a lecture-notes-like PDF: every page holds 50 lines of text and a small incompressible image,
+    which brings 300 pages close to the 5 MB upload limit.
+    """
+    import fitz
+
+    line = "The quick brown fox jumps over the lazy dog while the spaced repetition queue grows. "
+    rng = random.Random(0)
+    with fitz.open() as doc:
+        for number in range(pages):
+            page = doc.new_page()
+            page.insert_text((36, 36), f"Page {number}\n" + "\n".join([line] * 50), fontsize=7)
+            image = fitz.Pixmap(fitz.csRGB, 64, 64, rng.randbytes(64 * 64 * 3), False)
+            page.insert_image(fitz.Rect(400, 700, 464, 764), pixmap=image)
+        doc.save(path)
+
+
+def read_and_join(path, max_chars):
+    import fitz
+
+    with open(path, "rb") as upload:
+        pdf_bytes = upload.read()
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\n".join([page.get_text() for page in doc])
+
+
+def streaming(path, max_chars):
+    from flashcards.pdf_extraction import extract_pdf_text
+    return extract_pdf_text(path)
+
+
+def streaming_with_budget(path, max_chars):
+    from flashcards.pdf_extraction import extract_pdf_text
+    return extract_pdf_text(path, max_chars=max_chars)
+
+
+def run(method, path, max_chars, results):
+    import fitz  # noqa: F401 - imported before the baseline, so only the extraction counts
+    import flashcards.pdf_extraction  # noqa: F401
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    text = method(path, max_chars)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    milliseconds = measure(lambda: method(path, max_chars), repeat=3)
+    results.put((len(text), milliseconds, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--max-chars", type=int, default=400_000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Mnemos.settings")
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fixture.pdf")
+        write_fixture(path, args.pages)
+        print(f"{args.pages}-page fixture, {os.path.getsize(path) / 1024 / 1024:.1f} MB\n")
+
+        print(f"{'method':<24} {'characters':>11} {'time':>11} {'peak memory':>12}")
+        for name, method in [("read + join", read_and_join), ("streaming", streaming),
+                             ("streaming with budget", streaming_with_budget)]:
+            results = context.Queue()
+            process = context.Process(target=run, args=(method, path, args.max_chars, results))
+            process.start()
+            characters, milliseconds, peak = results.get()
+            process.join()
+            print(f"{name:<24} {characters:>11} {milliseconds:>9.1f}ms {peak:>9.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
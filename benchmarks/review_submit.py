@@ -0,0 +1,77 @@
+"""
+Review submit latency with and without the per-user scheduler cache.
+
+Users with optimized FSRS parameters rate cards in turn. The ratings are submitted with services.submit_review
+(one transaction per rating), and the calculator lookup alone is timed with services.get_user_fsrs, for:
+- uncached: the parameters are read from the database on every rating;
+- shared cache: the parameters come from the Django cache, the calculator is rebuilt;
+- local LRU: the calculator is reused from the process-local cache (the default).
+
+    python -m benchmarks.review_submit [--users 100] [--reviews 1000]
+"""
+import argparse
+import random
+
+from benchmarks.common import setup_django, create_user, measure
+
+MODES = {
+    "uncached": {"SCHEDULER_CACHE_ALIAS": "none", "SCHEDULER_LOCAL_CACHE_SIZE": 0},
+    "shared cache": {"SCHEDULER_LOCAL_CACHE_SIZE": 0},
+    "local LRU": {},
+}
+
+
+def populate(user_count, cards_per_user, rng):
+    from flashcards.fsrs import FSRS
+    from flashcards.models import Flashcard, FlashcardSet, SchedulerParameters
+
+    users = []
+    for index in range(user_count):
+        user = create_user(f"review{index}")
+        weights = [weight * rng.uniform(0.9, 1.1) for weight in FSRS.DEFAULT_PARAMS]
+        SchedulerParameters.objects.create(user=user, weights=weights)
+        flashcard_set = FlashcardSet.objects.create(title="Reviews", description="Benchmark", created_by=user)
+        flashcards = Flashcard.objects.bulk_create([
+            Flashcard(front=f"Front {i}", back=f"Back {i}", flashcard_set=flashcard_set) for i in range(cards_per_user)
+        ])
+        users.append((user, flashcards))
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--cards-per-user", type=int, default=20)
+    parser.add_argument("--reviews", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import override_settings
+    from flashcards.services import get_user_fsrs, submit_review
+
+    rng = random.Random(42)
+    users = populate(args.users, args.cards_per_user, rng)
+    ratings = [(user, rng.choice(flashcards), rng.choice([1, 3, 3, 3, 4]))
+               for user, flashcards in (rng.choice(users) for _ in range(args.reviews))]
+    caches = {**settings.CACHES, "none": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+    def submit_all():
+        for user, flashcard, rating in ratings:
+            submit_review(user, flashcard, rating)
+
+    def lookup_all():
+        for user, _, _ in ratings:
+            get_user_fsrs(user)
+
+    print(f"{'mode':<14} {'submit':>10} {'lookup':>10}")
+    for mode, overrides in MODES.items():
+        with override_settings(CACHES=caches, **overrides):
+            submit_all()  # Warm the caches
+            submit = measure(submit_all, repeat=3) / args.reviews
+            lookup = measure(lookup_all) / args.reviews
+        print(f"{mode:<14} {submit:>8.2f}ms {lookup * 1000:>8.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Card search latency from 10k to 1M cards.
+
+Searches cards made of random words from a fixed vocabulary with the indexed full-text search (FTS5 on SQLite,
+the GIN index on PostgreSQL) and with the unindexed substring match it replaces on other databases, for a rare
+term, a common term, a short prefix, two terms and a page deep in the results.
+
+    python -m benchmarks.search [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+
+from benchmarks.common import setup_django, create_user, measure
+
+VOCABULARY_SIZE = 20_000
+WORDS_PER_SIDE = 6
+
+
+def make_vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(VOCABULARY_SIZE)]
+
+
+def populate(user, size, vocabulary, rng, batch_size=10_000):
+    from flashcards.models import Flashcard, FlashcardSet
+
+    # Zipf-like word frequencies, so a few words are common and most are rare
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    flashcard_set = FlashcardSet.objects.create(title=f"Search {size}", description="Benchmark", created_by=user)
+    for offset in range(0, size, batch_size):
+        count = min(batch_size, size - offset)
+        words = rng.choices(vocabulary, weights, k=count * WORDS_PER_SIDE * 2)
+        Flashcard.objects.bulk_create([
+            Flashcard(
+                front=" ".join(words[i * 2 * WORDS_PER_SIDE:(i * 2 + 1) * WORDS_PER_SIDE]),
+                back=" ".join(words[(i * 2 + 1) * WORDS_PER_SIDE:(i + 1) * 2 * WORDS_PER_SIDE]),
+                flashcard_set=flashcard_set,
+            ) for i in range(count)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from flashcards.search import _search_like, parse_query, search_flashcards
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(rng)
+    queries = {
+        "rare": vocabulary[-1],
+        "common": vocabulary[0],
+        "prefix": vocabulary[1][:2],
+        "two terms": f"{vocabulary[0]} {vocabulary[10]}",
+    }
+
+    print(f"{'cards':>8} {'query':<10} {'indexed':>10} {'page 50':>10} {'substring':>11}")
+    for size in args.sizes:
+        user = create_user(f"search{size}")
+        populate(user, size, vocabulary, rng)
+
+        for name, query in queries.items():
+            indexed = measure(lambda: search_flashcards(user, query, page_size=args.page_size))
+            deep = measure(lambda: search_flashcards(user, query, page=50, page_size=args.page_size))
+            substring = measure(
+                lambda: _search_like(user, parse_query(query), None, limit=args.page_size + 1, offset=0), repeat=3
+            )
+            print(f"{size:>8} {name:<10} {indexed:>8.2f}ms {deep:>8.2f}ms {substring:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
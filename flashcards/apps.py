@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FlashcardsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "flashcards"
+
+    def ready(self):
+        # Connects the signal receivers invalidating the cached FSRS parameters
+        from . import scheduler_cache  # noqa: F401
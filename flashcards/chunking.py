@@ -0,0 +1,127 @@
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Chunked (map-reduce) generation ---
+#
+# Long texts are split into overlapping sections that fit comfortably in one prompt. Every section is sent to the
+# AI service as its own request (concurrently, up to a limit) and the returned flashcards are merged round-robin,
+# so the result covers the whole document, and deduplicated by their question. If some sections fail, the cards of
+# the others are still returned together with the errors; such partial results are not cached.
+
+# Rough size of a token in characters; close enough for Gemini on English text and avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"\S+\s*")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_into_chunks(text, max_tokens, overlap_tokens=0):
+    """
+    Splits text into sections of at most max_tokens (estimated) tokens, without breaking words.
+    Consecutive sections share about overlap_tokens tokens, so content at a boundary appears in full in one of them.
+
+    :return: List of sections; a single section if the text fits into max_tokens.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    words = _WORD.findall(text)
+    sizes = [estimate_tokens(word) for word in words]
+
+    chunks = []
+    start = 0
+    while start < len(words):
+        end, tokens = start, 0
+        # A word larger than max_tokens still forms a section of its own
+        while end < len(words) and (end == start or tokens + sizes[end] <= max_tokens):
+            tokens += sizes[end]
+            end += 1
+        chunks.append("".join(words[start:end]).strip())
+        if end == len(words):
+            break
+
+        # Step back over the overlap, but always move forward
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + sizes[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += sizes[next_start]
+        start = next_start
+
+    return chunks
+
+
+def merge_flashcards(results, num_flashcards):
+    """
+    Merges the flashcards generated for several sections.
+
+    Cards are taken round-robin from the sections, skipping questions that were already taken (compared without
+    case, punctuation and extra whitespace), until num_flashcards cards are collected.
+    """
+    merged = []
+    seen = set()
+    for rank in range(max((len(cards) for cards in results), default=0)):
+        for cards in results:
+            if rank >= len(cards) or not isinstance(cards[rank], dict):
+                continue
+            key = _normalize_question(cards[rank].get("front"))
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(cards[rank])
+    return merged[:num_flashcards]
+
+
+def generate_in_chunks(text, num_flashcards, generate, max_tokens, overlap_tokens=0, max_concurrency=4):
+    """
+    Generates flashcards for a text that may be too long for one request.
+
+    :param text: The text the flashcards are generated from.
+    :param num_flashcards: Number of flashcards to return.
+    :param generate: Function (text, num_flashcards) -> list of flashcard dictionaries, called once per section.
+    :param max_tokens: Maximum estimated tokens per section.
+    :param overlap_tokens: Estimated tokens shared by consecutive sections.
+    :param max_concurrency: Maximum number of concurrent generate calls.
+    :return: Tuple (flashcards, errors): at most num_flashcards flashcard dictionaries and the errors of the
+             sections that failed. The flashcards of a partial result miss the content of the failed sections.
+    :raises Exception: The error of the first section if every section failed.
+    """
+    chunks = split_into_chunks(text, max_tokens, overlap_tokens)
+    if len(chunks) == 1:
+        return generate(text, num_flashcards), []
+
+    if len(chunks) > num_flashcards > 0:
+        # More sections than cards: use evenly spaced sections instead of calling the service for every one
+        chunks = [chunks[i * len(chunks) // num_flashcards] for i in range(num_flashcards)]
+
+    # Every section is asked for its share of the cards plus one, as duplicates are dropped when merging
+    per_chunk = math.ceil(num_flashcards / len(chunks)) + 1
+    logger.info(f"Generating {num_flashcards} flashcard(s) from {len(chunks)} sections")
+
+    def generate_chunk(chunk):
+        try:
+            return generate(chunk, per_chunk), None
+        except Exception as e:
+            return [], e
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as executor:
+        outcomes = list(executor.map(generate_chunk, chunks))
+
+    errors = [error for _, error in outcomes if error is not None]
+    if len(errors) == len(chunks):
+        raise errors[0]
+    for error in errors:
+        logger.warning(f"Generation of a section failed, continuing without it: {error}")
+
+    return merge_flashcards([cards for cards, _ in outcomes if isinstance(cards, list)], num_flashcards), errors
+
+
+def _normalize_question(question):
+    if not isinstance(question, str):
+        return None
+    return " ".join(re.sub(r"[^\w\s]", "", question.casefold()).split())
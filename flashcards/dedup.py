@@ -0,0 +1,318 @@
+import re
+import unicodedata
+import zlib
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from .models import Flashcard
+
+# --- Near-duplicate detection ---
+#
+# Cards are compared by the Jaccard similarity of the character shingles (SHINGLE_SIZE-byte substrings) of their
+# normalized front and back, estimated with MinHash signatures of NUM_PERMUTATIONS hash functions. Locality-sensitive
+# hashing splits the signatures into BANDS bands; only cards sharing a band are compared, so checking a card costs
+# BANDS binary searches per sorted run of the index (O(log N) runs) instead of a comparison with every card of the
+# set. With 16 bands of 4 rows, pairs with a similarity of 0.8 become candidates with a probability above 99.9%,
+# pairs below 0.3 almost never.
+#
+# Signatures are computed with numpy for a batch of cards at a time.
+#
+# Cards whose numbers differ ("What is 2 + 2?" and "What is 2 + 3?") are never duplicates, however similar their
+# text is.
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+DEFAULT_THRESHOLD = 0.8
+
+# Cards whose signatures are computed at once; bounds the (NUM_PERMUTATIONS x shingles) hash matrix
+SIGNATURE_BATCH_SIZE = 500
+
+# Most recent cards compared per band key. Templated cards ("Question 1", "Question 2", ...) share band keys with
+# thousands of cards that are no duplicates; true duplicates share most bands, so capping the candidates keeps the
+# cost per card constant while they are still found.
+MAX_BUCKET_CANDIDATES = 16
+
+# Multiply-shift hash functions (a * x + b) >> 32 with odd a, and the multipliers folding a band into one key.
+# Seeded, so signatures are comparable between processes.
+_rng = np.random.default_rng(20240611)
+_HASH_A = _rng.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)[:, None] * np.uint64(2) + np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, ROWS_PER_BAND, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_BAND_SALTS = _rng.integers(0, 2 ** 63, BANDS, dtype=np.uint64)
+
+_SHINGLE_WEIGHTS = np.array([1 << (8 * i) for i in range(SHINGLE_SIZE)], dtype=np.uint64)
+
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBER = re.compile(r"\d+")
+
+
+def normalize(text):
+    """ Lowercases the text and removes accents, punctuation and repeated whitespace. """
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def card_text(front, back):
+    """ Returns the normalized text a card is fingerprinted by. """
+    return f"{normalize(front)} | {normalize(back)}"
+
+
+def number_keys(texts):
+    """ Returns a checksum of the numbers in each normalized text, as an array of dtype uint32. """
+    return np.array([zlib.crc32(" ".join(_NUMBER.findall(text)).encode()) for text in texts], dtype=np.uint32)
+
+
+def minhash_signatures(texts):
+    """
+    Computes the MinHash signatures of normalized texts (see card_text).
+
+    :return: Array of shape (len(texts), NUM_PERMUTATIONS) with dtype uint32.
+    """
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint32)
+    for start in range(0, len(texts), SIGNATURE_BATCH_SIZE):
+        batch = texts[start:start + SIGNATURE_BATCH_SIZE]
+        signatures[start:start + len(batch)] = _batch_signatures(batch)
+    return signatures
+
+
+def _batch_signatures(texts):
+    # Shingles of all texts are taken from one byte buffer; texts are padded to at least SHINGLE_SIZE bytes,
+    # and the shingles crossing into the next text are dropped
+    encoded = [text.encode().ljust(SHINGLE_SIZE) for text in texts]
+    lengths = np.array([len(data) for data in encoded])
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    # Each shingle packed into an integer (exact, SHINGLE_SIZE <= 8)
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, SHINGLE_SIZE)
+    shingles = _mix(windows @ _SHINGLE_WEIGHTS)
+
+    ends = np.cumsum(lengths)
+    crossing = (ends[:-1, None] - np.arange(1, SHINGLE_SIZE)).ravel()
+    keep = np.ones(len(shingles), dtype=bool)
+    keep[crossing] = False
+    shingles = shingles[keep]
+    counts = lengths - SHINGLE_SIZE + 1
+
+    hashes = (_HASH_A * shingles[None, :] + _HASH_B) >> np.uint64(32)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return np.minimum.reduceat(hashes, offsets, axis=1).T.astype(np.uint32)
+
+
+def _mix(values):
+    # 64-bit finalizer of MurmurHash3, so that similar shingles do not get correlated hashes
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xFF51AFD7ED558CCD)
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xC4CEB9FE1A85EC53)
+    return values ^ (values >> np.uint64(33))
+
+
+def _band_keys(signatures):
+    # One key per band, salted with the band so that the keys of all bands can share one sorted array
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    return (bands * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64) + _BAND_SALTS
+
+
+class DuplicateIndex:
+    """
+    LSH index of card signatures. Cards are identified by a key of the caller's choice (e.g. the flashcard id).
+
+    The band keys of the indexed cards are kept in sorted runs and looked up with binary searches for a whole batch
+    of cards at a time, which takes about 0.5 kB per indexed card. Every inserted batch forms a run; runs are merged
+    with the previous one while that is not larger (like the carries of a binary counter), so there are O(log N)
+    runs and every band key is sorted again O(log N) times instead of the whole array being copied per batch.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.keys = []
+        self._signatures = np.empty((1024, NUM_PERMUTATIONS), dtype=np.uint32)
+        self._number_keys = np.empty(1024, dtype=np.uint32)
+        # (band keys, positions) per run, sorted by key and, among equal keys, most recent card first
+        self._runs = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, cards):
+        """
+        Adds cards without checking them for duplicates.
+
+        :param cards: Iterable of (key, front, back) tuples.
+        """
+        for batch in _batches(cards):
+            texts = [card_text(front, back) for _, front, back in batch]
+            self._insert([key for key, _, _ in batch], minhash_signatures(texts), number_keys(texts))
+
+    def add_unique(self, cards):
+        """
+        Checks cards against the index (and the cards before them) and adds the ones that are not duplicates.
+
+        :param cards: Iterable of (key, front, back) tuples.
+        :return: List with, per card, the key of the indexed card it duplicates or None if it was added.
+        """
+        duplicates = []
+        for batch in _batches(cards):
+            texts = [card_text(front, back) for _, front, back in batch]
+            signatures, numbers = minhash_signatures(texts), number_keys(texts)
+            band_keys = _band_keys(signatures)
+            indexed = self._find_indexed(signatures, numbers, band_keys)
+            earlier = self._find_in_batch(signatures, numbers, band_keys)
+
+            # Cards are resolved in order, so a card only duplicates an earlier card of the batch that was kept
+            batch_duplicates = []
+            for row, (key, _, _) in enumerate(batch):
+                if row in indexed:
+                    batch_duplicates.append(self.keys[indexed[row]])
+                    continue
+                kept = [(similarity, other) for similarity, other in earlier.get(row, ())
+                        if batch_duplicates[other] is None]
+                batch_duplicates.append(batch[max(kept)[1]][0] if kept else None)
+
+            new = [row for row, duplicate in enumerate(batch_duplicates) if duplicate is None]
+            self._insert([batch[row][0] for row in new], signatures[new], numbers[new])
+            duplicates += batch_duplicates
+        return duplicates
+
+    def _find_indexed(self, signatures, numbers, band_keys):
+        """ Returns {row: position} with the most similar indexed duplicate of each row that has one. """
+        flat = band_keys.ravel()
+        slots, positions = [], []
+        for run_keys, run_positions in self._runs:
+            left = np.searchsorted(run_keys, flat, side="left")
+            counts = np.minimum(np.searchsorted(run_keys, flat, side="right") - left, MAX_BUCKET_CANDIDATES)
+            if not counts.any():
+                continue
+            # Expand the matching ranges of the run into (band key slot, position) candidate pairs
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            slots.append(np.repeat(np.arange(len(flat)), counts))
+            positions.append(run_positions[np.repeat(left, counts) + within])
+        if not slots:
+            return {}
+        slots, positions = np.concatenate(slots), np.concatenate(positions)
+
+        if len(self._runs) > 1:
+            # Keep the MAX_BUCKET_CANDIDATES most recent candidates of every band key over all runs
+            order = np.lexsort((-positions, slots))
+            slots, positions = slots[order], positions[order]
+            rank = np.arange(len(slots)) - np.searchsorted(slots, slots, side="left")
+            slots, positions = slots[rank < MAX_BUCKET_CANDIDATES], positions[rank < MAX_BUCKET_CANDIDATES]
+        rows, positions = _unique_pairs(slots // BANDS, positions, len(self.keys))
+
+        similarities = self._similarities(signatures[rows], self._signatures[positions],
+                                          numbers[rows] != self._number_keys[positions])
+        matches = similarities >= self.threshold
+        rows, positions, similarities = rows[matches], positions[matches], similarities[matches]
+        found = {}
+        for row, position, similarity in zip(rows.tolist(), positions.tolist(), similarities.tolist()):
+            if similarity > found.get(row, (0, None))[0]:
+                found[row] = (similarity, position)
+        return {row: position for row, (_, position) in found.items()}
+
+    def _find_in_batch(self, signatures, numbers, band_keys):
+        """ Returns {row: [(similarity, earlier_row)]} with the duplicates among the earlier rows of the batch. """
+        flat = band_keys.ravel()
+        order = np.argsort(flat, kind="stable")
+        sorted_keys = flat[order]
+        sorted_rows = order // BANDS
+
+        # Pair every row with the (up to MAX_BUCKET_CANDIDATES) earlier rows sharing a band key with it
+        later, earlier = [], []
+        for distance in range(1, min(MAX_BUCKET_CANDIDATES, len(flat) - 1) + 1):
+            same = sorted_keys[distance:] == sorted_keys[:-distance]
+            if not same.any():
+                break
+            later.append(sorted_rows[distance:][same])
+            earlier.append(sorted_rows[:-distance][same])
+        if not later:
+            return {}
+        later, earlier = _unique_pairs(np.concatenate(later), np.concatenate(earlier), len(signatures))
+
+        similarities = self._similarities(signatures[later], signatures[earlier], numbers[later] != numbers[earlier])
+        matches = similarities >= self.threshold
+        found = {}
+        for row, other, similarity in zip(later[matches].tolist(), earlier[matches].tolist(),
+                                          similarities[matches].tolist()):
+            found.setdefault(row, []).append((similarity, other))
+        return found
+
+    @staticmethod
+    def _similarities(signatures, other_signatures, different_numbers):
+        similarities = (signatures == other_signatures).mean(axis=1)
+        similarities[different_numbers] = 0
+        return similarities
+
+    def _insert(self, keys, signatures, numbers):
+        if not keys:
+            return
+        start = len(self.keys)
+        while start + len(keys) > len(self._signatures):
+            self._signatures = np.concatenate((self._signatures, np.empty_like(self._signatures)))
+            self._number_keys = np.concatenate((self._number_keys, np.empty_like(self._number_keys)))
+        self._signatures[start:start + len(keys)] = signatures
+        self._number_keys[start:start + len(keys)] = numbers
+        self.keys += keys
+
+        band_keys = _band_keys(signatures).ravel()
+        positions = start + np.arange(len(keys)).repeat(BANDS)
+        while self._runs and len(self._runs[-1][0]) <= len(band_keys):
+            run_keys, run_positions = self._runs.pop()
+            band_keys = np.concatenate((run_keys, band_keys))
+            positions = np.concatenate((run_positions, positions))
+        order = np.lexsort((-positions, band_keys))
+        self._runs.append((band_keys[order], positions[order]))
+
+
+def _unique_pairs(rows, others, size):
+    pairs = np.unique(rows.astype(np.int64) * size + others)
+    return pairs // size, pairs % size
+
+
+def _batches(cards):
+    cards = iter(cards)
+    while batch := list(islice(cards, SIGNATURE_BATCH_SIZE)):
+        yield batch
+
+
+def get_duplicate_index(flashcard_set=None, threshold=None):
+    """
+    Returns a DuplicateIndex holding the cards of a set, keyed by flashcard id, for the pre-insert filters of
+    the AI generation and import pipelines.
+
+    :param flashcard_set: The set whose cards are indexed (None for an empty index).
+    :param threshold: Similarity from which cards count as duplicates (default: settings.DUPLICATE_THRESHOLD).
+    """
+    index = DuplicateIndex(settings.DUPLICATE_THRESHOLD if threshold is None else threshold)
+    if flashcard_set is not None and flashcard_set.pk is not None:
+        index.add(
+            Flashcard.objects.filter(flashcard_set=flashcard_set).order_by("id")
+            .values_list("id", "front", "back").iterator(chunk_size=SIGNATURE_BATCH_SIZE)
+        )
+    return index
+
+
+def find_duplicates(flashcards, threshold=DEFAULT_THRESHOLD):
+    """
+    Finds the near-duplicates among flashcards; of each group of near-duplicates the oldest card is kept.
+
+    :param flashcards: QuerySet of flashcards.
+    :return: List of (duplicate_id, original_id) tuples.
+    """
+    ids = []
+    rows = flashcards.order_by("id").values_list("id", "front", "back")
+
+    def read_rows():
+        for row in rows.iterator(chunk_size=SIGNATURE_BATCH_SIZE):
+            ids.append(row[0])
+            yield row
+
+    duplicates = DuplicateIndex(threshold).add_unique(read_rows())
+    return [(flashcard_id, original_id) for flashcard_id, original_id in zip(ids, duplicates)
+            if original_id is not None]
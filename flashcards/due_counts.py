@@ -0,0 +1,138 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import DailyDueCount, Review
+
+# --- Due counts ---
+#
+# DailyDueCount materializes the number of cards due per (user, set, day), so due counts are read in O(sets) or
+# O(days) rows instead of scanning the reviews. The counts are changed with F() increments whenever a review's
+# next_review_date changes (submit_review, rescheduling, imports and card deletions, see due_count_changes and
+# apply_due_count_changes); deleting a set deletes its counts. rebuild_due_counts (the rebuild_due_counts command)
+# recounts them from the reviews if they ever drift.
+#
+# Days are in the current time zone. A card due later today counts as due today, so the counts of today include
+# cards whose learning step has not passed yet. Pages linking to a review session therefore use
+# get_due_counts_by_set, which counts today's cards exactly like the due queue.
+
+# Days of the due forecast on the dashboard
+FORECAST_DAYS = 7
+
+
+def due_day(due_date):
+    """ Returns the day a review due at due_date is counted for. """
+    return timezone.localdate(due_date)
+
+
+def due_count_changes(user_id, flashcard_set_id, previous_due_date, next_due_date):
+    """
+    Returns the changes of the due counts when a review moves from one due date to another.
+
+    :param previous_due_date: Due date the review was counted for, None for a new review.
+    :param next_due_date: New due date, None for a deleted review.
+    :return: Counter {(user_id, flashcard_set_id, date): delta}; collect them with Counter.update
+             (+ drops negative counts).
+    """
+    changes = Counter()
+    if previous_due_date is not None:
+        changes[(user_id, flashcard_set_id, due_day(previous_due_date))] -= 1
+    if next_due_date is not None:
+        changes[(user_id, flashcard_set_id, due_day(next_due_date))] += 1
+    return changes
+
+
+def apply_due_count_changes(changes):
+    """
+    Adds the changes {(user_id, flashcard_set_id, date): delta} to the due counts with F() increments, creating
+    missing rows. Counts never drop below zero.
+    """
+    for (user_id, flashcard_set_id, date), delta in changes.items():
+        if not delta:
+            continue
+        due_counts = DailyDueCount.objects.filter(user_id=user_id, flashcard_set_id=flashcard_set_id, date=date)
+        if not due_counts.update(due_count=Greatest(F("due_count") + delta, 0)) and delta > 0:
+            DailyDueCount.objects.bulk_create(
+                [DailyDueCount(user_id=user_id, flashcard_set_id=flashcard_set_id, date=date)], ignore_conflicts=True
+            )
+            due_counts.update(due_count=F("due_count") + delta)
+
+
+def load_due_counts(user_id, start=None, end=None):
+    """ Returns the user's due counts per date (all sets) between start and end (inclusive, unbounded if None). """
+    due_counts = DailyDueCount.objects.filter(user_id=user_id, due_count__gt=0)
+    if start is not None:
+        due_counts = due_counts.filter(date__gte=start)
+    if end is not None:
+        due_counts = due_counts.filter(date__lte=end)
+    return dict(due_counts.values("date").annotate(total=Sum("due_count")).values_list("date", "total").order_by())
+
+
+def get_due_counts_by_set(user, now=None):
+    """
+    Returns the number of the user's cards due now per set, the cards a review session would show.
+
+    Overdue days are read from the due counts. Today's count also holds the cards due later today, so today's due
+    reviews are counted instead, with one query bounded to [start of today, now] on the (user, next_review_date)
+    index.
+
+    :param now: Cards due at or before this time are counted (defaults to the current time).
+    :return: Dictionary {flashcard_set_id: due_count} of the sets with due cards.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    start_of_today = timezone.make_aware(datetime.combine(today, time.min))
+
+    due_counts = Counter(dict(
+        DailyDueCount.objects.filter(user=user, date__lt=today, due_count__gt=0)
+        .values("flashcard_set").annotate(total=Sum("due_count")).values_list("flashcard_set", "total").order_by()
+    ))
+    due_counts.update(dict(
+        Review.objects.filter(user=user, next_review_date__gte=start_of_today, next_review_date__lte=now)
+        .values("flashcard__flashcard_set").annotate(total=Count("id"))
+        .values_list("flashcard__flashcard_set", "total").order_by()
+    ))
+    return dict(due_counts)
+
+
+def get_due_forecast(user, days=FORECAST_DAYS):
+    """
+    Returns the number of the user's cards due today (including overdue cards) and on each of the next days.
+
+    :return: List of days + 1 counts, starting with today.
+    """
+    today = timezone.localdate()
+    due_counts = load_due_counts(user.id, end=today + timedelta(days=days))
+    forecast = [0] * (days + 1)
+    for date, due_count in due_counts.items():
+        forecast[max(0, (date - today).days)] += due_count
+    return forecast
+
+
+def rebuild_due_counts(user=None, batch_size=1000):
+    """
+    Recounts the due counts of a user (all users if None) from their reviews, in one transaction.
+
+    :return: Number of DailyDueCount rows written.
+    """
+    reviews = Review.objects.all()
+    due_counts = DailyDueCount.objects.all()
+    if user is not None:
+        reviews = reviews.filter(user=user)
+        due_counts = due_counts.filter(user=user)
+
+    counts = reviews.values(
+        "user_id", "flashcard__flashcard_set_id", date=TruncDate("next_review_date")
+    ).annotate(due_count=Count("id")).order_by()
+
+    with transaction.atomic():
+        due_counts.delete()
+        return len(DailyDueCount.objects.bulk_create([
+            DailyDueCount(user_id=row["user_id"], flashcard_set_id=row["flashcard__flashcard_set_id"],
+                          date=row["date"], due_count=row["due_count"])
+            for row in counts.iterator(chunk_size=10_000)
+        ], batch_size=batch_size))
@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Review
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(next_review_date, flashcard_id):
+    """ Encodes the position after a due card into an opaque, URL-safe cursor. """
+    raw = f"{next_review_date.isoformat()}|{flashcard_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by encode_cursor.
+
+    :return: Tuple (next_review_date, flashcard_id)
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        next_review_date, flashcard_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(next_review_date), int(flashcard_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def due_reviews(user, now=None, flashcard_set=None, after=None):
+    """
+    Returns the user's due reviews ordered by (next_review_date, flashcard_id).
+
+    The ordering matches the (user, next_review_date, flashcard) index, so the database walks the index from
+    the cursor position instead of sorting the whole due set.
+
+    :param user: The user whose due cards are returned.
+    :param now: Cards due at or before this time are returned (defaults to the current time).
+    :param flashcard_set: Restrict the queue to one set.
+    :param after: Tuple (next_review_date, flashcard_id); only cards after this position are returned.
+    """
+    reviews = Review.objects.filter(user=user, next_review_date__lte=now or timezone.now())
+
+    if flashcard_set is not None:
+        reviews = reviews.filter(flashcard__flashcard_set=flashcard_set)
+
+    if after is not None:
+        next_review_date, flashcard_id = after
+        # The >= bound lets the database seek into the index; the OR only decides ties on the cursor date
+        reviews = reviews.filter(
+            Q(next_review_date__gt=next_review_date) | Q(flashcard_id__gt=flashcard_id),
+            next_review_date__gte=next_review_date,
+        )
+
+    return reviews.order_by("next_review_date", "flashcard_id")
+
+
+def get_due_page(user, cursor=None, limit=DEFAULT_PAGE_SIZE, flashcard_set=None, now=None):
+    """
+    Returns one page of the user's due cards.
+
+    :param cursor: Cursor returned with the previous page (None for the first page).
+    :param limit: Page size, capped at MAX_PAGE_SIZE.
+    :return: Tuple (reviews, next_cursor) where next_cursor is None on the last page.
+    :raises ValueError: If the cursor is malformed.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    reviews = list(due_reviews(user, now, flashcard_set, after).select_related("flashcard")[:limit + 1])
+
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = encode_cursor(reviews[-1].next_review_date, reviews[-1].flashcard_id)
+
+    return reviews, next_cursor
@@ -0,0 +1,91 @@
+import csv
+import json
+
+from django.db.models import F, FilteredRelation, Q
+
+from .models import Flashcard
+
+# --- Flashcard export ---
+#
+# Exports stream one row per flashcard with the owner's review state of the card (empty for cards that were never
+# reviewed). Rows are read with a server-side iterator and written line by line, so memory use does not depend on the
+# number of cards. The CSV columns and NDJSON keys are the ones the importers read (see importers.py); the set title
+# and description of every card let an import restore the sets.
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+REVIEW_FIELDS = ("state", "stability", "difficulty", "repetitions", "lapses", "last_review_date", "next_review_date")
+
+CSV_COLUMNS = ("set", "description", "front", "back") + REVIEW_FIELDS
+
+
+def export_rows(user, flashcard_set=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the flashcards of the user's sets, ordered by set, as dictionaries with the set title and description,
+    front, back and the user's review of the card ({field: value} or None).
+
+    :param flashcard_set: Only export this set.
+    """
+    flashcards = Flashcard.objects.filter(flashcard_set__created_by=user)
+    if flashcard_set is not None:
+        flashcards = flashcards.filter(flashcard_set=flashcard_set)
+
+    rows = flashcards.annotate(
+        user_review=FilteredRelation("review", condition=Q(review__user=user)),
+        set_title=F("flashcard_set__title"),
+        set_description=F("flashcard_set__description"),
+    ).order_by("flashcard_set_id", "id").values_list(
+        "set_title", "set_description", "front", "back", *(f"user_review__{field}" for field in REVIEW_FIELDS)
+    )
+
+    for set_title, set_description, front, back, *review in rows.iterator(chunk_size=chunk_size):
+        yield {
+            "set": set_title,
+            "description": set_description,
+            "front": front,
+            "back": back,
+            # next_review_date is required, so a review exists exactly when it is set
+            "review": dict(zip(REVIEW_FIELDS, review)) if review[-1] is not None else None,
+        }
+
+
+def export_csv(rows, extra_columns=()):
+    """
+    Yields the rows as CSV lines, starting with the header.
+
+    :param extra_columns: Names of additional keys of the rows written as leading columns (e.g. "user").
+    """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    yield writer.writerow(list(extra_columns) + list(CSV_COLUMNS))
+
+    for row in rows:
+        review = row["review"] or {}
+        values = [row[column] for column in extra_columns] + [row["set"], row["description"], row["front"], row["back"]]
+        values += [_format_value(review.get(field)) for field in REVIEW_FIELDS]
+        yield writer.writerow(values)
+
+
+def export_ndjson(rows):
+    """ Yields the rows as newline-delimited JSON objects. """
+    for row in rows:
+        yield json.dumps(row, default=_format_value, ensure_ascii=False) + "\n"
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class _LineBuffer:
+    """ File-like object for csv.writer that returns the written line instead of storing it. """
+
+    def write(self, value):
+        return value
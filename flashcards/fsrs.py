@@ -2,6 +2,8 @@ import math
 from datetime import datetime
 from typing import Tuple, Dict, Optional, List
 
+import numpy as np
+
 from flashcards.models import ReviewState
 
 
@@ -47,6 +49,15 @@ class FSRS:
     # Define the interval (in days) at which a card graduates from Learning/Relearning to Review
     DEFAULT_GRADUATING_INTERVAL_DAYS = 6.0
 
+    # Integer codes used for the state arrays of the batch API
+    STATE_CODES = {
+        ReviewState.NEW: 0,
+        ReviewState.LEARNING: 1,
+        ReviewState.REVIEW: 2,
+        ReviewState.RELEARNING: 3,
+    }
+    STATE_VALUES = np.array([state.value for state in STATE_CODES])
+
     # Learning steps (in minutes) - Used when state is LEARNING or RELEARNING
     # For simplicity, we'll graduate directly to REVIEW state after the first correct answer
     # in LEARNING/RELEARNING based on calculated interval
@@ -60,6 +71,14 @@ class FSRS:
         if len(self.w) < 17:
             raise ValueError(f"FSRS requires at least 17 parameters (weights). Found {len(self.w)}.")
 
+        # Terms of the formulas that only depend on the parameters, computed once instead of on every review.
+        # Instances are cached and shared per user (see scheduler_cache.py), so w must not be changed afterwards.
+        self._success_factor = math.exp(self.w[8])
+        self._interval_factor = 9 * ((1 / self.request_retention) - 1)
+        grades = np.arange(1, 5)
+        self._initial_s = np.asarray(self.w[:4], dtype=np.float64)
+        self._initial_d = np.clip(self.w[4] - self.w[5] * (grades - 3), 1.0, 10.0)
+
     def update_state(
             self,
             current_state: str,  # From ReviewState choices ('NEW', 'LRN', 'REV', 'REL')
@@ -222,7 +241,7 @@ class FSRS:
 
         # Core stability update formula (common FSRS-4.5 style)
         # S' = S * (1 + exp(w8) * (11 - D) * S^(-w9) * (exp(1 - R) - 1))
-        factor = math.exp(self.w[8]) * (11 - current_d) * (max(0.1, current_s) ** -self.w[9])  # Ensure S isn't zero
+        factor = self._success_factor * (11 - current_d) * (max(0.1, current_s) ** -self.w[9])  # Ensure S isn't zero
         stability_increase = max(0, factor * (math.exp(1 - retrievability) - 1))
 
         # S' = S * (1 + stability_increase)
@@ -247,6 +266,147 @@ class FSRS:
 
         # Solve R = (1 + I / (9 * S))^-1 for I when R = request_retention
         # I = 9 * S * ((1/request_retention) - 1)
-        interval = 9 * stability * ((1 / self.request_retention) - 1)
+        interval = stability * self._interval_factor
 
         return max(1, interval)  # Ensure interval is at least 1 day
+
+    # --- Batch (vectorized) API ---
+
+    def update_state_batch(
+            self,
+            states: np.ndarray,
+            stability: np.ndarray,
+            difficulty: np.ndarray,
+            elapsed_days: np.ndarray,
+            app_ratings: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """
+        Vectorized version of update_state for many cards at once. Follows the exact same
+        transitions and formulas, so every element matches the scalar result.
+
+        Args:
+            states: Current states, either ReviewState values ('NEW', 'LRN', 'REV', 'REL')
+                    or their integer codes from STATE_CODES.
+            stability: Current stabilities (S).
+            difficulty: Current difficulties (D).
+            elapsed_days: Days since the last review, NaN where there was none
+                          (such cards are treated as new, like update_state does).
+            app_ratings: User's performance ratings from (1-4).
+
+        Returns:
+            A dictionary of arrays with the same keys as update_state. new_state uses the
+            same representation (values or codes) as the given states.
+        """
+        states = np.asarray(states)
+        return_codes = np.issubdtype(states.dtype, np.integer)
+        codes = states if return_codes else self._state_codes(states)
+        if codes.size and (codes.min() < 0 or codes.max() >= len(self.STATE_CODES)):
+            raise ValueError("Unknown current state in batch")
+
+        grade = np.asarray(app_ratings, dtype=np.int64)
+        if grade.size and (grade.min() < 1 or grade.max() > 4):
+            raise ValueError("Ratings must be between 1 and 4")
+
+        current_s = np.asarray(stability, dtype=np.float64)
+        current_d = np.asarray(difficulty, dtype=np.float64)
+        elapsed_days = np.asarray(elapsed_days, dtype=np.float64)
+        new_code, learning_code, review_code, relearning_code = self.STATE_CODES.values()
+
+        # Learning/review cards without a last review date are treated as new
+        is_new = (codes == new_code) | np.isnan(elapsed_days)
+        again = grade == 1
+
+        # First review
+        initial_s, initial_d = self._calc_initial_sd_array(grade)
+
+        # Later reviews: update difficulty first, then stability
+        updated_d = np.clip(self._calc_new_difficulty_array(current_d, grade), 1.0, 10.0)
+        lapse_s = self._calc_stability_after_lapse_array(current_s, updated_d)
+        # Also computed for new cards (NaN without elapsed days), whose result is replaced by the initial values
+        retrievability = self._calc_retrievability_array(current_s, np.maximum(0, elapsed_days))
+        success_s = self._calc_stability_after_success_array(current_s, updated_d, retrievability)
+
+        new_s = np.where(is_new, initial_s, np.where(again, lapse_s, success_s))
+        new_d = np.where(is_new, initial_d, updated_d)
+
+        interval = np.where(
+            again,
+            np.where(is_new, 1 / (24 * 60), 10 / (24 * 60)),  # 1 minute for new, 10 minutes for relearning
+            self._calc_interval_array(new_s)
+        )
+        graduates = interval >= self.graduating_interval_days
+        new_codes = np.where(
+            again,
+            np.where(is_new, learning_code, relearning_code),
+            np.where(graduates | (~is_new & (codes == review_code)), review_code, learning_code)
+        )
+
+        # Ensure stability is positive
+        new_s = np.maximum(0.1, new_s)
+
+        # Interval rounding and minimums, same as update_state
+        is_review = new_codes == review_code
+        interval = np.where(
+            is_review,
+            np.maximum(1, np.round(interval)),
+            np.maximum(interval, 1 / (24 * 60))
+        )
+
+        return {
+            "new_s": new_s,
+            "new_d": new_d,
+            "new_state": new_codes if return_codes else self.STATE_VALUES[new_codes],
+            "interval": interval,  # In days
+        }
+
+    def review_intervals_batch(self, stability: np.ndarray) -> np.ndarray:
+        """
+        Returns the intervals (in whole days) of cards in the REVIEW state with the given stabilities,
+        rounded like update_state does. Used to reschedule stored reviews after the parameters changed.
+        """
+        return np.maximum(1, np.round(self._calc_interval_array(np.asarray(stability, dtype=np.float64))))
+
+    def _state_codes(self, states: np.ndarray) -> np.ndarray:
+        """Converts an array of ReviewState values into integer codes (-1 for unknown states)."""
+        codes = np.full(states.shape, -1, dtype=np.int64)
+        for state, code in self.STATE_CODES.items():
+            codes[states == state.value] = code
+        return codes
+
+    def _calc_initial_sd_array(self, grade: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized _calc_initial_sd, looked up from the values precomputed per grade."""
+        return self._initial_s[grade - 1], self._initial_d[grade - 1]
+
+    def _calc_retrievability_array(self, stability: np.ndarray, elapsed_days: np.ndarray) -> np.ndarray:
+        """Vectorized _calc_retrievability, as 9S / (9S + t) to save a division."""
+        scaled = 9 * stability
+        with np.errstate(divide="ignore", invalid="ignore"):
+            retrievability = scaled / (scaled + elapsed_days)
+        return np.where(stability <= 0, 0.0, retrievability)
+
+    def _calc_new_difficulty_array(self, current_d: np.ndarray, grade: np.ndarray) -> np.ndarray:
+        """Vectorized _calc_new_difficulty."""
+        return current_d - self.w[6] * (grade - 3)
+
+    def _calc_stability_after_success_array(self, current_s: np.ndarray, current_d: np.ndarray,
+                                            retrievability: np.ndarray) -> np.ndarray:
+        """Vectorized _calc_stability_after_success."""
+        # Computed in place to avoid allocating a temporary array per operation
+        factor = np.maximum(0.1, current_s)
+        np.power(factor, -self.w[9], out=factor)
+        factor *= 11 - current_d
+        factor *= self._success_factor
+        stability_increase = np.expm1(1 - retrievability)
+        stability_increase *= factor
+        np.maximum(stability_increase, 0, out=stability_increase)
+        stability_increase += 1
+        return stability_increase * current_s
+
+    def _calc_stability_after_lapse_array(self, current_s: np.ndarray, current_d: np.ndarray) -> np.ndarray:
+        """Vectorized _calc_stability_after_lapse."""
+        return self.w[15] * np.maximum(1.0, current_d) ** (-self.w[16])
+
+    def _calc_interval_array(self, stability: np.ndarray) -> np.ndarray:
+        """Vectorized _calc_interval."""
+        # The factor is positive, so non-positive stabilities already get the minimum of 1 day
+        return np.maximum(1, stability * self._interval_factor)
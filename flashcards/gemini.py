@@ -0,0 +1,199 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Responses worth retrying: rate limiting and server-side errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """ Raised instead of calling the API while the circuit breaker is open. """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds until the breaker lets a trial call through
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service for a while instead of piling up requests that will time out.
+
+    After failure_threshold consecutive failed calls the circuit opens and calls fail immediately.
+    Once reset_timeout seconds have passed, a single trial call is let through (half-open): if it succeeds
+    the circuit closes again, otherwise it stays open for another reset_timeout.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """ :raises CircuitOpenError: If calls are not allowed right now. """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            open_for = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and open_for >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            # While half-open, the trial call decides; without an outcome the circuit reopens for reset_timeout
+            retry_after = self.reset_timeout - open_for if self.state == self.OPEN else self.reset_timeout
+            raise CircuitOpenError("Gemini API circuit breaker is open, not calling the service", retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Opening the Gemini API circuit breaker after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """
+    HTTP client for the Gemini API.
+
+    Requests share one pooled requests.Session, so connections (and their TLS sessions) are reused across calls.
+    Every request is bounded by connect/read timeouts. Connection errors, timeouts and RETRY_STATUSES responses
+    are retried up to max_retries times with jittered exponential backoff, and repeated failures open a circuit
+    breaker.
+    """
+
+    def __init__(self, connect_timeout=5.0, read_timeout=60.0, max_retries=3, backoff_base=0.5, backoff_max=10.0,
+                 pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            connect_timeout=settings.GEMINI_CONNECT_TIMEOUT,
+            read_timeout=settings.GEMINI_READ_TIMEOUT,
+            max_retries=settings.GEMINI_MAX_RETRIES,
+            pool_size=settings.GEMINI_POOL_SIZE,
+            failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.GEMINI_CIRCUIT_RESET_TIMEOUT,
+        )
+
+    def post(self, url, **kwargs):
+        """
+        Sends a POST request with retries.
+
+        :return: The successful response.
+        :raises requests.exceptions.RequestException: If the request failed after all retries (HTTPError for
+                error responses, CircuitOpenError if the circuit breaker is open).
+        """
+        self.breaker.before_call()
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except Exception:
+                # Not retried (e.g. a broken response body), but counted, so that a half-open trial is settled
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    # Other client errors mean that the service is up; they are not retried
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response
+                kind = "Client" if response.status_code < 500 else "Server"
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} {kind} Error: {response.reason}", response=response
+                )
+                retry_after = response.headers.get("Retry-After")
+
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff(attempt, retry_after)
+            logger.warning(f"Gemini API request failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise error
+
+    def backoff(self, attempt, retry_after=None):
+        """ Returns the delay before the next attempt: full jitter over an exponential window, or Retry-After. """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass  # HTTP dates are not worth supporting here
+        return min(delay, self.backoff_max)
+
+    def generate_content(self, payload):
+        """
+        Calls the Gemini generateContent endpoint.
+
+        :param payload: The request body (contents, generationConfig, ...).
+        :return: The decoded JSON response.
+        """
+        response = self.post(GEMINI_API_URL, json=payload, headers={"x-goog-api-key": GEMINI_API_KEY or ""})
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """ Returns the process-wide GeminiClient, created from the GEMINI_* settings on first use. """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient.from_settings()
+        return _client
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    """ Drops the shared client when a GEMINI_* setting changes (override_settings in tests). """
+    global _client
+    if setting.startswith("GEMINI_"):
+        with _client_lock:
+            if _client is not None:
+                _client.close()
+            _client = None
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+logger = logging.getLogger(__name__)
+
+# --- AI generation cache ---
+#
+# Generated flashcards are stored under a hash of everything that determines the AI output: the extracted text,
+# the prompt template and the generation parameters. Identical requests (e.g. a class uploading the same handout)
+# reuse the stored flashcards instead of calling the AI service again.
+#
+# The cache is the Django cache alias settings.GENERATION_CACHE_ALIAS, so the backend, TTL (TIMEOUT) and size
+# (MAX_ENTRIES, evicted least recently used first by the local-memory backend) are configured in CACHES.
+#
+# Hits and misses are counted in the default cache, where evictions of cached results do not reset them, and
+# logged every STATS_LOG_INTERVAL lookups.
+
+KEY_PREFIX = "flashcards:generation:"
+HITS_KEY = KEY_PREFIX + "stats:hits"
+MISSES_KEY = KEY_PREFIX + "stats:misses"
+
+STATS_LOG_INTERVAL = 100
+
+
+def get_generation_cache():
+    return caches[settings.GENERATION_CACHE_ALIAS]
+
+
+def generation_cache_key(text, prompt_template, **parameters):
+    """
+    Returns the cache key of a generation.
+
+    :param text: The text the flashcards are generated from.
+    :param prompt_template: The prompt template the text is inserted into.
+    :param parameters: Everything else that affects the output (number of flashcards, model, generation config).
+    """
+    content = json.dumps({"text": text, "prompt_template": prompt_template, **parameters}, sort_keys=True)
+    return KEY_PREFIX + hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_cached_flashcards(key, record_stats=True):
+    """
+    Returns the cached flashcards stored under key (None on a miss).
+
+    :param record_stats: Count the lookup in the hit/miss statistics.
+    """
+    flashcards = get_generation_cache().get(key)
+    if record_stats:
+        _increment(HITS_KEY if flashcards is not None else MISSES_KEY)
+        logger.debug(f"Generation cache {'hit' if flashcards is not None else 'miss'}: {key}")
+        stats = get_cache_stats()
+        if (stats["hits"] + stats["misses"]) % STATS_LOG_INTERVAL == 0:
+            logger.info(f"Generation cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+                        f"hit rate {stats['hit_rate']:.0%}")
+    return flashcards
+
+
+def cache_flashcards(key, flashcards):
+    """ Stores generated flashcards (a list of {"front", "back"} dictionaries) for the configured TTL. """
+    get_generation_cache().set(key, flashcards)
+
+
+def get_cache_stats():
+    """ :return: Dictionary with the number of hits and misses and the hit rate (None before the first lookup). """
+    counters = caches[DEFAULT_CACHE_ALIAS].get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+    return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None}
+
+
+def _increment(key):
+    # Counters never expire; incr is atomic on shared backends (Redis, Memcached)
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add and incr
+        cache.set(key, 1, timeout=None)
@@ -0,0 +1,366 @@
+import csv
+import html
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from contextlib import closing
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .dedup import get_duplicate_index
+from .models import Flashcard, FlashcardSet, Review, ReviewState
+from .services import register_flashcards_added, register_reviews_imported
+
+# --- Flashcard import ---
+#
+# Parsers yield one (front, back, review, deck) tuple per card, where review is a dictionary of Review fields or None
+# and deck the (title, description) of the set the card was exported from or None, and read their input as a stream:
+# CSV/TSV/NDJSON row by row, Anki packages through a cursor over the collection database.
+# import_cards writes the cards in batches, so memory use does not grow with the size of the deck. The cards go to
+# one given set, or to the sets named by their deck (ImportedSets), so an export of several sets is restored as it
+# was.
+
+IMPORT_FORMATS = ("csv", "tsv", "ndjson", "apkg")
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Number of rejected rows reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Header names recognized in CSV/TSV files
+COLUMN_ALIASES = {
+    "set": {"set", "deck"},
+    "description": {"description"},
+    "front": {"front", "question", "term"},
+    "back": {"back", "answer", "definition"},
+    "state": {"state"},
+    "stability": {"stability"},
+    "difficulty": {"difficulty"},
+    "repetitions": {"repetitions", "reps"},
+    "lapses": {"lapses"},
+    "last_review_date": {"last_review_date", "last_review"},
+    "next_review_date": {"next_review_date", "due"},
+}
+
+STATE_NAMES = {choice.label.lower(): choice.value for choice in ReviewState} | {
+    choice.value.lower(): choice.value for choice in ReviewState
+}
+
+_LINE_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+# Anki card types (cards.type)
+ANKI_STATES = {0: ReviewState.NEW, 1: ReviewState.LEARNING, 2: ReviewState.REVIEW, 3: ReviewState.RELEARNING}
+
+
+def detect_format(filename):
+    """ Returns the import format of a file from its extension (None if it is not supported). """
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    if extension == "txt":
+        return "tsv"
+    if extension == "jsonl":
+        return "ndjson"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def open_text(uploaded_file):
+    """ Wraps a binary upload in a text stream for parse_text. """
+    return io.TextIOWrapper(uploaded_file.file, encoding="utf-8-sig", newline="")
+
+
+def parse_text(stream, import_format):
+    """ Parses a text stream in one of the text formats (csv, tsv or ndjson). """
+    if import_format == "ndjson":
+        return parse_ndjson(stream)
+    return parse_delimited(stream, "\t" if import_format == "tsv" else ",")
+
+
+def parse_delimited(stream, delimiter=","):
+    """
+    Parses a CSV/TSV text stream.
+
+    If the first row names a front and a back column (e.g. "front,back" or "Question,Answer"), columns are matched
+    by name: the optional columns set and description name the set of the card, and state, stability, difficulty,
+    repetitions, lapses, last_review_date and next_review_date (ISO dates) describe the review state. Otherwise the
+    first two columns are front and back.
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    first_row = next(reader, None)
+    if first_row is None:
+        return
+
+    columns = _match_columns(first_row)
+    if columns is None:
+        columns = {"front": 0, "back": 1}
+        yield _delimited_card(first_row, columns)
+
+    for row in reader:
+        if any(value.strip() for value in row):
+            yield _delimited_card(row, columns)
+
+
+def parse_ndjson(stream):
+    """
+    Parses newline-delimited JSON as written by the NDJSON export: one object per line with "front", "back",
+    the optional "set" and "description" of its set and an optional "review" object holding the Review fields.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            card = json.loads(line)
+        except json.JSONDecodeError:
+            yield "", "", None, None  # Reported as a row without front by import_cards
+            continue
+        if not isinstance(card, dict):
+            yield "", "", None, None
+            continue
+        review = card.get("review")
+        yield (str(card.get("front") or ""), str(card.get("back") or ""),
+               _parse_review(review) if isinstance(review, dict) else None,
+               _deck(card.get("set"), card.get("description")))
+
+
+def parse_apkg(path):
+    """
+    Parses an Anki package (.apkg): a zip file holding the collection as an SQLite database.
+
+    One card is imported per note, from its first two fields and the scheduling of its first card. The FSRS
+    memory state (stability, difficulty) of the card is used when the collection has one; otherwise the stability is
+    taken from the card's interval. New cards are imported without review state.
+
+    :raises ValueError: If the package holds no collection that can be read.
+    """
+    with zipfile.ZipFile(path) as package, tempfile.TemporaryDirectory() as directory:
+        names = set(package.namelist())
+        if "collection.anki21" in names:
+            member = "collection.anki21"
+        elif "collection.anki2" in names:
+            member = "collection.anki2"
+        elif "collection.anki21b" in names:
+            raise ValueError("This Anki package is compressed. Export it with \"Support older Anki versions\".")
+        else:
+            raise ValueError("Not an Anki package: no collection found")
+
+        collection_path = os.path.join(directory, "collection.sqlite3")
+        with package.open(member) as source, open(collection_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+
+        with closing(sqlite3.connect(collection_path)) as connection:
+            created = datetime.fromtimestamp(connection.execute("SELECT crt FROM col").fetchone()[0], dt_timezone.utc)
+            has_memory_state = "data" in {row[1] for row in connection.execute("PRAGMA table_info(cards)")}
+            rows = connection.execute(f"""
+                SELECT notes.flds, cards.type, cards.due, cards.ivl, cards.reps, cards.lapses,
+                       {'cards.data' if has_memory_state else 'NULL'}
+                FROM cards JOIN notes ON notes.id = cards.nid
+                WHERE cards.ord = 0
+                ORDER BY cards.id
+            """)
+            for fields, card_type, due, interval, repetitions, lapses, data in rows:
+                fields = fields.split("\x1f")
+                front = _strip_html(fields[0])
+                back = _strip_html(fields[1]) if len(fields) > 1 else ""
+                yield front, back, _anki_review(created, card_type, due, interval, repetitions, lapses, data), None
+
+
+class ImportedSets:
+    """
+    The new sets of an import, created once they receive their first card: one per deck named by the cards (see
+    the parsers), and one with the default title and description for the cards without a deck.
+    """
+
+    def __init__(self, owner, default_title, default_description=""):
+        self.owner = owner
+        self.default = (default_title, default_description)
+        self.created = []
+        self._sets = {}
+
+    def get(self, deck):
+        """ Returns the set of the cards of a deck ((title, description) tuple, None for the default set). """
+        title, description = deck or self.default
+        title = title[:FlashcardSet._meta.get_field("title").max_length]
+        if title not in self._sets:
+            self._sets[title] = FlashcardSet.objects.create(
+                title=title,
+                description=description[:FlashcardSet._meta.get_field("description").max_length],
+                created_by=self.owner,
+            )
+            self.created.append(self._sets[title])
+        return self._sets[title]
+
+
+def import_cards(cards, flashcard_set, user=None, batch_size=DEFAULT_BATCH_SIZE, deduplicate=None):
+    """
+    Adds parsed cards to a set (or the sets of their decks), one batch (and transaction) at a time.
+
+    :param cards: Iterable of (front, back, review, deck) tuples from one of the parsers.
+    :param flashcard_set: The FlashcardSet all cards are added to, or ImportedSets to add the cards to the sets
+                          named by their deck.
+    :param user: Import the review state of the cards for this user (review states are ignored if None).
+    :param batch_size: Cards inserted per bulk_create.
+    :param deduplicate: Skip near-duplicates of the set's cards and of earlier rows (see dedup.py; default:
+                        settings.DUPLICATE_FILTER).
+    :return: Dictionary with the number of created cards and reviews, the number of skipped rows (of which
+             "duplicates" were near-duplicates), the errors of the first MAX_REPORTED_ERRORS skipped rows
+             ({"row": int, "message": str}) and the sets that received cards.
+    """
+    result = {"created": 0, "reviews": 0, "skipped": 0, "duplicates": 0, "errors": [], "sets": []}
+    max_lengths = {field: Flashcard._meta.get_field(field).max_length for field in ("front", "back")}
+    numbered = enumerate(cards, start=1)
+    if deduplicate is None:
+        deduplicate = settings.DUPLICATE_FILTER
+    # Duplicates are looked for within the set a card goes to
+    duplicate_indexes = {}
+
+    def skip(row, message):
+        result["skipped"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"row": row, "message": message})
+
+    while batch := list(islice(numbered, batch_size)):
+        valid_by_set = {}
+        for row, (front, back, review, deck) in batch:
+            error = _validate_card(front, back, max_lengths)
+            if error is not None:
+                skip(row, error)
+                continue
+            target = flashcard_set.get(deck) if isinstance(flashcard_set, ImportedSets) else flashcard_set
+            valid_by_set.setdefault(target, []).append((row, front.strip(), back.strip(), review))
+
+        if deduplicate:
+            for target, valid in valid_by_set.items():
+                if target.pk not in duplicate_indexes:
+                    duplicate_indexes[target.pk] = get_duplicate_index(target)
+                duplicates = duplicate_indexes[target.pk].add_unique(
+                    (f"row-{row}", front, back) for row, front, back, _ in valid
+                )
+                for (row, _, _, _), duplicate in zip(valid, duplicates):
+                    if duplicate is not None:
+                        result["duplicates"] += 1
+                        skip(row, "Near-duplicate of another card")
+                valid_by_set[target] = [card for card, duplicate in zip(valid, duplicates) if duplicate is None]
+
+        flashcards = [Flashcard(front=front, back=back, flashcard_set=target)
+                      for target, valid in valid_by_set.items() for _, front, back, _ in valid]
+        reviews = [review for valid in valid_by_set.values() for _, _, _, review in valid]
+
+        with transaction.atomic():
+            Flashcard.objects.bulk_create(flashcards)
+            for target, valid in valid_by_set.items():
+                register_flashcards_added(target, len(valid))
+
+            if user is not None:
+                imported_reviews = Review.objects.bulk_create([
+                    Review(user=user, flashcard=flashcard, **review)
+                    for flashcard, review in zip(flashcards, reviews) if review is not None
+                ])
+                reviews_by_set = {}
+                for review in imported_reviews:
+                    reviews_by_set.setdefault(review.flashcard.flashcard_set, []).append(review)
+                for target, target_reviews in reviews_by_set.items():
+                    register_reviews_imported(user, target, target_reviews)
+                result["reviews"] += len(imported_reviews)
+
+        result["created"] += len(flashcards)
+        result["sets"] += [target for target, valid in valid_by_set.items() if valid and target not in result["sets"]]
+
+    return result
+
+
+def _match_columns(row):
+    names = [value.strip().lower() for value in row]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                columns[field] = index
+                break
+    return columns if "front" in columns and "back" in columns else None
+
+
+def _delimited_card(row, columns):
+    values = {field: row[index].strip() for field, index in columns.items() if index < len(row)}
+    return (values.get("front", ""), values.get("back", ""), _parse_review(values),
+            _deck(values.get("set"), values.get("description")))
+
+
+def _deck(title, description):
+    """ Returns the (title, description) of the set named by a card, None if it names none. """
+    title = str(title or "").strip()
+    return (title, str(description or "").strip()) if title else None
+
+
+def _parse_review(values):
+    """ Builds the Review fields from the exported/imported text values (None if there is no review state). """
+    def value(field):
+        return str(values.get(field) or "").strip()
+
+    if not value("next_review_date") and not value("stability"):
+        return None
+    try:
+        return {
+            "state": STATE_NAMES.get(value("state").lower(), ReviewState.REVIEW),
+            "stability": float(value("stability") or 0),
+            "difficulty": float(value("difficulty") or 5),
+            # Imported cards count as reviewed (see update_stats_after_review)
+            "repetitions": max(int(value("repetitions") or 1), 1),
+            "lapses": int(value("lapses") or 0),
+            "last_review_date": _parse_date(value("last_review_date")),
+            "next_review_date": _parse_date(value("next_review_date")) or timezone.now(),
+        }
+    except ValueError:
+        return None  # Cards with a malformed review state are imported as new cards
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    date = datetime.fromisoformat(value)
+    return date if timezone.is_aware(date) else timezone.make_aware(date, dt_timezone.utc)
+
+
+def _anki_review(created, card_type, due, interval, repetitions, lapses, data):
+    state = ANKI_STATES.get(card_type, ReviewState.NEW)
+    if state == ReviewState.NEW:
+        return None
+
+    if state == ReviewState.REVIEW:
+        next_review_date = created + timedelta(days=due)
+    elif due > 1_000_000_000:
+        next_review_date = datetime.fromtimestamp(due, dt_timezone.utc)  # Learning steps are due at a timestamp
+    else:
+        next_review_date = created + timedelta(days=due)
+
+    memory_state = json.loads(data) if data else {}
+    stability = memory_state.get("s", max(interval, 0))
+    return {
+        "state": state,
+        "stability": stability,
+        "difficulty": memory_state.get("d", 5.0),
+        "repetitions": max(repetitions, 1),
+        "lapses": lapses,
+        "last_review_date": next_review_date - timedelta(days=interval) if interval > 0 else None,
+        "next_review_date": next_review_date,
+    }
+
+
+def _strip_html(value):
+    return html.unescape(strip_tags(_LINE_BREAK.sub("\n", value))).strip()
+
+
+def _validate_card(front, back, max_lengths):
+    for field, value in (("front", front), ("back", back)):
+        if not value or not value.strip():
+            return f"Missing {field}"
+        if len(value.strip()) > max_lengths[field]:
+            return f"{field.capitalize()} is longer than {max_lengths[field]} characters"
+    return None
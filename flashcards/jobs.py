@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import requests
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .gemini import CircuitOpenError
+from .models import GenerationJob, GenerationJobStatus
+from .utils import generate_flashcards_data_with_ai, create_flashcards_from_ai_data, describe_skipped_flashcards
+
+logger = logging.getLogger(__name__)
+
+# Jobs failing with a network/API error are retried until they were attempted this often
+MAX_ATTEMPTS = 3
+
+# Delay before a failed job is retried, doubled with every further attempt, so a short outage of the AI service
+# does not use up all attempts at once
+RETRY_DELAY = timedelta(seconds=30)
+
+# A worker refreshes the heartbeat of its running job this often, however long the AI requests take
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+
+# Running jobs without a heartbeat for this long are considered abandoned by a crashed worker and queued again
+DEFAULT_STALE_AFTER = timedelta(minutes=2)
+
+
+def claim_next_job():
+    """
+    Claims the oldest pending job for this worker whose retry delay (not_before) has passed.
+
+    The claim is a conditional update (PENDING -> RUNNING), so several workers can poll the same table:
+    if another worker claimed the job first, the update matches no row and the next job is tried.
+
+    :return: The claimed GenerationJob, or None if no job is pending.
+    """
+    while True:
+        now = timezone.now()
+        job = GenerationJob.objects.filter(
+            Q(not_before__isnull=True) | Q(not_before__lte=now), status=GenerationJobStatus.PENDING
+        ).order_by("created_at", "id").first()
+        if job is None:
+            return None
+
+        claimed = GenerationJob.objects.filter(id=job.id, status=GenerationJobStatus.PENDING).update(
+            status=GenerationJobStatus.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_generation_job(job):
+    """
+    Generates the flashcards of a claimed job and records the outcome.
+
+    Errors of the AI service (timeouts, connection errors, 5xx) put the job back in the queue, to be retried after
+    RETRY_DELAY (doubled per attempt), until it was attempted MAX_ATTEMPTS times; any other error fails the job
+    right away. While the circuit breaker of the AI client is open, the job is deferred until the breaker lets
+    calls through again, without counting the attempt. If the job was deleted meanwhile (e.g. together with its
+    set), the outcome is only logged.
+
+    :param job: A GenerationJob in the RUNNING state.
+    :return: The job with its final (or re-queued) status.
+    """
+    try:
+        with heartbeat(job):
+            flashcards = generate_flashcards_data_with_ai(job.text, job.num_flashcards)
+            job.created_count, errors = create_flashcards_from_ai_data(flashcards, job.flashcard_set)
+        job.status = GenerationJobStatus.SUCCEEDED
+        job.error = describe_skipped_flashcards(errors)
+    except CircuitOpenError as e:
+        job.error = f"AI service unavailable: {e}"
+        job.status = GenerationJobStatus.PENDING
+        job.attempts -= 1
+        retry_delay = timedelta(seconds=e.retry_after)
+    except requests.exceptions.RequestException as e:
+        job.error = f"AI service error: {e}"
+        job.status = GenerationJobStatus.PENDING if job.attempts < MAX_ATTEMPTS else GenerationJobStatus.FAILED
+        retry_delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+    except Exception as e:
+        job.error = f"An unexpected error occurred: {e}"
+        job.status = GenerationJobStatus.FAILED
+
+    now = timezone.now()
+    if job.status == GenerationJobStatus.PENDING:
+        job.not_before = now + retry_delay
+        logger.warning(f"Generation job {job.id} queued again until {job.not_before:%H:%M:%S} "
+                       f"({job.attempts} attempt(s) counted): {job.error}")
+    elif job.status == GenerationJobStatus.FAILED:
+        logger.error(f"Generation job {job.id} failed: {job.error}")
+
+    job.finished_at = now if job.status != GenerationJobStatus.PENDING else None
+    # An update instead of save(update_fields=...), which raises if the row was deleted while the job ran
+    updated = GenerationJob.objects.filter(id=job.id).update(
+        status=job.status, attempts=job.attempts, created_count=job.created_count, error=job.error,
+        finished_at=job.finished_at, not_before=job.not_before,
+    )
+    if not updated:
+        logger.warning(f"Generation job {job.id} was deleted while it ran")
+    return job
+
+
+@contextmanager
+def heartbeat(job, interval=HEARTBEAT_INTERVAL):
+    """ Refreshes the heartbeat of a running job every interval from a background thread while the block runs. """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval.total_seconds()):
+                try:
+                    GenerationJob.objects.filter(id=job.id, status=GenerationJobStatus.RUNNING).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception as e:
+                    logger.warning(f"Heartbeat of generation job {job.id} failed: {e}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"generation-job-{job.id}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def requeue_stale_jobs(stale_after=DEFAULT_STALE_AFTER):
+    """
+    Puts running jobs whose worker has not sent a heartbeat for stale_after back in the queue.
+    Jobs that were already attempted MAX_ATTEMPTS times fail instead, so a job crashing its worker is not retried
+    forever.
+
+    :return: The number of requeued and failed jobs.
+    """
+    now = timezone.now()
+    stale_jobs = GenerationJob.objects.filter(status=GenerationJobStatus.RUNNING).filter(
+        Q(heartbeat_at__lt=now - stale_after) | Q(heartbeat_at__isnull=True, started_at__lt=now - stale_after)
+    )
+    failed = stale_jobs.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=GenerationJobStatus.FAILED, error="The worker running the job stopped responding", finished_at=now
+    )
+    if failed:
+        logger.error(f"{failed} abandoned generation job(s) failed after {MAX_ATTEMPTS} attempts")
+    return failed + stale_jobs.update(status=GenerationJobStatus.PENDING)
+
+
+def run_worker(once=False, poll_interval=2.0, stale_after=DEFAULT_STALE_AFTER):
+    """
+    Processes generation jobs until interrupted.
+
+    :param once: Process the pending jobs and return instead of polling for new ones.
+    :param poll_interval: Seconds to wait when the queue is empty.
+    :param stale_after: See requeue_stale_jobs.
+    :return: The number of processed jobs.
+    """
+    processed = 0
+    while True:
+        requeue_stale_jobs(stale_after)
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            run_generation_job(job)
+        except Exception:
+            # The job stays RUNNING and is queued again by requeue_stale_jobs once its heartbeat is stale
+            logger.exception(f"Generation job {job.id} could not be processed")
+        processed += 1
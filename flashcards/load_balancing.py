@@ -0,0 +1,77 @@
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+
+from .due_counts import due_day, load_due_counts
+
+# --- Review load balancing ---
+#
+# Cards rated together (e.g. a freshly generated set studied in one sitting) get the same intervals and would all
+# come back on the same day. After the FSRS calculation the interval of a review card is therefore fuzzed: it may
+# move by the fuzz factor w14 of the interval (at least one day; intervals under MIN_FUZZ_INTERVAL days are kept),
+# and the card goes to the day of that window with the fewest cards due. Ties go to the day closest to the
+# calculated interval and then to a hash of the card and its review count, so the result is deterministic.
+#
+# The due counts per day are read from DailyDueCount (see due_counts.py).
+
+MIN_FUZZ_INTERVAL = 3
+
+# Index of the interval fuzz factor in the FSRS weights
+FUZZ_FACTOR = 14
+
+
+def fuzz_range(fsrs, interval):
+    """
+    Returns the range of intervals a review interval may be moved to.
+
+    :param fsrs: The FSRS calculator of the user, holding the fuzz factor.
+    :param interval: Interval in whole days.
+    :return: Tuple (shortest, longest) interval in days.
+    """
+    if interval < MIN_FUZZ_INTERVAL:
+        return interval, interval
+    delta = max(1, round(fsrs.w[FUZZ_FACTOR] * interval))
+    return max(1, interval - delta), interval + delta
+
+
+def balance_interval(fsrs, interval, reviewed_at, due_counts, seed):
+    """
+    Moves a review interval to the least loaded day of its fuzz range.
+
+    :param interval: Interval in whole days, as calculated by FSRS.
+    :param reviewed_at: Time of the review the interval starts at.
+    :param due_counts: Number of cards due per date; dates without cards may be missing.
+    :param seed: Identifies the review (e.g. card and review count), breaks ties between equally loaded days.
+    :return: The balanced interval in days.
+    """
+    shortest, longest = fuzz_range(fsrs, int(interval))
+    if shortest == longest:
+        return interval
+
+    def load(days):
+        due_count = due_counts.get(due_day(reviewed_at + timedelta(days=days)), 0)
+        return due_count, abs(days - interval), zlib.crc32(f"{seed}:{days}".encode())
+
+    return min(range(shortest, longest + 1), key=load)
+
+
+def schedule_review(fsrs, review, reviewed_at, interval, counted_due_date=None):
+    """
+    Balances the interval of a review card against the user's due counts of its fuzz range (one query).
+
+    :param review: The Review being scheduled; its user, card and review count are used.
+    :param counted_due_date: Due date the review is currently counted for; it is left out of the counts.
+    :return: The balanced interval in days (the given interval if load balancing is disabled).
+    """
+    if not settings.LOAD_BALANCING:
+        return interval
+    shortest, longest = fuzz_range(fsrs, int(interval))
+    if shortest == longest:
+        return interval
+
+    due_counts = load_due_counts(review.user_id, due_day(reviewed_at + timedelta(days=shortest)),
+                                 due_day(reviewed_at + timedelta(days=longest)))
+    if counted_due_date is not None and due_counts.get(due_day(counted_due_date)):
+        due_counts[due_day(counted_due_date)] -= 1
+    return balance_interval(fsrs, interval, reviewed_at, due_counts, seed=f"{review.flashcard_id}:{review.repetitions}")
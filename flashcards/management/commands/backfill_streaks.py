@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.services import backfill_streaks
+
+
+class Command(BaseCommand):
+    help = "Recomputes the persisted study streak of every DailyUserStats row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only backfill the streaks of this username.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows written per bulk update.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        updated = backfill_streaks(user=user, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated the streak of {updated} daily stats row(s)."))
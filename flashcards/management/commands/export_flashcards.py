@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.exporters import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, export_csv, export_ndjson, export_rows
+
+
+class Command(BaseCommand):
+    help = ("Exports the flashcards and review state of all users (or one user) as CSV or NDJSON. "
+            "Every row carries the username of the set owner.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only export the sets of this username (default: all users).")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", default="-", help="File to write to (default: standard output).")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows fetched per query.")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        def rows():
+            for user in users.iterator():
+                for row in export_rows(user, chunk_size=options["chunk_size"]):
+                    yield {"user": user.username, **row}
+
+        lines = export_csv(rows(), extra_columns=["user"]) if options["format"] == "csv" else export_ndjson(rows())
+
+        if options["output"] == "-":
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1 if options["format"] == "csv" else 0  # Not counting the CSV header
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} flashcard(s) to {options['output']}."))
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from flashcards.dedup import DEFAULT_THRESHOLD, find_duplicates
+from flashcards.models import Flashcard, FlashcardSet
+from flashcards.services import register_flashcard_removed
+
+
+class Command(BaseCommand):
+    help = ("Finds near-duplicate flashcards within each set and lists them with the card they duplicate. "
+            "With --delete, the duplicates are deleted and the oldest card of each group is kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only check the sets of this username (default: all users).")
+        parser.add_argument("--set", type=int, help="Only check this set.")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Similarity (0-1) from which cards count as duplicates.")
+        parser.add_argument("--delete", action="store_true", help="Delete the duplicates.")
+
+    def handle(self, *args, **options):
+        if not 0 < options["threshold"] <= 1:
+            raise CommandError("Threshold must be between 0 and 1")
+
+        flashcard_sets = FlashcardSet.objects.order_by("id")
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+            flashcard_sets = flashcard_sets.filter(created_by=user)
+        if options["set"]:
+            flashcard_sets = flashcard_sets.filter(id=options["set"])
+
+        total = 0
+        for flashcard_set in flashcard_sets.iterator():
+            flashcards = Flashcard.objects.filter(flashcard_set=flashcard_set)
+            duplicates = find_duplicates(flashcards, options["threshold"])
+            if not duplicates:
+                continue
+
+            self.stdout.write(f"{flashcard_set.title} ({flashcard_set.id}): {len(duplicates)} duplicate(s)")
+            fronts = dict(flashcards.filter(
+                id__in=[flashcard_id for pair in duplicates for flashcard_id in pair]
+            ).values_list("id", "front"))
+            for duplicate_id, original_id in duplicates:
+                self.stdout.write(f"  {duplicate_id} {fronts[duplicate_id]!r} duplicates "
+                                  f"{original_id} {fronts[original_id]!r}")
+
+            if options["delete"]:
+                with transaction.atomic():
+                    for flashcard in flashcards.filter(id__in=[duplicate_id for duplicate_id, _ in duplicates]):
+                        register_flashcard_removed(flashcard)
+                        flashcard.delete()
+            total += len(duplicates)
+
+        action = "Deleted" if options["delete"] else "Found"
+        self.stdout.write(self.style.SUCCESS(f"{action} {total} near-duplicate flashcard(s)."))
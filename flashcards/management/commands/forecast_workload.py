@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from flashcards.simulator import DEFAULT_DAYS, forecast_user_workload
+
+
+class Command(BaseCommand):
+    help = ("Simulates the coming days of reviews of every user (or one user) with their FSRS parameters and "
+            "prints the total due cards, reviews, new cards and estimated database writes per day.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only forecast this username (default: all users).")
+        parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Number of days to simulate.")
+        parser.add_argument("--new-cards-per-day", type=float,
+                            help="New cards each user starts per day (default: each user's recent rate).")
+        parser.add_argument("--seed", type=int, help="Seed of the sampled ratings, for reproducible forecasts.")
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1")
+
+        users = get_user_model().objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        now = timezone.now()
+        seeds = np.random.SeedSequence(options["seed"])
+        totals = {key: np.zeros(options["days"], dtype=np.int64) for key in ("due", "reviews", "new", "writes")}
+        user_count = 0
+        for user in users.iterator():
+            forecast = forecast_user_workload(
+                user, days=options["days"], now=now, new_cards_per_day=options["new_cards_per_day"],
+                seed=seeds.spawn(1)[0],
+            )
+            for key, values in forecast.items():
+                totals[key] += values
+            user_count += 1
+
+        self.stdout.write(f"{'date':<12} {'due':>10} {'reviews':>10} {'new':>8} {'writes':>10}")
+        for day in range(options["days"]):
+            date = (now + timedelta(days=day)).date()
+            self.stdout.write(f"{date.isoformat():<12} {totals['due'][day]:>10} {totals['reviews'][day]:>10} "
+                              f"{totals['new'][day]:>8} {totals['writes'][day]:>10}")
+
+        peak = int(totals["writes"].argmax())
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast for {user_count} user(s): {totals['reviews'].sum()} review(s) in {options['days']} day(s), "
+            f"peak of {totals['writes'][peak]} write(s) on {(now + timedelta(days=peak)).date().isoformat()}."
+        ))
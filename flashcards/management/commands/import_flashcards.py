@@ -0,0 +1,70 @@
+import csv
+import os
+import sqlite3
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.importers import (IMPORT_FORMATS, DEFAULT_BATCH_SIZE, ImportedSets, detect_format, parse_apkg,
+                                  parse_text, import_cards)
+from flashcards.models import FlashcardSet
+
+
+class Command(BaseCommand):
+    help = ("Imports a CSV/TSV/NDJSON file or an Anki package (.apkg) into an existing flashcard set, or into new "
+            "sets: the ones named by the file's set column and one for the cards without a set.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import.")
+        parser.add_argument("--user", required=True, help="Username of the owner of the set.")
+        parser.add_argument("--set", type=int, help="Add all cards to this existing set (default: create new sets).")
+        parser.add_argument("--title", help="Title of the new set of the cards without a set (default: the file name).")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="File format (default: from the extension).")
+        parser.add_argument("--with-reviews", action="store_true", help="Import the review state of the cards.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Cards inserted per query.")
+        parser.add_argument("--keep-duplicates", action="store_true",
+                            help="Import near-duplicates of the set's cards and of earlier rows too.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        path = options["path"]
+        import_format = options["format"] or detect_format(path)
+        if import_format is None:
+            raise CommandError(f"Unknown file format, use --format ({', '.join(IMPORT_FORMATS)})")
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' does not exist")
+
+        if options["set"]:
+            try:
+                flashcard_set = FlashcardSet.objects.get(id=options["set"], created_by=user)
+            except FlashcardSet.DoesNotExist:
+                raise CommandError(f"Flashcard set {options['set']} of '{user}' does not exist")
+        else:
+            name = os.path.basename(path)
+            flashcard_set = ImportedSets(user, options["title"] or os.path.splitext(name)[0], f"Imported from {name}")
+
+        user_for_reviews = user if options["with_reviews"] else None
+        deduplicate = False if options["keep_duplicates"] else None
+        try:
+            if import_format == "apkg":
+                cards = parse_apkg(path)
+                result = import_cards(cards, flashcard_set, user_for_reviews, options["batch_size"], deduplicate)
+            else:
+                with open(path, encoding="utf-8-sig", newline="") as stream:
+                    cards = parse_text(stream, import_format)
+                    result = import_cards(cards, flashcard_set, user_for_reviews, options["batch_size"], deduplicate)
+        except (ValueError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile, sqlite3.DatabaseError) as e:
+            raise CommandError(f"Import failed: {e}")
+
+        for error in result["errors"]:
+            self.stderr.write(f"Skipped card {error['row']}: {error['message']}")
+        titles = ", ".join(f"'{imported_set.title}'" for imported_set in result["sets"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} card(s) and {result['reviews']} review(s) into {titles or 'no set'} "
+            f"({result['skipped']} skipped, {result['duplicates']} of them near-duplicates)."
+        ))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.models import ReviewLog
+from flashcards.optimizer import DEFAULT_MIN_REVIEWS, optimize_user_parameters
+
+
+class Command(BaseCommand):
+    help = "Fits the FSRS weights of each user to their review log and stores them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only optimize the parameters of this username (default: all users).")
+        parser.add_argument("--min-reviews", type=int, default=DEFAULT_MIN_REVIEWS,
+                            help="Skip users with fewer logged reviews.")
+        parser.add_argument("--iterations", type=int, default=60, help="Number of gradient descent steps.")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            users = get_user_model().objects.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+        else:
+            users = get_user_model().objects.filter(id__in=ReviewLog.objects.values("user_id")).order_by("id")
+
+        for user in users.iterator():
+            parameters = optimize_user_parameters(
+                user, min_reviews=options["min_reviews"], iterations=options["iterations"]
+            )
+            if parameters is None:
+                self.stdout.write(f"Skipped {user.username}: not enough reviews.")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Optimized {user.username} on {parameters.review_count} reviews "
+                    f"(log loss {parameters.log_loss:.4f})."
+                ))
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.due_counts import rebuild_due_counts
+
+
+class Command(BaseCommand):
+    help = "Recounts the daily due counts per user and set from the stored reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild the counts of this username (default: all users).")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        written = rebuild_due_counts(user=user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily due count(s)."))
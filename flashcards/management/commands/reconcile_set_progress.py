@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from flashcards.services import reconcile_set_progress
+
+
+class Command(BaseCommand):
+    help = "Recounts the FlashcardSetProgress counters and repairs any drift. Safe to run periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows read and written per batch.")
+
+    def handle(self, *args, **options):
+        repaired = reconcile_set_progress(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} set progress row(s)."))
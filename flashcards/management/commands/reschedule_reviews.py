@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.fsrs import FSRS
+from flashcards.models import Review
+from flashcards.services import reschedule_reviews, update_scheduler_parameters
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the next review date of stored reviews with each user's FSRS parameters, after they or the "
+            "retention changed. --retention and --weights are saved as the parameters of the rescheduled users "
+            "first, so later ratings keep using them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only reschedule the reviews of this username (default: all users).")
+        parser.add_argument("--retention", type=float, help="Save this requested retention, e.g. 0.9, for the users.")
+        parser.add_argument("--weights", help="Save this comma-separated list of the 17 FSRS weights for the users.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Reviews read and written per transaction.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        retention = options["retention"]
+        if retention is not None and not 0 < retention < 1:
+            raise CommandError("Retention must be between 0 and 1")
+
+        if retention is not None or options["weights"]:
+            try:
+                weights = [float(value) for value in options["weights"].split(",")] if options["weights"] else None
+                FSRS(w=weights, request_retention=retention)
+            except ValueError as e:
+                raise CommandError(f"Invalid weights: {e}")
+
+            users = [user] if user is not None else get_user_model().objects.filter(
+                id__in=Review.objects.values("user_id")
+            )
+            for parameters_user in users:
+                update_scheduler_parameters(parameters_user, weights, retention)
+
+        rescheduled = reschedule_reviews(user=user, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rescheduled {rescheduled} review(s)."))
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards.jobs import DEFAULT_STALE_AFTER, HEARTBEAT_INTERVAL, run_worker
+
+
+class Command(BaseCommand):
+    help = "Processes queued AI flashcard generation jobs. Several workers can run side by side."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the pending jobs and exit.")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument("--stale-after", type=int, default=int(DEFAULT_STALE_AFTER.total_seconds()),
+                            help="Seconds without a heartbeat after which a running job is considered abandoned "
+                                 "and queued again.")
+
+    def handle(self, *args, **options):
+        if options["poll_interval"] <= 0:
+            raise CommandError("--poll-interval must be positive")
+        if options["stale_after"] <= HEARTBEAT_INTERVAL.total_seconds():
+            raise CommandError(f"--stale-after must be longer than the heartbeat interval "
+                               f"({HEARTBEAT_INTERVAL.total_seconds():.0f} seconds)")
+
+        try:
+            processed = run_worker(
+                once=options["once"],
+                poll_interval=options["poll_interval"],
+                stale_after=timedelta(seconds=options["stale_after"]),
+            )
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} generation job(s)."))
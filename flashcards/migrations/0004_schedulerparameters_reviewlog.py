@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0003_review_flashcardsetprogress_dailyuserstats_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerParameters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weights', models.JSONField()),
+                ('request_retention', models.FloatField(blank=True, null=True)),
+                ('log_loss', models.FloatField(blank=True, null=True)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('optimized_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scheduler_parameters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReviewLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField()),
+                ('state', models.CharField(choices=[('NEW', 'New'), ('LRN', 'Learning'), ('REV', 'Review'), ('REL', 'Relearning')], max_length=3)),
+                ('stability', models.FloatField()),
+                ('difficulty', models.FloatField()),
+                ('elapsed_days', models.FloatField(blank=True, null=True)),
+                ('reviewed_at', models.DateTimeField()),
+                ('flashcard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'flashcard', 'id'], name='flashcards__user_id_f8b76f_idx')],
+            },
+        ),
+    ]
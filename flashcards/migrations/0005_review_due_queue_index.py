@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0004_schedulerparameters_reviewlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Create the covering index before dropping the one it replaces
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', 'next_review_date', 'flashcard'], name='flashcards__user_id_63992b_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='flashcards__user_id_9bc91c_idx',
+        ),
+    ]
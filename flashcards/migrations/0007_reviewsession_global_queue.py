@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0006_reviewsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewsession',
+            name='buffer',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='reviewsession',
+            name='interleave',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='reviewsession',
+            name='set_cursors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='reviewsession',
+            name='flashcard_set',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcardset'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations
+
+# The search index depends on the database: an FTS5 table kept in sync by triggers on SQLite and a GIN index over the
+# cards' search vector on PostgreSQL. Other databases fall back to a LIKE scan and get no index.
+# See flashcards/search.py for the queries using them.
+
+SQLITE_FTS_TABLE = "flashcards_flashcard_fts"
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        front, back, content='flashcards_flashcard', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_insert AFTER INSERT ON flashcards_flashcard BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, front, back) VALUES (new.id, new.front, new.back);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_delete AFTER DELETE ON flashcards_flashcard BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, front, back) VALUES ('delete', old.id, old.front, old.back);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_FTS_TABLE}_update AFTER UPDATE OF front, back ON flashcards_flashcard BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, front, back) VALUES ('delete', old.id, old.front, old.back);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, front, back) VALUES (new.id, new.front, new.back);
+    END
+    """,
+    # Index the existing cards
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}",
+]
+
+
+def search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Same expression as the filter in search._search_postgresql
+    return GinIndex(SearchVector("front", "back", config="simple"), name="flashcards_flashcard_search")
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("flashcards", "Flashcard"), search_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("flashcards", "Flashcard"), search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0008_generationjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def count_due_reviews(apps, schema_editor):
+    Review = apps.get_model("flashcards", "Review")
+    DailyDueCount = apps.get_model("flashcards", "DailyDueCount")
+
+    counts = Review.objects.values(
+        "user_id", "flashcard__flashcard_set_id", date=TruncDate("next_review_date")
+    ).annotate(due_count=Count("id")).order_by()
+    DailyDueCount.objects.bulk_create([
+        DailyDueCount(user_id=row["user_id"], flashcard_set_id=row["flashcard__flashcard_set_id"], date=row["date"],
+                      due_count=row["due_count"])
+        for row in counts.iterator(chunk_size=10_000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0009_flashcard_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('due_count', models.PositiveIntegerField(default=0)),
+                ('flashcard_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcardset')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date'], name='flashcards__user_id_6e9500_idx')],
+                'unique_together': {('user', 'flashcard_set', 'date')},
+            },
+        ),
+        migrations.RunPython(count_due_reviews, migrations.RunPython.noop),
+    ]
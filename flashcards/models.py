@@ -81,7 +81,8 @@ class Review(models.Model):
             models.UniqueConstraint(fields=["user", "flashcard"], name="unique_user_flashcard_review_state")
         ]
         indexes = [
-            models.Index(fields=["user", "next_review_date"]),  # Useful for fetching due cards for a user
+            # Covers the due queue: due cards of a user in (next_review_date, flashcard) order
+            models.Index(fields=["user", "next_review_date", "flashcard"]),
         ]
 
     def __str__(self):
@@ -112,6 +113,28 @@ class DailyUserStats(models.Model):
         return f"{self.user.username} - {self.date} ({self.total_reviews} reviews)"
 
 
+class DailyDueCount(models.Model):
+    """
+    Number of the user's cards of a set due on a day, updated with every change of a review's next_review_date.
+    Rebuilt from the reviews by the rebuild_due_counts command.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE)
+    date = models.DateField()
+
+    due_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "flashcard_set", "date")
+        indexes = [
+            # Counts of all sets over a range of days (load balancing, due counts of the dashboard)
+            models.Index(fields=["user", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date} ({self.due_count} due)"
+
+
 class FlashcardSetProgress(models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE)
@@ -131,3 +154,112 @@ class FlashcardSetProgress(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.flashcard_set.title}"
+
+
+class ReviewLog(models.Model):
+    """
+    Append-only history of every rating. Stores the card's memory state *before* the review,
+    which is what the FSRS parameter optimizer is trained on.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    flashcard = models.ForeignKey(Flashcard, on_delete=models.CASCADE)
+
+    rating = models.PositiveSmallIntegerField()  # 1-4 scale
+    state = models.CharField(max_length=3, choices=ReviewState.choices)  # State before the review
+    stability = models.FloatField()  # S before the review
+    difficulty = models.FloatField()  # D before the review
+    elapsed_days = models.FloatField(null=True, blank=True)  # Days since the previous review, null for the first one
+    reviewed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "flashcard", "id"]),  # Replays a user's log card by card, in order
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.flashcard_id} rated {self.rating} on {self.reviewed_at:%Y-%m-%d}"
+
+
+class SchedulerParameters(models.Model):
+    """ Per-user FSRS parameters, fitted from the user's ReviewLog by the optimizer. """
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, related_name="scheduler_parameters")
+
+    weights = models.JSONField()  # The 17 FSRS weights
+    request_retention = models.FloatField(null=True, blank=True)  # None uses the FSRS default
+
+    log_loss = models.FloatField(null=True, blank=True)  # Loss of the fitted weights on the review log
+    review_count = models.PositiveIntegerField(default=0)  # Number of log rows the weights were fitted on
+    optimized_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} - FSRS parameters"
+
+
+class ReviewSession(models.Model):
+    """
+    Server-side state of a due review session. The session walks the due queue with cursors and keeps only a
+    small buffer of prefetched cards instead of the list of due cards; the Django session only holds the id
+    of this row.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE, null=True, blank=True)  # None: all sets
+    interleave = models.BooleanField(default=False)  # Alternate between sets instead of following the due order
+
+    started_at = models.DateTimeField()  # Cards due at or before this time belong to the session
+    current_flashcard = models.ForeignKey(Flashcard, on_delete=models.SET_NULL, null=True, related_name="+")
+
+    # Due queue position (next_review_date, flashcard id) of the last prefetched card
+    cursor_date = models.DateTimeField(null=True, blank=True)
+    cursor_flashcard_id = models.BigIntegerField(null=True, blank=True)
+    # Interleaved sessions: [set id, cursor date, cursor flashcard id] per set, in rotation order
+    set_cursors = models.JSONField(default=list, blank=True)
+    # Ids of the prefetched flashcards that follow the current one
+    buffer = models.JSONField(default=list, blank=True)
+
+    position = models.PositiveIntegerField(default=0)  # Number of cards rated so far
+    total_cards = models.PositiveIntegerField(default=0)  # Number of cards in the session (at most the daily cap)
+
+    def remaining(self):
+        return max(0, self.total_cards - self.position)
+
+    def __str__(self):
+        scope = self.flashcard_set.title if self.flashcard_set else "All sets"
+        return f"{self.user.username} - {scope} ({self.position}/{self.total_cards})"
+
+
+class GenerationJobStatus(models.TextChoices):
+    PENDING = "PEN", _("Pending")
+    RUNNING = "RUN", _("Running")
+    SUCCEEDED = "SUC", _("Succeeded")
+    FAILED = "FAI", _("Failed")
+
+
+class GenerationJob(models.Model):
+    """
+    A queued AI flashcard generation. Views enqueue jobs and return immediately;
+    the run_generation_worker command processes them outside of the request cycle.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE)
+
+    text = models.TextField()  # Topic or extracted PDF text to generate the flashcards from
+    num_flashcards = models.PositiveIntegerField()
+
+    status = models.CharField(max_length=3, choices=GenerationJobStatus.choices, default=GenerationJobStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Refreshed by the worker while the job runs
+    not_before = models.DateTimeField(null=True, blank=True)  # A retried job is not claimed again before this time
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),  # Workers pick the oldest pending job
+        ]
+
+    def __str__(self):
+        return f"Generation for {self.flashcard_set.title} ({self.get_status_display()})"
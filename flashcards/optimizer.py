@@ -0,0 +1,247 @@
+import logging
+import time
+from typing import List, Optional
+
+import numpy as np
+from django.utils import timezone
+
+from .fsrs import FSRS
+from .models import ReviewLog, ReviewState, SchedulerParameters
+
+logger = logging.getLogger(__name__)
+
+# --- FSRS parameter optimizer ---
+#
+# Fits the FSRS weights of one user to their ReviewLog. The log is replayed card by card through the batch
+# FSRS API with candidate weights; before every review of a card that was already seen, the model predicts the
+# probability of recall (retrievability) and the loss is the binary cross-entropy against the actual outcome
+# (rating > 1). The loss is minimized with Adam on minibatches of cards using central-difference gradients.
+
+# Weights that take part in the calculations of FSRS.update_state, and the bounds they are kept within.
+# The remaining weights are not used by the current formulas and are left unchanged.
+OPTIMIZED_WEIGHTS = {
+    0: (0.01, 100.0),  # Initial stability for Again
+    1: (0.01, 100.0),  # Initial stability for Hard
+    2: (0.01, 100.0),  # Initial stability for Good
+    3: (0.01, 100.0),  # Initial stability for Easy
+    4: (1.0, 10.0),  # Initial difficulty
+    5: (0.01, 5.0),  # Initial difficulty change per grade
+    6: (0.01, 5.0),  # Difficulty change per grade
+    8: (0.0, 6.0),  # Stability increase factor (exponent)
+    9: (0.0, 0.8),  # Stability decay exponent
+    15: (0.01, 5.0),  # Stability after lapse
+    16: (0.01, 4.0),  # Difficulty exponent after lapse
+}
+
+DEFAULT_MIN_REVIEWS = 100
+
+
+class ReviewHistory:
+    """
+    A review log prepared for fast replay: rows are grouped by their position in the card's history,
+    so step k of the replay processes the k-th review of every card with one vectorized call.
+    """
+
+    def __init__(self, cards: np.ndarray, states: np.ndarray, stability: np.ndarray, difficulty: np.ndarray,
+                 elapsed_days: np.ndarray, ratings: np.ndarray):
+        """
+        All arrays have one entry per review, ordered by card and then chronologically.
+        cards holds consecutive card indices (0..n_cards-1); states, stability and difficulty describe the card
+        before the review (only the first review of each card is used, to seed the replay).
+        """
+        self.size = len(cards)
+        self._chronological = (cards, elapsed_days, ratings)
+        first = np.ones(self.size, dtype=bool)
+        first[1:] = cards[1:] != cards[:-1]
+        first_rows = np.flatnonzero(first)
+
+        self.card_count = len(first_rows)
+        self.initial_states = states[first_rows]
+        self.initial_s = stability[first_rows]
+        self.initial_d = difficulty[first_rows]
+
+        # Position of every row within its card's history
+        positions = np.arange(self.size) - np.repeat(first_rows, np.diff(np.append(first_rows, self.size)))
+        order = np.lexsort((cards, positions))
+        self.cards = cards[order]
+        self.elapsed_days = elapsed_days[order]
+        self.ratings = ratings[order]
+        self.recalled = self.ratings > 1
+        boundaries = np.flatnonzero(np.diff(positions[order])) + 1
+        self.steps = list(zip(np.append(0, boundaries), np.append(boundaries, self.size)))
+
+    @classmethod
+    def from_log(cls, log_rows):
+        """
+        Builds a history from (flashcard_id, state, stability, difficulty, elapsed_days, rating) tuples
+        ordered by flashcard and then chronologically.
+        """
+        flashcard_ids, states, stability, difficulty, elapsed_days, ratings = (
+            np.array(column) for column in zip(*log_rows)
+        )
+        cards = np.concatenate(([0], np.cumsum(flashcard_ids[1:] != flashcard_ids[:-1])))
+        state_codes = FSRS()._state_codes(states.astype(str))
+        elapsed_days = np.array([np.nan if value is None else value for value in elapsed_days], dtype=np.float64)
+        return cls(cards, state_codes, stability.astype(np.float64), difficulty.astype(np.float64),
+                   elapsed_days, ratings.astype(np.int64))
+
+    def split(self, batch_count: int, rng: np.random.Generator) -> List["ReviewHistory"]:
+        """ Splits the history into batch_count histories over random, disjoint sets of cards. """
+        batch_count = max(1, min(batch_count, self.card_count))
+        card_batches = rng.permutation(self.card_count) % batch_count
+
+        cards, elapsed_days, ratings = self._chronological
+
+        histories = []
+        for batch in range(batch_count):
+            in_batch = card_batches == batch
+            rows = in_batch[cards]
+            batch_cards = (np.cumsum(in_batch) - 1)[cards[rows]]
+            reviews_per_card = np.bincount(batch_cards)
+            histories.append(ReviewHistory(
+                batch_cards,
+                np.repeat(self.initial_states[in_batch], reviews_per_card),
+                np.repeat(self.initial_s[in_batch], reviews_per_card),
+                np.repeat(self.initial_d[in_batch], reviews_per_card),
+                elapsed_days[rows],
+                ratings[rows],
+            ))
+        return histories
+
+
+def log_loss(fsrs: FSRS, history: ReviewHistory) -> float:
+    """
+    Replays the history with the given FSRS parameters and returns the mean binary cross-entropy of the
+    predicted retrievability against the actual recall of every review of an already seen card.
+    """
+    states = history.initial_states.copy()
+    stability = history.initial_s.copy()
+    difficulty = history.initial_d.copy()
+    new_code = FSRS.STATE_CODES[ReviewState.NEW]
+
+    total_loss = 0.0
+    predictions = 0
+    for start, end in history.steps:
+        cards = history.cards[start:end]
+        elapsed_days = history.elapsed_days[start:end]
+        ratings = history.ratings[start:end]
+
+        predicted = (states[cards] != new_code) & ~np.isnan(elapsed_days)
+        if predicted.any():
+            retrievability = np.clip(fsrs._calc_retrievability_array(
+                stability[cards][predicted], elapsed_days[predicted]
+            ), 1e-6, 1 - 1e-6)
+            recalled = history.recalled[start:end][predicted]
+            total_loss -= np.sum(np.where(recalled, np.log(retrievability), np.log(1 - retrievability)))
+            predictions += len(retrievability)
+
+        result = fsrs.update_state_batch(states[cards], stability[cards], difficulty[cards], elapsed_days, ratings)
+        states[cards] = result["new_state"]
+        stability[cards] = result["new_s"]
+        difficulty[cards] = result["new_d"]
+
+    return total_loss / predictions if predictions else 0.0
+
+
+def fit_weights(history: ReviewHistory, initial_weights: Optional[List[float]] = None, iterations: int = 60,
+                batch_reviews: int = 50_000, learning_rate: float = 0.05, seed: int = 0,
+                request_retention: Optional[float] = None):
+    """
+    Fits the FSRS weights to a review history by gradient descent.
+
+    The optimized weights are scaled by their initial values, so a single learning rate suits all of them.
+    Gradients are central differences of the loss on one minibatch of cards per iteration (Adam updates),
+    and the weights are clipped to OPTIMIZED_WEIGHTS after every step.
+
+    :param history: The user's review history.
+    :param initial_weights: Starting point (FSRS defaults if None).
+    :param iterations: Number of gradient steps.
+    :param batch_reviews: Approximate number of reviews per minibatch.
+    :param learning_rate: Adam step size, relative to the initial weights.
+    :param seed: Seed for the minibatch split.
+    :param request_retention: Retention used for the replayed intervals (FSRS default if None).
+    :return: Tuple (weights, loss) with the loss on the full history.
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.array(initial_weights if initial_weights is not None else FSRS.DEFAULT_PARAMS, dtype=np.float64)
+    indices = np.array(list(OPTIMIZED_WEIGHTS))
+    lower = np.array([bounds[0] for bounds in OPTIMIZED_WEIGHTS.values()])
+    upper = np.array([bounds[1] for bounds in OPTIMIZED_WEIGHTS.values()])
+    scale = np.maximum(np.abs(weights[indices]), 0.01)
+    x = weights[indices] / scale
+
+    def loss_at(values, batch):
+        candidate = weights.copy()
+        candidate[indices] = np.clip(values * scale, lower, upper)
+        return log_loss(FSRS(w=candidate.tolist(), request_retention=request_retention), batch)
+
+    batches = history.split(int(np.ceil(history.size / batch_reviews)), rng)
+    first_moment = np.zeros_like(x)
+    second_moment = np.zeros_like(x)
+    epsilon = 1e-3
+
+    for step in range(1, iterations + 1):
+        batch = batches[step % len(batches)]
+        gradient = np.zeros_like(x)
+        for i in range(len(x)):
+            offset = np.zeros_like(x)
+            offset[i] = epsilon
+            gradient[i] = (loss_at(x + offset, batch) - loss_at(x - offset, batch)) / (2 * epsilon)
+
+        first_moment = 0.9 * first_moment + 0.1 * gradient
+        second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+        corrected_first = first_moment / (1 - 0.9 ** step)
+        corrected_second = second_moment / (1 - 0.999 ** step)
+        x -= learning_rate * corrected_first / (np.sqrt(corrected_second) + 1e-8)
+        x = np.clip(x * scale, lower, upper) / scale
+
+    weights[indices] = x * scale
+    return weights.tolist(), log_loss(FSRS(w=weights.tolist(), request_retention=request_retention), history)
+
+
+def load_review_history(user) -> Optional[ReviewHistory]:
+    """ Loads the user's ReviewLog as a ReviewHistory (None if the log is empty). """
+    log_rows = list(ReviewLog.objects.filter(user=user).order_by("flashcard_id", "id").values_list(
+        "flashcard_id", "state", "stability", "difficulty", "elapsed_days", "rating"
+    ).iterator(chunk_size=10_000))
+    if not log_rows:
+        return None
+    return ReviewHistory.from_log(log_rows)
+
+
+def optimize_user_parameters(user, min_reviews: int = DEFAULT_MIN_REVIEWS, **fit_options) -> Optional[SchedulerParameters]:
+    """
+    Fits the FSRS weights to the user's review log and stores them in SchedulerParameters.
+    The weights are only replaced when they fit the log better than the current ones.
+
+    :param user: The user whose parameters are optimized.
+    :param min_reviews: Users with fewer log rows are skipped.
+    :param fit_options: Passed on to fit_weights.
+    :return: The user's SchedulerParameters, or None if the user was skipped.
+    """
+    history = load_review_history(user)
+    if history is None or history.size < min_reviews:
+        return None
+
+    started = time.monotonic()
+    parameters = SchedulerParameters.objects.filter(user=user).first()
+    current_weights = parameters.weights if parameters else FSRS.DEFAULT_PARAMS
+    request_retention = parameters.request_retention if parameters else None
+
+    weights, loss = fit_weights(history, current_weights, request_retention=request_retention, **fit_options)
+    current_loss = log_loss(FSRS(w=current_weights, request_retention=request_retention), history)
+    if loss > current_loss:
+        weights, loss = current_weights, current_loss
+
+    parameters, _ = SchedulerParameters.objects.update_or_create(
+        user=user,
+        defaults={
+            "weights": weights,
+            "log_loss": loss,
+            "review_count": history.size,
+            "optimized_at": timezone.now(),
+        }
+    )
+    logger.info(f"Optimized FSRS parameters of {user} on {history.size} reviews in "
+                f"{time.monotonic() - started:.1f}s (log loss {current_loss:.4f} -> {loss:.4f})")
+    return parameters
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import fitz
+from django.conf import settings
+
+# --- PDF text extraction ---
+#
+# Uploads are spooled to a temporary file (Django already does this for large uploads) and opened from disk, so
+# the PDF is never held in memory as a whole. Pages are read one at a time until the page or character budget is
+# used up. Extraction runs in a small process pool: PyMuPDF holds the GIL while parsing, which would otherwise stall
+# the other threads of the web worker. An extraction running past PDF_EXTRACTION_TIMEOUT has its pool terminated,
+# so slow or hostile PDFs cannot keep the workers busy for the uploads queued behind them.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def extract_pdf_text(path, max_pages=None, max_chars=None):
+    """
+    Extracts the text of a PDF file page by page.
+
+    :param path: Path of the PDF file.
+    :param max_pages: Stop after this many pages (no limit if None).
+    :param max_chars: Stop once the text reaches this many characters; the last page is cut (no limit if None).
+    :return: The extracted text, pages separated by newlines.
+    """
+    parts = []
+    length = 0
+    with fitz.open(path, filetype="pdf") as doc:
+        for page_number, page in enumerate(doc):
+            if max_pages is not None and page_number >= max_pages:
+                break
+            text = page.get_text()
+            if max_chars is not None and length + len(text) > max_chars:
+                parts.append(text[:max(0, max_chars - length)])
+                break
+            parts.append(text)
+            length += len(text) + 1
+    return "\n".join(parts)
+
+
+@contextmanager
+def spooled_upload(uploaded_file, suffix=".pdf"):
+    """ Yields the path of a file on disk holding the upload, writing it to a temporary file if necessary. """
+    if hasattr(uploaded_file, "temporary_file_path"):
+        yield uploaded_file.temporary_file_path()
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool:
+        for chunk in uploaded_file.chunks():
+            spool.write(chunk)
+    try:
+        yield spool.name
+    finally:
+        os.remove(spool.name)
+
+
+def extract_text_from_upload(uploaded_file):
+    """
+    Extracts the text of an uploaded PDF within the PDF_MAX_PAGES and PDF_MAX_CHARS budgets.
+
+    The extraction runs in the PDF extraction process pool unless PDF_EXTRACTION_WORKERS is 0.
+
+    :raises Exception: If the PDF cannot be read or extraction exceeds PDF_EXTRACTION_TIMEOUT.
+    """
+    with spooled_upload(uploaded_file) as path:
+        executor = get_executor()
+        if executor is None:
+            return extract_pdf_text(path, settings.PDF_MAX_PAGES, settings.PDF_MAX_CHARS)
+        try:
+            future = executor.submit(extract_pdf_text, path, settings.PDF_MAX_PAGES, settings.PDF_MAX_CHARS)
+            return future.result(timeout=settings.PDF_EXTRACTION_TIMEOUT)
+        except TimeoutError:
+            # The worker would keep parsing the PDF; kill the pool (failing the other extractions running in it)
+            reset_executor(executor, terminate=True)
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. on a malformed PDF); start a new pool for the next upload
+            reset_executor(executor)
+            raise
+
+
+def get_executor():
+    """ Returns the process-wide extraction pool (None if PDF_EXTRACTION_WORKERS is 0). """
+    global _executor
+    if not settings.PDF_EXTRACTION_WORKERS:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked, as forking a multi-threaded web worker is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def reset_executor(executor=None, terminate=False):
+    """
+    Shuts down the extraction pool; the next upload starts a new one.
+
+    :param executor: Only shut the pool down if it is still this one (another thread may have replaced it already).
+    :param terminate: Kill the worker processes instead of letting them finish their running extractions.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None or executor not in (None, _executor):
+            return
+        # The processes are dropped from the executor by shutdown
+        processes = list((_executor._processes or {}).values()) if terminate else []
+        _executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        _executor = None
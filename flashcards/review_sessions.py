@@ -0,0 +1,160 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .due_queue import due_reviews
+from .models import DailyUserStats, ReviewSession
+
+# Key in the Django session holding the id of the active ReviewSession
+SESSION_KEY = "review_session_id"
+
+# Number of cards fetched from the due queue at a time
+PREFETCH_SIZE = 20
+
+
+def start_review_session(user, flashcard_set=None, interleave=False):
+    """
+    Starts a review session over the cards that are due now, in one set or across all of the user's sets.
+    Any previous session of the user is discarded.
+
+    Without interleaving, the cards follow the due order across all sets (the index-ordered merge of the
+    sets' due queues). With interleaving, the session rotates between the sets, taking the next due card of
+    each set in turn. Sessions are capped by the remaining daily review limit (DAILY_REVIEW_LIMIT).
+
+    :return: The new ReviewSession, or None if no card is due (or the daily limit is reached).
+    """
+    now = timezone.now()
+    queue = due_reviews(user, now=now, flashcard_set=flashcard_set)
+
+    total_cards = queue.count()
+    remaining_today = get_remaining_daily_reviews(user)
+    if remaining_today is not None:
+        total_cards = min(total_cards, remaining_today)
+    if total_cards == 0:
+        return None
+
+    set_cursors = []
+    if interleave:
+        # Rotate between the sets in the order of their most overdue card
+        first_due_per_set = queue.order_by().values("flashcard__flashcard_set").annotate(
+            first_due=Min("next_review_date")
+        ).order_by("first_due", "flashcard__flashcard_set")
+        set_cursors = [[row["flashcard__flashcard_set"], None, None] for row in first_due_per_set]
+
+    ReviewSession.objects.filter(user=user).delete()
+    review_session = ReviewSession(
+        user=user,
+        flashcard_set=flashcard_set,
+        interleave=interleave,
+        started_at=now,
+        set_cursors=set_cursors,
+        total_cards=total_cards,
+    )
+    refill_buffer(review_session)
+    if not review_session.buffer:
+        return None
+
+    review_session.current_flashcard_id = review_session.buffer.pop(0)
+    review_session.save()
+    return review_session
+
+
+def get_remaining_daily_reviews(user):
+    """ Returns how many more cards the user may review today (None if there is no daily limit). """
+    if settings.DAILY_REVIEW_LIMIT is None:
+        return None
+    today_stats = DailyUserStats.objects.filter(user=user, date=timezone.now().date()).first()
+    return max(0, settings.DAILY_REVIEW_LIMIT - (today_stats.total_reviews if today_stats else 0))
+
+
+def get_review_session(request):
+    """ Returns the user's active ReviewSession referenced by the Django session (None if there is none). """
+    session_id = request.session.get(SESSION_KEY)
+    if session_id is None:
+        return None
+    return ReviewSession.objects.filter(id=session_id, user=request.user).first()
+
+
+def advance_review_session(review_session):
+    """
+    Moves the session to the next card. Cards come from the prefetched buffer, which is refilled from the due
+    queue when it runs empty. The session row is deleted when no card is left or its cap is reached.
+
+    :return: The id of the next flashcard, or None if the session is complete.
+    """
+    review_session.position += 1
+
+    if review_session.position >= review_session.total_cards:
+        review_session.delete()
+        return None
+
+    if not review_session.buffer:
+        refill_buffer(review_session)
+        if not review_session.buffer:
+            review_session.delete()
+            return None
+
+    review_session.current_flashcard_id = review_session.buffer.pop(0)
+    review_session.save(update_fields=[
+        "current_flashcard", "cursor_date", "cursor_flashcard_id", "set_cursors", "buffer", "position"
+    ])
+    return review_session.current_flashcard_id
+
+
+def refill_buffer(review_session):
+    """ Fetches the next batch of due cards of the session into its buffer and moves its cursors past them. """
+    if review_session.interleave:
+        _refill_interleaved(review_session)
+        return
+
+    after = None
+    if review_session.cursor_date is not None:
+        after = (review_session.cursor_date, review_session.cursor_flashcard_id)
+
+    batch = list(due_reviews(
+        review_session.user, now=review_session.started_at, flashcard_set=review_session.flashcard_set, after=after
+    ).values_list("next_review_date", "flashcard_id")[:PREFETCH_SIZE])
+
+    if batch:
+        review_session.cursor_date, review_session.cursor_flashcard_id = batch[-1]
+    review_session.buffer = [flashcard_id for _, flashcard_id in batch]
+
+
+def _refill_interleaved(review_session):
+    """
+    Fetches the next due cards of the sets at the front of the rotation, in round-robin order. Every set of the
+    turn is read with its own keyset query limited to its share of the batch (one query per set, as SQLite does
+    not allow LIMIT in the parts of a UNION), so a refill reads O(PREFETCH_SIZE) rows however large the sets'
+    backlogs are. Sets are moved to the back of the rotation, or dropped once they have no due card left.
+    """
+    rotation = review_session.set_cursors
+    turn, rest = rotation[:PREFETCH_SIZE], rotation[PREFETCH_SIZE:]
+    per_set = max(1, PREFETCH_SIZE // len(turn)) if turn else 0
+
+    cards_by_set = {}
+    for set_id, cursor_date, cursor_flashcard_id in turn:
+        after = None
+        if cursor_date is not None:
+            after = (datetime.fromisoformat(cursor_date), cursor_flashcard_id)
+        cards_by_set[set_id] = list(due_reviews(
+            review_session.user, now=review_session.started_at, flashcard_set=set_id, after=after
+        ).values_list("next_review_date", "flashcard_id")[:per_set])
+
+    buffer = []
+    for rank in range(per_set):
+        for set_id, _, _ in turn:
+            if rank < len(cards_by_set.get(set_id, [])):
+                buffer.append(cards_by_set[set_id][rank][1])
+
+    # Sets that returned a full batch may have more due cards; they go to the back of the rotation
+    requeued = []
+    for set_id, _, _ in turn:
+        cards = cards_by_set.get(set_id, [])
+        if len(cards) == per_set:
+            last_date, last_flashcard_id = cards[-1]
+            requeued.append([set_id, last_date.isoformat(), last_flashcard_id])
+
+    review_session.set_cursors = rest + requeued
+    review_session.buffer = buffer
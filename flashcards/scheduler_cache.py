@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fsrs import FSRS
+from .models import SchedulerParameters
+
+# --- Scheduler cache ---
+#
+# Every rating needs the user's FSRS calculator, which is built from their SchedulerParameters row. The calculators
+# are kept in two levels so that a review does not read the parameters again:
+# - a process-local LRU of constructed FSRS instances (SCHEDULER_LOCAL_CACHE_SIZE users), whose entries expire
+#   after SCHEDULER_LOCAL_CACHE_TTL seconds;
+# - the Django cache alias settings.SCHEDULER_CACHE_ALIAS, which must be shared between workers (Redis or
+#   Memcached). It stores the parameters rather than pickled FSRS instances, so a deploy changing the FSRS class
+#   never loads stale objects.
+#
+# Saving or deleting a user's SchedulerParameters drops both entries of that user in the shared cache and in the
+# saving process. Other processes still hold their local entry until it expires, so new parameters reach every
+# worker within the local TTL. A local-memory backend is not shared, so the invalidation cannot reach the entries of
+# other processes; its entries are therefore kept no longer than the local ones (see shared_cache_timeout).
+
+KEY_PREFIX = "flashcards:fsrs:"
+
+
+class LocalLRUCache:
+    """ Thread-safe least recently used cache whose entries expire after ttl seconds. """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the value stored under key, or None if it is missing or expired. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    """ Returns the process-wide LocalLRUCache, created from the SCHEDULER_LOCAL_CACHE_* settings on first use. """
+    global _local_cache
+    with _local_cache_lock:
+        if _local_cache is None:
+            _local_cache = LocalLRUCache(settings.SCHEDULER_LOCAL_CACHE_SIZE, settings.SCHEDULER_LOCAL_CACHE_TTL)
+        return _local_cache
+
+
+def get_shared_cache():
+    return caches[settings.SCHEDULER_CACHE_ALIAS]
+
+
+def shared_cache_timeout(cache):
+    """ Returns the timeout of the parameters in the shared cache, capped at the local TTL for per-process backends. """
+    if isinstance(cache, LocMemCache):
+        return min(settings.SCHEDULER_CACHE_TIMEOUT, settings.SCHEDULER_LOCAL_CACHE_TTL)
+    return settings.SCHEDULER_CACHE_TIMEOUT
+
+
+def scheduler_cache_key(user_id):
+    return f"{KEY_PREFIX}{user_id}"
+
+
+def get_cached_fsrs(user_id):
+    """
+    Returns the FSRS calculator of a user, built from their SchedulerParameters on a cache miss.
+
+    :param user_id: Primary key of the user.
+    :return: The user's FSRS instance, shared between callers; it must not be modified.
+    """
+    local_cache = get_local_cache()
+    fsrs = local_cache.get(user_id)
+    if fsrs is not None:
+        return fsrs
+
+    shared_cache = get_shared_cache()
+    key = scheduler_cache_key(user_id)
+    parameters = shared_cache.get(key)
+    if parameters is None:
+        row = SchedulerParameters.objects.filter(user_id=user_id).values("weights", "request_retention").first()
+        # An empty dictionary stands for the default parameters, so users without a row are cached as well
+        parameters = row or {}
+        shared_cache.set(key, parameters, shared_cache_timeout(shared_cache))
+
+    fsrs = FSRS(w=parameters.get("weights"), request_retention=parameters.get("request_retention"))
+    local_cache.set(user_id, fsrs)
+    return fsrs
+
+
+def invalidate_user_fsrs(user_id):
+    """ Drops the cached FSRS calculator of a user from the local and the shared cache. """
+    get_local_cache().delete(user_id)
+    get_shared_cache().delete(scheduler_cache_key(user_id))
+
+
+@receiver([post_save, post_delete], sender=SchedulerParameters)
+def invalidate_on_change(instance, **kwargs):
+    """
+    Drops the user's calculator when their parameters change. It is dropped again once the transaction commits,
+    as a review running concurrently may have cached the old parameters in the meantime.
+    """
+    user_id = instance.user_id
+    invalidate_user_fsrs(user_id)
+    transaction.on_commit(lambda: invalidate_user_fsrs(user_id))
+
+
+@receiver(setting_changed)
+def reset_local_cache(setting, **kwargs):
+    """ Drops the local cache when a SCHEDULER_* setting changes (override_settings in tests). """
+    global _local_cache
+    if setting.startswith("SCHEDULER_"):
+        with _local_cache_lock:
+            _local_cache = None
@@ -0,0 +1,115 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Flashcard
+
+# --- Flashcard search ---
+#
+# Full-text search over the fronts and backs of a user's cards. Every query term matches as a prefix ("photo" finds
+# "photosynthesis") and all terms must match. Results are ranked by relevance, fronts counting twice as much as backs.
+#
+# The index lives in the database and is updated by it on every insert, update and delete of a card (including bulk
+# inserts and cascading deletes), see migration 0009_flashcard_search_index:
+# - SQLite: an FTS5 table with the card contents, kept in sync by triggers, ranked with bm25.
+# - PostgreSQL: a GIN index over the cards' search vector, ranked with ts_rank.
+# Other databases fall back to an unindexed, unranked substring match.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+SQLITE_FTS_TABLE = "flashcards_flashcard_fts"
+
+# Text search configuration of the PostgreSQL index. "simple" does no stemming, as cards may be in any language.
+SEARCH_CONFIG = "simple"
+
+FRONT_WEIGHT = 2.0
+BACK_WEIGHT = 1.0
+
+_TERM = re.compile(r"\w+")
+
+
+def parse_query(query):
+    """ Splits a search query into lowercase terms; punctuation and search operators are ignored. """
+    return [term.lower() for term in _TERM.findall(query or "")]
+
+
+def search_flashcards(user, query, page=1, page_size=DEFAULT_PAGE_SIZE, flashcard_set=None):
+    """
+    Searches the fronts and backs of the user's cards.
+
+    :param user: Only the cards of this user's sets are searched.
+    :param query: Search terms; every term has to match the start of a word of the card.
+    :param page: 1-based page number.
+    :param page_size: Results per page, capped at MAX_PAGE_SIZE.
+    :param flashcard_set: Restrict the search to one set.
+    :return: Tuple (flashcards, has_next) with the page's flashcards, best match first.
+    :raises ValueError: If the page is smaller than 1.
+    """
+    if page < 1:
+        raise ValueError(f"Invalid page: {page}")
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    terms = parse_query(query)
+    if not terms:
+        return [], False
+
+    search = _BACKENDS.get(connection.vendor, _search_like)
+    # One extra row tells whether there is a next page
+    ids = search(user, terms, flashcard_set, limit=page_size + 1, offset=(page - 1) * page_size)
+
+    flashcards = Flashcard.objects.select_related("flashcard_set").in_bulk(ids[:page_size])
+    return [flashcards[id] for id in ids[:page_size] if id in flashcards], len(ids) > page_size
+
+
+def _search_sqlite(user, terms, flashcard_set, limit, offset):
+    # Quoted terms are matched literally, the trailing * makes them prefix queries
+    match = " ".join(f'"{term}"*' for term in terms)
+    set_filter = "AND flashcard.flashcard_set_id = %s" if flashcard_set is not None else ""
+    params = [match, user.id] + ([flashcard_set.id] if flashcard_set is not None else []) + [limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT flashcard.id
+            FROM {SQLITE_FTS_TABLE}
+            JOIN flashcards_flashcard AS flashcard ON flashcard.id = {SQLITE_FTS_TABLE}.rowid
+            JOIN flashcards_flashcardset AS flashcard_set ON flashcard_set.id = flashcard.flashcard_set_id
+            WHERE {SQLITE_FTS_TABLE} MATCH %s AND flashcard_set.created_by_id = %s {set_filter}
+            ORDER BY bm25({SQLITE_FTS_TABLE}, {FRONT_WEIGHT}, {BACK_WEIGHT}), flashcard.id
+            LIMIT %s OFFSET %s
+        """, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_postgresql(user, terms, flashcard_set, limit, offset):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # The filter uses the same expression as the GIN index, so the index is used; the weighted vector is only
+    # computed for the matches to rank them.
+    vector = SearchVector("front", "back", config=SEARCH_CONFIG)
+    weighted = (SearchVector("front", config=SEARCH_CONFIG, weight="A")
+                + SearchVector("back", config=SEARCH_CONFIG, weight="B"))
+    search_query = SearchQuery(" & ".join(f"{term}:*" for term in terms), config=SEARCH_CONFIG, search_type="raw")
+    # ts_rank weights in {D, C, B, A} order
+    weights = [0.0, 0.0, BACK_WEIGHT / FRONT_WEIGHT, 1.0]
+
+    flashcards = _user_flashcards(user, flashcard_set).annotate(search=vector).filter(search=search_query)
+    ranked = flashcards.annotate(rank=SearchRank(weighted, search_query, weights=weights)).order_by("-rank", "id")
+    return list(ranked.values_list("id", flat=True)[offset:offset + limit])
+
+
+def _search_like(user, terms, flashcard_set, limit, offset):
+    flashcards = _user_flashcards(user, flashcard_set)
+    for term in terms:
+        flashcards = flashcards.filter(Q(front__icontains=term) | Q(back__icontains=term))
+    return list(flashcards.order_by("id").values_list("id", flat=True)[offset:offset + limit])
+
+
+def _user_flashcards(user, flashcard_set):
+    flashcards = Flashcard.objects.filter(flashcard_set__created_by=user)
+    if flashcard_set is not None:
+        flashcards = flashcards.filter(flashcard_set=flashcard_set)
+    return flashcards
+
+
+_BACKENDS = {"sqlite": _search_sqlite, "postgresql": _search_postgresql}
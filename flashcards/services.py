@@ -1,61 +1,486 @@
-from datetime import datetime
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
-from .models import DailyUserStats, FlashcardSetProgress, Review
+from .fsrs import FSRS
+from .due_counts import apply_due_count_changes, due_count_changes, due_day, load_due_counts
+from .load_balancing import balance_interval, schedule_review
+from .models import (DailyUserStats, Flashcard, FlashcardSet, FlashcardSetProgress, Review, ReviewLog, ReviewState,
+                     SchedulerParameters)
+from .scheduler_cache import get_cached_fsrs
+
+# A card counts as mastered once its stability (in days) exceeds this value, maybe change number later
+MASTERY_STABILITY = 20
+
+
+def get_flashcard_sets_with_progress(user):
+    """
+    Returns the user's flashcard sets annotated with their card and review counts.
+
+    All counts are computed in a single aggregated query, so the cost of the dashboard
+    no longer grows with the number of sets:
+    - total_cards: number of cards in the set
+    - green_cards: cards the user has in the REVIEW state
+    - yellow_cards: cards the user has in the LEARNING or RELEARNING state
+    - first_card_id: id of the first card, used to link into the set
+    """
+    review_filter = Q(flashcard__review__user=user)
+    return FlashcardSet.objects.filter(created_by=user).select_related("created_by").annotate(
+        total_cards=Count("flashcard", distinct=True),
+        green_cards=Count(
+            "flashcard__review",
+            filter=review_filter & Q(flashcard__review__state=ReviewState.REVIEW)
+        ),
+        yellow_cards=Count(
+            "flashcard__review",
+            filter=review_filter & Q(flashcard__review__state__in=[ReviewState.LEARNING, ReviewState.RELEARNING])
+        ),
+        first_card_id=Min("flashcard__id"),
+    ).order_by("id")
+
+
+def calculate_progress_data(total_cards, green, yellow):
+    """
+    Converts card counts into the green/yellow/gray percentages used by the progress bar.
+    """
+    progress_data = {
+        "green": 0,
+        "yellow": 0,
+        "gray": 0,
+    }
+
+    if total_cards > 0:
+        progress_data["green"] = int((green / total_cards) * 100)
+        progress_data["yellow"] = int((yellow / total_cards) * 100)
+        progress_data["gray"] = max(0, 100 - (progress_data["green"] + progress_data["yellow"]))
+
+    return progress_data
+
+
+def get_previous_streak(user, date):
+    """
+    Returns the streak carried over from the day before the given date (0 if that day had no reviews).
+    """
+    previous_stats = DailyUserStats.objects.filter(
+        user=user,
+        date=date - timedelta(days=1),
+        total_reviews__gt=0
+    ).only("streak").first()
+    return previous_stats.streak if previous_stats else 0
+
+
+def get_current_streak(daily_stats):
+    """
+    Returns the current study streak, read from today's DailyUserStats row (None if there is none).
+    """
+    if daily_stats is None or daily_stats.total_reviews == 0:
+        return 0
+    return daily_stats.streak
+
+
+def backfill_streaks(user=None, batch_size=1000):
+    """
+    Recomputes the persisted streak of every DailyUserStats row from the review history.
+
+    Rows are streamed per user in date order, and only rows whose streak changed are written back.
+    :param user: Restrict the backfill to this user (all users if None).
+    :param batch_size: Number of rows written per bulk_update.
+    :return: Number of rows that were updated.
+    """
+    stats = DailyUserStats.objects.order_by("user_id", "date").only("id", "user_id", "date", "total_reviews", "streak")
+    if user is not None:
+        stats = stats.filter(user=user)
+
+    updated = 0
+    pending = []
+    previous_user_id, previous_date, streak = None, None, 0
+
+    for daily_stats in stats.iterator(chunk_size=batch_size):
+        if daily_stats.total_reviews == 0:
+            streak = 0
+        elif (daily_stats.user_id == previous_user_id and previous_date is not None
+              and daily_stats.date - previous_date == timedelta(days=1)):
+            streak += 1
+        else:
+            streak = 1
+
+        previous_user_id = daily_stats.user_id
+        previous_date = daily_stats.date if daily_stats.total_reviews > 0 else None
+
+        if daily_stats.streak != streak:
+            daily_stats.streak = streak
+            pending.append(daily_stats)
+
+        if len(pending) >= batch_size:
+            updated += DailyUserStats.objects.bulk_update(pending, ["streak"])
+            pending = []
+
+    if pending:
+        updated += DailyUserStats.objects.bulk_update(pending, ["streak"])
+    return updated
+
+
+def get_user_fsrs(user):
+    """
+    Returns the FSRS calculator for the user, built from their optimized parameters when they have any.
+    The calculator is cached per user and shared between callers (see scheduler_cache.py).
+    """
+    return get_cached_fsrs(user.pk)
+
+
+def update_scheduler_parameters(user, weights=None, request_retention=None):
+    """
+    Stores FSRS parameters for the user, so later ratings are scheduled with them. Parameters left as None keep
+    their stored value (the defaults for users without SchedulerParameters). Due dates are not changed; run
+    reschedule_reviews afterwards.
+
+    :return: The user's SchedulerParameters.
+    """
+    parameters = SchedulerParameters.objects.filter(user=user).first()
+    if parameters is None:
+        parameters = SchedulerParameters(user=user, weights=FSRS.DEFAULT_PARAMS)
+    if weights is not None:
+        parameters.weights = list(weights)
+    if request_retention is not None:
+        parameters.request_retention = request_retention
+    # Saving drops the user's cached FSRS calculator (see scheduler_cache.py)
+    parameters.save()
+    return parameters
+
+
+def submit_review(user, flashcard, rating):
+    """
+    Records a rating for a flashcard: runs the FSRS calculation and updates the review, the daily stats
+    and the set progress in a single transaction.
+
+    Only the user's Review row for the card is locked (SELECT ... FOR UPDATE), so concurrent ratings of the
+    same card (double-clicks, parallel tabs) are serialized. The stats rows are never read; they are upserted
+    and changed with F() increments, so concurrent ratings of different cards do not lose updates.
+    Intervals of review cards are balanced over the user's daily due counts (see load_balancing.py).
+
+    :param user: The user rating the card.
+    :param flashcard: The Flashcard being rated.
+    :param rating: The rating from 1 (Again) to 4 (Easy).
+    :return: The updated Review.
+    """
+    current_time = now()
+
+    with transaction.atomic():
+        review = Review.objects.select_for_update().filter(user=user, flashcard=flashcard).first()
+        if review is None:
+            # Create the row without a get_or_create race; a concurrent insert is simply ignored
+            Review.objects.bulk_create([Review(
+                user=user,
+                flashcard=flashcard,
+                state=ReviewState.NEW,
+                stability=0.0,  # Initial S before first calc
+                difficulty=FSRS.DEFAULT_PARAMS[4],  # Initial D often set near w[4]
+                next_review_date=current_time  # Make it appear immediately
+            )], ignore_conflicts=True)
+            review = Review.objects.select_for_update().get(user=user, flashcard=flashcard)
+
+        # A row created above is not counted in the due counts yet, unlike one a concurrent rating created first
+        counted_due_date = review.next_review_date if review.next_review_date != current_time else None
+        previous_stability = review.stability
 
-def update_stats_after_review(review: Review, performance_correct: bool = True):
+        ReviewLog.objects.create(
+            user=user,
+            flashcard=flashcard,
+            rating=rating,
+            state=review.state,
+            stability=review.stability,
+            difficulty=review.difficulty,
+            elapsed_days=(
+                (current_time - review.last_review_date).total_seconds() / (24 * 60 * 60)
+                if review.last_review_date else None
+            ),
+            reviewed_at=current_time,
+        )
+
+        fsrs = get_user_fsrs(user)
+        result = fsrs.update_state(
+            current_state=review.state,
+            current_s=review.stability,
+            current_d=review.difficulty,
+            last_review_date=review.last_review_date,
+            now=current_time,
+            app_rating=rating
+        )
+
+        interval = result["interval"]
+        if result["new_state"] == ReviewState.REVIEW:
+            interval = schedule_review(fsrs, review, current_time, interval, counted_due_date)
+
+        # The row is locked, so the counters can be incremented in Python
+        review.stability = result["new_s"]
+        review.difficulty = result["new_d"]
+        review.state = result["new_state"]
+        review.last_review_date = current_time
+        review.next_review_date = current_time + timedelta(days=interval)
+        review.repetitions += 1
+        if rating == 1:
+            review.lapses += 1
+
+        review.save(update_fields=[
+            "stability", "difficulty", "state", "last_review_date", "next_review_date", "repetitions", "lapses"
+        ])
+
+        # Update daily stats and set progress (rating > 2, maybe change number later)
+        update_stats_after_review(review, performance_correct=(rating > 2), previous_stability=previous_stability)
+        apply_due_count_changes(
+            due_count_changes(user.id, flashcard.flashcard_set_id, counted_due_date, review.next_review_date)
+        )
+
+    return review
+
+
+def update_stats_after_review(review: Review, performance_correct: bool = True, previous_stability: float = 0.0):
     """
     Call this after a Review is saved. Optionally pass whether the answer was correct (if you're tracking it).
+
+    previous_stability is the card's stability before this review. It is used to detect the card crossing
+    the mastery threshold in either direction, so the set progress counters can be updated by a delta.
+
+    Both stats rows are updated with F() increments and created with an upsert when missing, so this is
+    safe to run concurrently for the same user.
     """
-    today = now().date()
+    current_time = now()
+    today = current_time.date()
 
     # DAILY STATS
-    daily_stats, _ = DailyUserStats.objects.get_or_create(
-        user=review.user,
-        date=today,
-    )
+    daily_increments = {
+        "total_reviews": F("total_reviews") + 1,
+        "correct_reviews": F("correct_reviews") + int(performance_correct),
+        "new_cards_studied": F("new_cards_studied") + int(review.repetitions == 1),
+        "cards_mastered": F("cards_mastered") + int(is_mastered(review.stability)),
+    }
+    daily_stats = DailyUserStats.objects.filter(user=review.user, date=today)
+
+    if not daily_stats.update(**daily_increments):
+        # The first review of the day continues yesterday's streak (or starts a new one)
+        DailyUserStats.objects.bulk_create(
+            [DailyUserStats(user=review.user, date=today, streak=get_previous_streak(review.user, today) + 1)],
+            update_conflicts=True,
+            unique_fields=["user", "date"],
+            update_fields=["streak"],
+        )
+        daily_stats.update(**daily_increments)
 
-    daily_stats.total_reviews += 1
+    # SET PROGRESS
+    flashcard_set_id = review.flashcard.flashcard_set_id
+    set_progress = FlashcardSetProgress.objects.filter(user=review.user, flashcard_set_id=flashcard_set_id)
 
-    if performance_correct:
-        daily_stats.correct_reviews += 1
+    progress_increments = {"last_reviewed": current_time}
 
     if review.repetitions == 1:
-        daily_stats.new_cards_studied += 1
+        progress_increments["cards_reviewed"] = F("cards_reviewed") + 1
 
-    # review.stability > 20, maybe change number later
-    if review.stability > 20:
-        daily_stats.cards_mastered += 1
+    mastered_delta = int(is_mastered(review.stability)) - int(is_mastered(previous_stability))
+    if mastered_delta:
+        progress_increments["cards_mastered"] = F("cards_mastered") + mastered_delta
 
-    daily_stats.save()
+    if not set_progress.update(**progress_increments):
+        # First review of this set: count everything except this card once, then add this card's
+        # contribution like any other delta. The counters are maintained by deltas afterward.
+        total_cards, cards_reviewed, cards_mastered = count_set_progress(
+            review.user, flashcard_set_id, exclude_flashcard_id=review.flashcard_id
+        )
+        FlashcardSetProgress.objects.bulk_create([FlashcardSetProgress(
+            user=review.user,
+            flashcard_set_id=flashcard_set_id,
+            total_cards=total_cards,
+            cards_reviewed=cards_reviewed,
+            cards_mastered=cards_mastered,
+        )], ignore_conflicts=True)
+        set_progress.update(
+            last_reviewed=current_time,
+            cards_reviewed=F("cards_reviewed") + 1,
+            cards_mastered=F("cards_mastered") + int(is_mastered(review.stability)),
+        )
 
-    # SET PROGRESS
-    flashcard_set = review.flashcard.flashcard_set
-    set_progress, _ = FlashcardSetProgress.objects.get_or_create(
-        user=review.user,
-        flashcard_set=flashcard_set
+
+def is_mastered(stability):
+    """ A card counts as mastered once its stability exceeds MASTERY_STABILITY days. """
+    return stability > MASTERY_STABILITY
+
+
+def count_set_progress(user, flashcard_set_id, exclude_flashcard_id=None):
+    """
+    Counts the cards of a set and how many of them the user has reviewed and mastered.
+
+    :param exclude_flashcard_id: Leave the user's review of this card out of the review counts.
+    :return: Tuple (total_cards, cards_reviewed, cards_mastered)
+    """
+    total_cards = Flashcard.objects.filter(flashcard_set_id=flashcard_set_id).count()
+    reviews = Review.objects.filter(user=user, flashcard__flashcard_set_id=flashcard_set_id)
+    if exclude_flashcard_id is not None:
+        reviews = reviews.exclude(flashcard_id=exclude_flashcard_id)
+    review_counts = reviews.aggregate(
+        reviewed=Count("id"),
+        mastered=Count("id", filter=Q(stability__gt=MASTERY_STABILITY)),
     )
+    return total_cards, review_counts["reviewed"], review_counts["mastered"]
+
+
+def register_flashcards_added(flashcard_set, count=1):
+    """
+    Call this after creating flashcards in a set to keep the set progress counters in sync.
+    """
+    FlashcardSetProgress.objects.filter(flashcard_set=flashcard_set).update(total_cards=F("total_cards") + count)
+
+
+def register_reviews_imported(user, flashcard_set, reviews):
+    """
+    Call this after creating reviews of a set's cards without submit_review (e.g. when importing a deck)
+    to keep the user's set progress counters and due counts in sync.
+    """
+    if not reviews:
+        return
+    FlashcardSetProgress.objects.filter(user=user, flashcard_set=flashcard_set).update(
+        cards_reviewed=F("cards_reviewed") + len(reviews),
+        cards_mastered=F("cards_mastered") + sum(is_mastered(review.stability) for review in reviews),
+    )
+    due_changes = Counter()
+    for review in reviews:
+        due_changes.update(due_count_changes(user.id, flashcard_set.id, None, review.next_review_date))
+    apply_due_count_changes(due_changes)
+
+
+def register_flashcard_removed(flashcard):
+    """
+    Call this before deleting a flashcard to remove it (and the users' reviews of it) from the
+    set progress counters and the due counts.
+    """
+    progress = FlashcardSetProgress.objects.filter(flashcard_set_id=flashcard.flashcard_set_id)
+    progress.filter(total_cards__gt=0).update(total_cards=F("total_cards") - 1)
+
+    due_changes = Counter()
+    reviews = Review.objects.filter(flashcard=flashcard).values_list("user_id", "stability", "next_review_date")
+    for user_id, stability, next_review_date in reviews:
+        updates = {"cards_reviewed": F("cards_reviewed") - 1}
+        if is_mastered(stability):
+            updates["cards_mastered"] = F("cards_mastered") - 1
+        progress.filter(user_id=user_id, cards_reviewed__gt=0).update(**updates)
+        due_changes.update(due_count_changes(user_id, flashcard.flashcard_set_id, next_review_date, None))
+    apply_due_count_changes(due_changes)
+
+
+def reconcile_set_progress(batch_size=1000):
+    """
+    Recounts every FlashcardSetProgress row and repairs the counters that drifted from the actual data.
+
+    :param batch_size: Number of rows read and written per batch.
+    :return: Number of rows that were repaired.
+    """
+    set_reviews = Review.objects.filter(
+        user=OuterRef("user"),
+        flashcard__flashcard_set=OuterRef("flashcard_set")
+    ).order_by().values("user")
+
+    progress_rows = FlashcardSetProgress.objects.annotate(
+        actual_total=Coalesce(Subquery(
+            Flashcard.objects.filter(flashcard_set=OuterRef("flashcard_set"))
+            .order_by().values("flashcard_set").annotate(count=Count("id")).values("count")
+        ), 0),
+        actual_reviewed=Coalesce(Subquery(
+            set_reviews.annotate(count=Count("id")).values("count")
+        ), 0),
+        actual_mastered=Coalesce(Subquery(
+            set_reviews.filter(stability__gt=MASTERY_STABILITY).annotate(count=Count("id")).values("count")
+        ), 0),
+    ).order_by("id")
+
+    repaired = 0
+    pending = []
+    for set_progress in progress_rows.iterator(chunk_size=batch_size):
+        actual = (set_progress.actual_total, set_progress.actual_reviewed, set_progress.actual_mastered)
+        if (set_progress.total_cards, set_progress.cards_reviewed, set_progress.cards_mastered) != actual:
+            set_progress.total_cards, set_progress.cards_reviewed, set_progress.cards_mastered = actual
+            pending.append(set_progress)
+
+        if len(pending) >= batch_size:
+            repaired += FlashcardSetProgress.objects.bulk_update(
+                pending, ["total_cards", "cards_reviewed", "cards_mastered"]
+            )
+            pending = []
+
+    if pending:
+        repaired += FlashcardSetProgress.objects.bulk_update(
+            pending, ["total_cards", "cards_reviewed", "cards_mastered"]
+        )
+    return repaired
+
+
+def reschedule_reviews(user=None, fsrs=None, chunk_size=1000):
+    """
+    Recomputes the next_review_date of stored reviews after the FSRS parameters or the requested retention changed.
+
+    Reviews are streamed in keyset-paginated chunks ordered by id. Each chunk is locked, recalculated with the
+    batch FSRS API and written back with bulk_update in its own short transaction, so ratings submitted during
+    the run only wait for the current chunk and are never overwritten with stale dates.
+    Only cards in the REVIEW state are rescheduled; learning steps are short and keep their due date.
+    The new intervals are balanced over each user's due counts, which are loaded once per user and kept up to
+    date in memory during the run (see load_balancing.py).
+
+    :param user: Restrict the run to this user's reviews (all users if None).
+    :param fsrs: The FSRS instance holding the new parameters (each user's own parameters if None).
+    :param chunk_size: Number of reviews read and written per transaction.
+    :return: Number of reviews whose next_review_date changed.
+    """
+    if fsrs is None:
+        users = [user] if user is not None else get_user_model().objects.filter(
+            id__in=Review.objects.values("user_id")
+        ).order_by("id")
+        return sum(reschedule_reviews(user, get_user_fsrs(user), chunk_size) for user in users)
 
-    set_progress.last_reviewed = now()
+    reviews = Review.objects.filter(state=ReviewState.REVIEW, last_review_date__isnull=False)
+    if user is not None:
+        reviews = reviews.filter(user=user)
+    reviews = reviews.select_related("flashcard").only(
+        "id", "user", "flashcard__flashcard_set", "repetitions", "stability", "last_review_date", "next_review_date"
+    ).order_by("id")
 
-    # Update total cards
-    total_cards = flashcard_set.flashcard_set.all().count()
-    set_progress.total_cards = total_cards
+    rescheduled = 0
+    last_id = 0
+    due_counts_by_user = {}
+    while True:
+        with transaction.atomic():
+            chunk = list(reviews.select_for_update(of=("self",)).filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
 
-    # Count reviewed cards
-    reviewed_cards = Review.objects.filter(
-        user=review.user,
-        flashcard__flashcard_set=flashcard_set
-    ).count()
+            intervals = fsrs.review_intervals_batch(np.array([review.stability for review in chunk]))
 
-    set_progress.cards_reviewed = reviewed_cards
+            changed = []
+            due_changes = Counter()
+            for review, interval in zip(chunk, intervals.tolist()):
+                if settings.LOAD_BALANCING:
+                    if review.user_id not in due_counts_by_user:
+                        due_counts_by_user[review.user_id] = Counter(load_due_counts(review.user_id))
+                    due_counts = due_counts_by_user[review.user_id]
+                    due_counts[due_day(review.next_review_date)] -= 1
+                    interval = balance_interval(fsrs, int(interval), review.last_review_date, due_counts,
+                                                seed=f"{review.flashcard_id}:{review.repetitions}")
 
-    # Count mastered cards
-    mastered_cards = Review.objects.filter(
-        user=review.user,
-        flashcard__flashcard_set=flashcard_set,
-        stability__gt=20  # maybe change number later
-    ).count()
+                next_review_date = review.last_review_date + timedelta(days=interval)
+                if settings.LOAD_BALANCING:
+                    due_counts[due_day(next_review_date)] += 1
+                if next_review_date != review.next_review_date:
+                    due_changes.update(due_count_changes(
+                        review.user_id, review.flashcard.flashcard_set_id, review.next_review_date, next_review_date
+                    ))
+                    review.next_review_date = next_review_date
+                    changed.append(review)
 
-    set_progress.cards_mastered = mastered_cards
+            if changed:
+                rescheduled += Review.objects.bulk_update(changed, ["next_review_date"])
+                apply_due_count_changes(due_changes)
 
-    set_progress.save()
+    return rescheduled
@@ -0,0 +1,176 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .fsrs import FSRS
+from .models import Flashcard, Review, ReviewLog, ReviewState
+from .services import get_user_fsrs
+
+# --- Workload simulator ---
+#
+# Replays the FSRS transition model (FSRS.update_state_batch) forward day by day over a user's current review
+# states. Every card due on a day is reviewed that day (up to the daily review limit, earliest due first). It is
+# recalled with its retrievability at that time; the rating of a recalled card and the first rating of a new card
+# are sampled from the user's review log. Cards rated Again come back the same day, like in a review session.
+# New cards are introduced at the rate the user started new cards over the last NEW_CARD_RATE_DAYS days.
+
+DEFAULT_DAYS = 30
+
+# Rating distributions used without review history, and the weight (in reviews) they keep once there is history
+DEFAULT_FIRST_RATINGS = np.array([0.2, 0.1, 0.6, 0.1])  # Again, Hard, Good, Easy
+DEFAULT_SUCCESS_RATINGS = np.array([0.15, 0.75, 0.1])  # Hard, Good, Easy
+PRIOR_REVIEWS = 10
+
+NEW_CARD_RATE_DAYS = 30
+
+# Reviews of the same card on one day (Again and learning steps) after which it waits for the next day
+MAX_REVIEWS_PER_CARD_PER_DAY = 10
+
+# Rows written by services.submit_review per rating (review log, review, daily stats, set progress and the due
+# counts of the previous and the new due day), plus the review row inserted on the first rating of a card
+WRITES_PER_REVIEW = 6
+WRITES_PER_NEW_CARD = 1
+
+
+def simulate_workload(fsrs, states, stability, difficulty, last_review, due, days=DEFAULT_DAYS,
+                      first_ratings=DEFAULT_FIRST_RATINGS, success_ratings=DEFAULT_SUCCESS_RATINGS,
+                      new_cards_per_day=0.0, unseen_cards=0, daily_limit=None, rng=None):
+    """
+    Simulates the reviews of the coming days.
+
+    Times are in days relative to the start of the simulation; day t covers [t, t + 1).
+
+    :param fsrs: The FSRS calculator of the user.
+    :param states: Integer state codes (FSRS.STATE_CODES) of the reviewed cards.
+    :param stability: Stabilities of the cards.
+    :param difficulty: Difficulties of the cards.
+    :param last_review: Times of the last reviews (negative), NaN for cards that were never reviewed.
+    :param due: Due times of the cards (negative if overdue).
+    :param first_ratings: Probabilities of the ratings 1-4 of a new card.
+    :param success_ratings: Probabilities of the ratings 2-4 of a recalled card.
+    :param new_cards_per_day: New cards started per day.
+    :param unseen_cards: Cards that were never reviewed, available as new cards.
+    :param daily_limit: Maximum number of reviews per day (None for unlimited).
+    :param rng: numpy Generator used to sample the ratings.
+    :return: Dictionary of arrays with one entry per day: "due" (cards due at the start of the day, including
+             the backlog), "reviews" (ratings, including repeated reviews of the same card), "new" (new cards
+             started) and "writes" (estimated database rows written).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    new_count = min(unseen_cards, int(new_cards_per_day * days))
+    new_code = FSRS.STATE_CODES[ReviewState.NEW]
+
+    # New cards are appended to the reviewed ones and become due on the day they are introduced
+    introduced = np.floor(np.arange(new_count) / new_cards_per_day) if new_count else np.empty(0)
+    states = np.concatenate((np.asarray(states, dtype=np.int64), np.full(new_count, new_code)))
+    stability = np.concatenate((np.asarray(stability, dtype=np.float64), np.zeros(new_count)))
+    difficulty = np.concatenate((np.asarray(difficulty, dtype=np.float64), np.full(new_count, fsrs.w[4])))
+    last_review = np.concatenate((np.asarray(last_review, dtype=np.float64), np.full(new_count, np.nan)))
+    due = np.concatenate((np.asarray(due, dtype=np.float64), introduced))
+
+    forecast = {key: np.zeros(days, dtype=np.int64) for key in ("due", "reviews", "new", "writes")}
+    forecast["new"][:] = np.bincount(introduced.astype(np.int64), minlength=days)[:days]
+
+    for day in range(days):
+        end = day + 1
+        forecast["due"][day] = np.count_nonzero(due < end)
+        remaining = daily_limit if daily_limit is not None else float("inf")
+
+        for _ in range(MAX_REVIEWS_PER_CARD_PER_DAY):
+            cards = np.flatnonzero(due < end)
+            if not len(cards) or remaining <= 0:
+                break
+            if len(cards) > remaining:
+                cards = cards[np.argsort(due[cards], kind="stable")[:remaining]]
+            remaining -= len(cards)
+
+            # Overdue cards are reviewed at the start of the day, the others when they become due
+            now = np.maximum(due[cards], day)
+            elapsed = now - last_review[cards]
+            ratings = _sample_ratings(fsrs, states[cards], stability[cards], elapsed, first_ratings,
+                                      success_ratings, rng)
+            result = fsrs.update_state_batch(states[cards], stability[cards], difficulty[cards], elapsed, ratings)
+
+            states[cards] = result["new_state"]
+            stability[cards] = result["new_s"]
+            difficulty[cards] = result["new_d"]
+            last_review[cards] = now
+            due[cards] = now + result["interval"]
+            forecast["reviews"][day] += len(cards)
+
+    forecast["writes"] = forecast["reviews"] * WRITES_PER_REVIEW + forecast["new"] * WRITES_PER_NEW_CARD
+    return forecast
+
+
+def _sample_ratings(fsrs, states, stability, elapsed, first_ratings, success_ratings, rng):
+    is_new = (states == FSRS.STATE_CODES[ReviewState.NEW]) | np.isnan(elapsed)
+    retrievability = fsrs._calc_retrievability_array(stability, np.where(is_new, 0.0, elapsed))
+    recalled = rng.random(len(states)) < retrievability
+
+    ratings = np.where(recalled, rng.choice([2, 3, 4], size=len(states), p=success_ratings), 1)
+    return np.where(is_new, rng.choice([1, 2, 3, 4], size=len(states), p=first_ratings), ratings)
+
+
+def rating_distributions(user):
+    """
+    Returns the user's rating probabilities from their review log, smoothed towards the defaults.
+
+    :return: Tuple (first_ratings, success_ratings) with the probabilities of the ratings 1-4 of new cards
+             and of the ratings 2-4 of recalled cards.
+    """
+    first_counts = np.zeros(4)
+    success_counts = np.zeros(3)
+    rows = ReviewLog.objects.filter(user=user).values_list("state", "rating").annotate(count=Count("id"))
+    for state, rating, count in rows.order_by():
+        if state == ReviewState.NEW:
+            first_counts[rating - 1] += count
+        elif rating > 1:
+            success_counts[rating - 2] += count
+
+    first_ratings = first_counts + DEFAULT_FIRST_RATINGS * PRIOR_REVIEWS
+    success_ratings = success_counts + DEFAULT_SUCCESS_RATINGS * PRIOR_REVIEWS
+    return first_ratings / first_ratings.sum(), success_ratings / success_ratings.sum()
+
+
+def new_card_rate(user, now=None):
+    """ Returns the number of new cards the user started per day over the last NEW_CARD_RATE_DAYS days. """
+    since = (now or timezone.now()) - timedelta(days=NEW_CARD_RATE_DAYS)
+    started = ReviewLog.objects.filter(user=user, state=ReviewState.NEW, reviewed_at__gte=since).count()
+    return started / NEW_CARD_RATE_DAYS
+
+
+def forecast_user_workload(user, days=DEFAULT_DAYS, now=None, new_cards_per_day=None, seed=None):
+    """
+    Forecasts the user's daily reviews from their current review states (see simulate_workload).
+
+    :param now: Start of the simulation (defaults to the current time).
+    :param new_cards_per_day: New cards started per day (default: the user's recent rate, see new_card_rate).
+    :param seed: Seed of the rating samples, for reproducible forecasts.
+    :return: The forecast of simulate_workload.
+    """
+    now = now or timezone.now()
+    day = timedelta(days=1)
+
+    rows = Review.objects.filter(user=user).values_list(
+        "state", "stability", "difficulty", "last_review_date", "next_review_date"
+    )
+    states, stability, difficulty, last_review, due = [], [], [], [], []
+    for state, s, d, last_review_date, next_review_date in rows.iterator(chunk_size=2000):
+        states.append(FSRS.STATE_CODES.get(state, 0))
+        stability.append(s)
+        difficulty.append(d)
+        last_review.append((last_review_date - now) / day if last_review_date else np.nan)
+        due.append((next_review_date - now) / day)
+
+    unseen_cards = Flashcard.objects.filter(flashcard_set__created_by=user).exclude(review__user=user).count()
+    first_ratings, success_ratings = rating_distributions(user)
+
+    return simulate_workload(
+        get_user_fsrs(user), states, stability, difficulty, last_review, due, days=days,
+        first_ratings=first_ratings, success_ratings=success_ratings,
+        new_cards_per_day=new_card_rate(user, now) if new_cards_per_day is None else new_cards_per_day,
+        unseen_cards=unseen_cards, daily_limit=settings.DAILY_REVIEW_LIMIT, rng=np.random.default_rng(seed),
+    )
@@ -1,7 +1,57 @@
-from django.test import TestCase, Client
+import csv
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from contextlib import closing
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+import fitz
+import numpy as np
+import requests
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, DatabaseError, OperationalError
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from .models import FlashcardSet, Flashcard
+from django.utils import timezone
+from .chunking import estimate_tokens, generate_in_chunks, merge_flashcards, split_into_chunks
+from .dedup import DuplicateIndex, find_duplicates
+from .due_counts import get_due_counts_by_set, get_due_forecast
+from .exporters import REVIEW_FIELDS, export_rows
+from .fsrs import FSRS
+from .models import (FlashcardSet, Flashcard, Review, ReviewState, DailyUserStats, FlashcardSetProgress, ReviewLog,
+                     SchedulerParameters, ReviewSession, GenerationJob, GenerationJobStatus, DailyDueCount)
+from .gemini import CircuitBreaker, CircuitOpenError, GeminiClient, get_client
+from .generation_cache import (generation_cache_key, get_generation_cache, get_cached_flashcards, cache_flashcards,
+                               get_cache_stats, STATS_LOG_INTERVAL)
+from .importers import import_cards
+from .jobs import MAX_ATTEMPTS, RETRY_DELAY, claim_next_job, heartbeat, requeue_stale_jobs, run_worker
+from .optimizer import ReviewHistory, fit_weights, log_loss
+from .pdf_extraction import extract_pdf_text, extract_text_from_upload, get_executor, spooled_upload
+from .scheduler_cache import LocalLRUCache, get_local_cache, get_shared_cache, shared_cache_timeout
+from .review_sessions import refill_buffer
+from .search import _search_like, search_flashcards
+from .load_balancing import balance_interval, fuzz_range
+from .services import (get_flashcard_sets_with_progress, get_user_fsrs, update_stats_after_review, submit_review,
+                       register_flashcard_removed, register_reviews_imported, reschedule_reviews)
+from .simulator import (WRITES_PER_NEW_CARD, WRITES_PER_REVIEW, forecast_user_workload, rating_distributions,
+                        simulate_workload)
+from .utils import create_flashcards_from_ai_data
 
 
 class FlashcardSetModelTest(TestCase):
@@ -133,3 +183,1750 @@ class FlashcardViewsTest(TestCase):
         response = self.client.post(reverse("delete-flashcard-set", args=[self.flashcard_set.id]))
         self.assertEqual(response.status_code, 200)
         self.assertFalse(FlashcardSet.objects.filter(id=self.flashcard_set.id).exists())
+
+
+class FlashcardSetProgressQueryTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+
+    def create_set_with_reviews(self, index):
+        flashcard_set = FlashcardSet.objects.create(
+            title=f"Set {index}", description="Description", created_by=self.user
+        )
+        states = [ReviewState.REVIEW, ReviewState.LEARNING, ReviewState.RELEARNING, None]
+        for state in states:
+            flashcard = Flashcard.objects.create(front="Front", back="Back", flashcard_set=flashcard_set)
+            if state:
+                Review.objects.create(
+                    user=self.user, flashcard=flashcard, state=state, next_review_date=timezone.now()
+                )
+        return flashcard_set
+
+    def count_index_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("index"))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_progress_counts(self):
+        self.create_set_with_reviews(1)
+        flashcard_set = get_flashcard_sets_with_progress(self.user).get()
+        self.assertEqual(flashcard_set.total_cards, 4)
+        self.assertEqual(flashcard_set.green_cards, 1)
+        self.assertEqual(flashcard_set.yellow_cards, 2)
+
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context["flashcard_sets"][0].progress, {"green": 25, "yellow": 50, "gray": 25})
+
+    def test_index_query_count_is_constant(self):
+        self.create_set_with_reviews(1)
+        queries_with_one_set = self.count_index_queries()
+
+        for index in range(2, 12):
+            self.create_set_with_reviews(index)
+        self.assertEqual(self.count_index_queries(), queries_with_one_set)
+
+
+class StudyStreakTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.today = timezone.now().date()
+        flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        flashcard = Flashcard.objects.create(front="Front", back="Back", flashcard_set=flashcard_set)
+        self.review = Review.objects.create(
+            user=self.user, flashcard=flashcard, repetitions=1, next_review_date=timezone.now()
+        )
+
+    def test_streak_carries_over_from_yesterday(self):
+        DailyUserStats.objects.create(
+            user=self.user, date=self.today - timedelta(days=1), total_reviews=3, streak=4
+        )
+        update_stats_after_review(self.review)
+        update_stats_after_review(self.review)
+
+        today_stats = DailyUserStats.objects.get(user=self.user, date=self.today)
+        self.assertEqual(today_stats.streak, 5)
+        self.assertEqual(self.client.get(reverse("index")).context["streak"], 5)
+
+    def test_streak_restarts_after_gap(self):
+        DailyUserStats.objects.create(
+            user=self.user, date=self.today - timedelta(days=2), total_reviews=3, streak=4
+        )
+        update_stats_after_review(self.review)
+        self.assertEqual(DailyUserStats.objects.get(user=self.user, date=self.today).streak, 1)
+
+    def test_no_streak_without_reviews_today(self):
+        DailyUserStats.objects.create(
+            user=self.user, date=self.today - timedelta(days=1), total_reviews=3, streak=4
+        )
+        self.assertEqual(self.client.get(reverse("index")).context["streak"], 0)
+
+    def test_backfill_streaks_command(self):
+        for days_ago in [5, 3, 2, 1, 0]:
+            DailyUserStats.objects.create(user=self.user, date=self.today - timedelta(days=days_ago), total_reviews=1)
+
+        call_command("backfill_streaks", stdout=StringIO())
+
+        streaks = list(DailyUserStats.objects.filter(user=self.user).order_by("date").values_list("streak", flat=True))
+        self.assertEqual(streaks, [1, 1, 2, 3, 4])
+
+
+class FlashcardSetProgressCounterTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        self.flashcards = [
+            Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=self.flashcard_set)
+            for i in range(3)
+        ]
+
+    def rate(self, flashcard, rating):
+        self.client.post(reverse("flashcard-detail", args=[flashcard.id]), {"rating": rating})
+
+    def get_progress(self):
+        return FlashcardSetProgress.objects.get(user=self.user, flashcard_set=self.flashcard_set)
+
+    def assertProgress(self, total_cards, cards_reviewed, cards_mastered):
+        progress = self.get_progress()
+        self.assertEqual(
+            (progress.total_cards, progress.cards_reviewed, progress.cards_mastered),
+            (total_cards, cards_reviewed, cards_mastered)
+        )
+
+    def test_counters_follow_reviews_and_card_changes(self):
+        self.rate(self.flashcards[0], 3)
+        self.assertProgress(3, 1, 0)
+
+        self.rate(self.flashcards[0], 3)
+        self.rate(self.flashcards[1], 4)
+        self.assertProgress(3, 2, 0)
+
+        self.client.post(reverse("add-flashcard", args=[self.flashcard_set.id]), {"front": "New", "back": "New"})
+        self.assertProgress(4, 2, 0)
+
+        review = Review.objects.get(flashcard=self.flashcards[1])
+        review.stability = 30
+        review.repetitions = 2
+        review.save()
+        update_stats_after_review(review, previous_stability=10)
+        self.assertProgress(4, 2, 1)
+
+        self.client.post(reverse("delete-flashcard", args=[self.flashcards[1].id]))
+        self.assertProgress(3, 1, 0)
+
+    def test_reconcile_set_progress_command(self):
+        self.rate(self.flashcards[0], 3)
+        FlashcardSetProgress.objects.update(total_cards=10, cards_reviewed=7, cards_mastered=2)
+
+        call_command("reconcile_set_progress", stdout=StringIO())
+        self.assertProgress(3, 1, 0)
+
+
+class ConcurrentReviewSubmissionTest(TransactionTestCase):
+    """
+    Fires parallel ratings at whichever database is configured (SQLite or PostgreSQL).
+    SQLite may refuse a writer while another one holds the lock; such attempts are retried like a client would.
+    """
+    workers = 4
+    ratings_per_worker = 5
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        self.flashcards = [
+            Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=flashcard_set)
+            for i in range(2)
+        ]
+
+    def rate_in_parallel(self):
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for attempt in range(self.ratings_per_worker):
+                    flashcard = self.flashcards[(index + attempt) % len(self.flashcards)]
+                    for retry in range(100):
+                        try:
+                            submit_review(self.user, flashcard, 3)
+                            break
+                        except OperationalError:
+                            time.sleep(0.01)
+                    else:
+                        raise AssertionError("Rating was never accepted by the database")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_ratings_do_not_lose_updates(self):
+        self.rate_in_parallel()
+        total_ratings = self.workers * self.ratings_per_worker
+
+        today_stats = DailyUserStats.objects.get(user=self.user, date=timezone.now().date())
+        self.assertEqual(today_stats.total_reviews, total_ratings)
+        self.assertEqual(today_stats.correct_reviews, total_ratings)
+        self.assertEqual(today_stats.new_cards_studied, len(self.flashcards))
+        self.assertEqual(today_stats.streak, 1)
+
+        reviews = Review.objects.filter(user=self.user)
+        self.assertEqual(reviews.count(), len(self.flashcards))
+        self.assertEqual(sum(review.repetitions for review in reviews), total_ratings)
+
+        progress = FlashcardSetProgress.objects.get(user=self.user)
+        self.assertEqual((progress.total_cards, progress.cards_reviewed), (len(self.flashcards), len(self.flashcards)))
+
+
+class FSRSBatchTest(TestCase):
+    """ Property test: the batch API must agree with update_state on randomly generated cards. """
+
+    def generate_cards(self, count, seed):
+        rng = random.Random(seed)
+        now = timezone.now()
+        cards = []
+        for _ in range(count):
+            elapsed_seconds = rng.choice([None, rng.uniform(0, 60), rng.uniform(0, 400 * 24 * 60 * 60)])
+            cards.append({
+                "state": rng.choice(list(ReviewState)),
+                "stability": rng.choice([0.0, rng.uniform(0.01, 1), rng.uniform(0.1, 500)]),
+                "difficulty": rng.uniform(0.5, 10.5),
+                "last_review_date": None if elapsed_seconds is None else now - timedelta(seconds=elapsed_seconds),
+                "rating": rng.randint(1, 4),
+            })
+        return now, cards
+
+    def assertBatchMatchesScalar(self, fsrs, seed):
+        now, cards = self.generate_cards(2000, seed)
+        batch = fsrs.update_state_batch(
+            np.array([card["state"].value for card in cards]),
+            np.array([card["stability"] for card in cards]),
+            np.array([card["difficulty"] for card in cards]),
+            np.array([
+                np.nan if card["last_review_date"] is None
+                else (now - card["last_review_date"]).total_seconds() / (24 * 60 * 60)
+                for card in cards
+            ]),
+            np.array([card["rating"] for card in cards]),
+        )
+
+        for i, card in enumerate(cards):
+            expected = fsrs.update_state(
+                card["state"], card["stability"], card["difficulty"], card["last_review_date"], now, card["rating"]
+            )
+            self.assertEqual(batch["new_state"][i], expected["new_state"], card)
+            for key in ["new_s", "new_d", "interval"]:
+                self.assertAlmostEqual(batch[key][i], expected[key], delta=abs(expected[key]) * 1e-12, msg=card)
+
+    def test_batch_matches_scalar_with_default_parameters(self):
+        for seed in range(3):
+            self.assertBatchMatchesScalar(FSRS(), seed)
+
+    def test_batch_matches_scalar_with_custom_parameters(self):
+        rng = random.Random(42)
+        weights = [value * rng.uniform(0.5, 1.5) for value in FSRS.DEFAULT_PARAMS]
+        self.assertBatchMatchesScalar(FSRS(w=weights, request_retention=0.85), seed=7)
+
+    def test_array_helpers_match_the_formulas(self):
+        # The array helpers precompute terms and rearrange the formulas; the results must stay within 1e-12
+        fsrs = FSRS(w=[value * 1.1 for value in FSRS.DEFAULT_PARAMS], request_retention=0.85)
+        stability, elapsed_days = np.meshgrid(np.geomspace(0.01, 36500, 200), np.geomspace(1e-4, 36500, 200))
+        stability, elapsed_days = stability.ravel(), elapsed_days.ravel()
+        difficulty = np.resize(np.linspace(1, 10, 37), stability.size)
+
+        retrievability = fsrs._calc_retrievability_array(stability, elapsed_days)
+        np.testing.assert_allclose(retrievability, (1 + elapsed_days / (9 * stability)) ** -1, rtol=1e-12)
+        success = stability * (1 + np.maximum(0, np.exp(fsrs.w[8]) * (11 - difficulty) * np.maximum(0.1, stability)
+                                              ** -fsrs.w[9] * (np.exp(1 - retrievability) - 1)))
+        np.testing.assert_allclose(
+            fsrs._calc_stability_after_success_array(stability, difficulty, retrievability), success, rtol=1e-12
+        )
+        np.testing.assert_allclose(fsrs._calc_interval_array(stability),
+                                   np.maximum(1, 9 * stability * (1 / 0.85 - 1)), rtol=1e-12)
+        self.assertEqual(fsrs._calc_interval_array(np.array([0.0, -1.0])).tolist(), [1.0, 1.0])
+        self.assertEqual(fsrs._calc_retrievability_array(np.array([0.0]), np.array([3.0])).tolist(), [0.0])
+
+    def test_batch_accepts_state_codes(self):
+        fsrs = FSRS()
+        codes = np.array([FSRS.STATE_CODES[ReviewState.NEW], FSRS.STATE_CODES[ReviewState.REVIEW]])
+        result = fsrs.update_state_batch(codes, np.array([0.0, 10.0]), np.array([5.0, 5.0]),
+                                         np.array([np.nan, 10.0]), np.array([3, 3]))
+        self.assertTrue(np.issubdtype(result["new_state"].dtype, np.integer))
+        self.assertEqual(result["new_state"][1], FSRS.STATE_CODES[ReviewState.REVIEW])
+
+    def test_batch_rejects_invalid_ratings(self):
+        with self.assertRaises(ValueError):
+            FSRS().update_state_batch(np.array(["NEW"]), np.zeros(1), np.ones(1), np.zeros(1), np.array([5]))
+
+
+class RescheduleReviewsTest(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_scheduler_cache)
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.other_user = get_user_model().objects.create_user(username="other", password="password", email="o@o.o")
+        flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        self.last_review_date = timezone.now() - timedelta(days=3)
+        for i, stability in enumerate([2.0, 10.0, 50.0]):
+            flashcard = Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=flashcard_set)
+            for user in [self.user, self.other_user]:
+                Review.objects.create(
+                    user=user, flashcard=flashcard, state=ReviewState.REVIEW, stability=stability,
+                    last_review_date=self.last_review_date, next_review_date=self.last_review_date
+                )
+        self.learning_review = Review.objects.create(
+            user=self.user, state=ReviewState.LEARNING, stability=5.0, last_review_date=self.last_review_date,
+            next_review_date=self.last_review_date,
+            flashcard=Flashcard.objects.create(front="Learning", back="Back", flashcard_set=flashcard_set)
+        )
+
+    def test_reschedule_reviews_command(self):
+        call_command("reschedule_reviews", "--user", "testuser", "--retention", "0.8", "--chunk-size", "2",
+                     stdout=StringIO())
+
+        for review in Review.objects.filter(user=self.user, state=ReviewState.REVIEW):
+            interval = max(1, round(9 * review.stability * (1 / 0.8 - 1)))
+            self.assertEqual(review.next_review_date, self.last_review_date + timedelta(days=interval))
+
+        self.learning_review.refresh_from_db()
+        self.assertEqual(self.learning_review.next_review_date, self.last_review_date)
+        self.assertFalse(Review.objects.filter(user=self.other_user).exclude(
+            next_review_date=self.last_review_date).exists())
+
+        # The retention is stored, so the next rating does not undo the reschedule
+        self.assertEqual(SchedulerParameters.objects.get(user=self.user).request_retention, 0.8)
+        self.assertEqual(get_user_fsrs(self.user).request_retention, 0.8)
+        self.assertFalse(SchedulerParameters.objects.filter(user=self.other_user).exists())
+
+
+def clear_scheduler_cache():
+    # Rolled back SchedulerParameters rows send no signal, so their cached calculators are dropped by the test
+    get_local_cache().clear()
+    get_shared_cache().clear()
+
+
+class FSRSOptimizerTest(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_scheduler_cache)
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+
+    def simulate_history(self, fsrs, card_count=2000, reviews_per_card=8, seed=0):
+        """ Simulates users reviewing cards whose recall follows the given FSRS parameters. """
+        rng = np.random.default_rng(seed)
+        states = np.zeros(card_count, dtype=np.int64)
+        stability = np.zeros(card_count)
+        difficulty = np.full(card_count, 5.0)
+        elapsed_days = np.full(card_count, np.nan)
+
+        columns = []
+        for _ in range(reviews_per_card):
+            retrievability = fsrs._calc_retrievability_array(np.where(states == 0, 1.0, stability),
+                                                             np.nan_to_num(elapsed_days))
+            recalled = rng.random(card_count) < np.where(states == 0, 0.7, retrievability)
+            ratings = np.where(recalled, rng.choice([2, 3, 4], card_count, p=[0.15, 0.7, 0.15]), 1)
+            columns.append((np.arange(card_count), states, stability, difficulty, elapsed_days, ratings))
+
+            result = fsrs.update_state_batch(states, stability, difficulty, elapsed_days, ratings)
+            states, stability, difficulty = result["new_state"], result["new_s"], result["new_d"]
+            elapsed_days = result["interval"] * rng.uniform(0.7, 1.6, card_count)
+
+        return ReviewHistory(*(np.stack([column[i] for column in columns], axis=1).ravel() for i in range(6)))
+
+    def test_fit_weights_improves_on_defaults(self):
+        weights = list(FSRS.DEFAULT_PARAMS)
+        weights[2], weights[8] = 4.0, 1.2
+        history = self.simulate_history(FSRS(w=weights))
+
+        fitted_weights, loss = fit_weights(history, iterations=40, batch_reviews=5000)
+        self.assertLess(loss, log_loss(FSRS(), history))
+        self.assertAlmostEqual(fitted_weights[2], 4.0, delta=1.0)
+
+    def test_review_log_is_recorded_and_parameters_are_used(self):
+        flashcard = Flashcard.objects.create(front="Front", back="Back", flashcard_set=self.flashcard_set)
+        submit_review(self.user, flashcard, 3)
+        submit_review(self.user, flashcard, 1)
+
+        logs = list(ReviewLog.objects.filter(user=self.user).order_by("id"))
+        self.assertEqual([log.rating for log in logs], [3, 1])
+        self.assertEqual([log.state for log in logs], [ReviewState.NEW, ReviewState.LEARNING])
+        self.assertIsNone(logs[0].elapsed_days)
+        self.assertIsNotNone(logs[1].elapsed_days)
+
+        weights = list(FSRS.DEFAULT_PARAMS)
+        weights[2] = 30.0
+        SchedulerParameters.objects.create(user=self.user, weights=weights)
+        other_flashcard = Flashcard.objects.create(front="Other", back="Back", flashcard_set=self.flashcard_set)
+        review = submit_review(self.user, other_flashcard, 3)
+        self.assertEqual(review.stability, 30.0)
+
+    def test_optimize_fsrs_parameters_command(self):
+        flashcard = Flashcard.objects.create(front="Front", back="Back", flashcard_set=self.flashcard_set)
+        for rating in [3, 3, 1, 3, 4]:
+            submit_review(self.user, flashcard, rating)
+
+        call_command("optimize_fsrs_parameters", "--min-reviews", "3", "--iterations", "2", stdout=StringIO())
+        parameters = SchedulerParameters.objects.get(user=self.user)
+        self.assertEqual(parameters.review_count, 5)
+        self.assertEqual(len(parameters.weights), 17)
+
+
+class SchedulerCacheTest(TestCase):
+    def setUp(self):
+        clear_scheduler_cache()
+        self.addCleanup(clear_scheduler_cache)
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+
+    def test_cached_calculator_is_reused_without_queries(self):
+        fsrs = get_user_fsrs(self.user)
+        self.assertEqual(fsrs.w, FSRS.DEFAULT_PARAMS)
+        with self.assertNumQueries(0):
+            self.assertIs(get_user_fsrs(self.user), fsrs)
+
+    def test_saving_parameters_invalidates_the_cache(self):
+        get_user_fsrs(self.user)
+        weights = list(FSRS.DEFAULT_PARAMS)
+        weights[2] = 30.0
+        parameters = SchedulerParameters.objects.create(user=self.user, weights=weights, request_retention=0.8)
+        fsrs = get_user_fsrs(self.user)
+        self.assertEqual((fsrs.w[2], fsrs.request_retention), (30.0, 0.8))
+
+        parameters.weights[2] = 20.0
+        parameters.save()
+        self.assertEqual(get_user_fsrs(self.user).w[2], 20.0)
+
+        parameters.delete()
+        self.assertEqual(get_user_fsrs(self.user).w, FSRS.DEFAULT_PARAMS)
+
+    @override_settings(SCHEDULER_LOCAL_CACHE_SIZE=0)
+    def test_shared_cache_is_used_without_local_cache(self):
+        SchedulerParameters.objects.create(user=self.user, weights=[1.0] * 17)
+        fsrs = get_user_fsrs(self.user)
+        with self.assertNumQueries(0):
+            shared = get_user_fsrs(self.user)
+        self.assertIsNot(shared, fsrs)
+        self.assertEqual(shared.w, [1.0] * 17)
+
+    @override_settings(SCHEDULER_LOCAL_CACHE_TTL=0.1, SCHEDULER_CACHE_TIMEOUT=3600)
+    def test_per_process_shared_cache_expires_with_the_local_cache(self):
+        SchedulerParameters.objects.create(user=self.user, weights=[1.0] * 17)
+        get_user_fsrs(self.user)
+        # Saved by another process: the signal only reaches that process's caches
+        SchedulerParameters.objects.filter(user=self.user).update(weights=[2.0] * 17)
+        self.assertEqual(get_user_fsrs(self.user).w, [1.0] * 17)
+        time.sleep(0.2)
+        self.assertEqual(get_user_fsrs(self.user).w, [2.0] * 17)
+
+        self.assertEqual(shared_cache_timeout(get_shared_cache()), 0.1)
+        self.assertEqual(shared_cache_timeout(mock.Mock()), 3600)
+
+    def test_local_cache_evicts_least_recently_used_and_expired_entries(self):
+        cache = LocalLRUCache(max_size=2, ttl=60)
+        with mock.patch("flashcards.scheduler_cache.time.monotonic", return_value=0):
+            cache.set(1, "a")
+            cache.set(2, "b")
+            cache.get(1)
+            cache.set(3, "c")
+            self.assertEqual([cache.get(key) for key in (1, 2, 3)], ["a", None, "c"])
+        with mock.patch("flashcards.scheduler_cache.time.monotonic", return_value=60):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 1)
+
+
+class LoadBalancingTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        self.now = timezone.now()
+
+    def create_review_cards(self, count):
+        """ Creates cards in the REVIEW state that all get the same interval when rated Good now. """
+        reviews = []
+        for i in range(count):
+            flashcard = Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=self.flashcard_set)
+            reviews.append(Review.objects.create(
+                user=self.user, flashcard=flashcard, state=ReviewState.REVIEW, stability=20.0, difficulty=5.0,
+                repetitions=3, last_review_date=self.now - timedelta(days=20), next_review_date=self.now
+            ))
+        register_reviews_imported(self.user, self.flashcard_set, reviews)
+        return reviews
+
+    def assertDueCountsMatchReviews(self):
+        actual = Counter(
+            (flashcard_set_id, timezone.localdate(due))
+            for flashcard_set_id, due in Review.objects.values_list("flashcard__flashcard_set_id", "next_review_date")
+        )
+        stored = {
+            (flashcard_set_id, date): due_count for flashcard_set_id, date, due_count
+            in DailyDueCount.objects.filter(user=self.user, due_count__gt=0).values_list(
+                "flashcard_set_id", "date", "due_count"
+            )
+        }
+        self.assertEqual(stored, dict(actual))
+
+    def test_fuzz_range_scales_with_the_interval(self):
+        fsrs = FSRS()
+        self.assertEqual(fuzz_range(fsrs, 2), (2, 2))
+        self.assertEqual(fuzz_range(fsrs, 10), (9, 11))
+        self.assertEqual(fuzz_range(fsrs, 100), (95, 105))
+
+    def test_least_loaded_day_is_chosen_deterministically(self):
+        fsrs = FSRS()
+        day = lambda days: timezone.localdate(self.now + timedelta(days=days))
+        due_counts = {day(9): 2, day(10): 5, day(11): 3}
+        self.assertEqual(balance_interval(fsrs, 10, self.now, due_counts, seed="1:1"), 9)
+
+        # Equally loaded days: the closest to the interval, then a fixed choice per card
+        due_counts[day(9)] = 3
+        choices = {balance_interval(fsrs, 10, self.now, due_counts, seed=f"{card}:1") for card in range(20)}
+        self.assertEqual(choices, {9, 11})
+        self.assertEqual(balance_interval(fsrs, 10, self.now, due_counts, seed="1:1"),
+                         balance_interval(fsrs, 10, self.now, due_counts, seed="1:1"))
+
+    def test_cards_rated_together_are_spread_over_the_fuzz_range(self):
+        reviews = self.create_review_cards(30)
+        for review in reviews:
+            submit_review(self.user, review.flashcard, 3)
+
+        due_days = Counter(
+            timezone.localdate(due) for due in Review.objects.values_list("next_review_date", flat=True)
+        )
+        # An interval of 42 days may move by round(0.05 * 42) = 2 days
+        self.assertEqual(len(due_days), 5)
+        self.assertLessEqual(max(due_days.values()) - min(due_days.values()), 1)
+        self.assertDueCountsMatchReviews()
+
+    @override_settings(LOAD_BALANCING=False)
+    def test_load_balancing_can_be_disabled(self):
+        for review in self.create_review_cards(5):
+            submit_review(self.user, review.flashcard, 3)
+        self.assertEqual(Review.objects.values("next_review_date__date").distinct().count(), 1)
+        self.assertDueCountsMatchReviews()
+
+    def test_due_counts_follow_new_cards_rescheduling_and_deletions(self):
+        flashcard = Flashcard.objects.create(front="New", back="Back", flashcard_set=self.flashcard_set)
+        for rating in [3, 3, 3]:
+            submit_review(self.user, flashcard, rating)
+        self.create_review_cards(4)
+        self.assertDueCountsMatchReviews()
+
+        reschedule_reviews(self.user, FSRS(request_retention=0.8))
+        self.assertDueCountsMatchReviews()
+
+        register_flashcard_removed(flashcard)
+        flashcard.delete()
+        self.assertDueCountsMatchReviews()
+
+        self.client.login(username="testuser", password="password")
+        self.client.post(reverse("delete-flashcard-set", args=[self.flashcard_set.id]))
+        self.assertFalse(DailyDueCount.objects.filter(due_count__gt=0).exists())
+
+
+class DueCountsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        now = timezone.now()
+        self.sets = [FlashcardSet.objects.create(title=title, description="Description", created_by=self.user)
+                     for title in ("Biology", "Chemistry")]
+        # Biology: 3 overdue, 1 due tomorrow; Chemistry: 2 due tomorrow, 1 in 5 days
+        for flashcard_set, due_days in zip(self.sets, [[-3, -1, -1, 1], [1, 1, 5]]):
+            for i, days in enumerate(due_days):
+                Review.objects.create(
+                    user=self.user, next_review_date=now + timedelta(days=days),
+                    flashcard=Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=flashcard_set),
+                )
+        # The reviews above were created directly, so their due counts are built from them
+        call_command("rebuild_due_counts", stdout=StringIO())
+
+    def test_rebuild_counts_the_reviews_per_set_and_day(self):
+        self.assertEqual(DailyDueCount.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(get_due_counts_by_set(self.user), {self.sets[0].id: 3})
+        self.assertEqual(get_due_forecast(self.user, days=5), [3, 3, 0, 0, 0, 1])
+
+        DailyDueCount.objects.update(due_count=99)
+        out = StringIO()
+        call_command("rebuild_due_counts", "--user", "testuser", stdout=out)
+        self.assertIn("Rebuilt 5 daily due count(s)", out.getvalue())
+        self.assertEqual(get_due_forecast(self.user, days=5), [3, 3, 0, 0, 0, 1])
+
+    def test_review_due_reads_the_due_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("review-due"))
+        self.assertEqual([(flashcard_set.title, flashcard_set.due_flashcard_count)
+                          for flashcard_set in response.context["due_sets"]], [("Biology", 3)])
+        # Only today's reviews are read, the overdue days come from the due counts
+        review_queries = [query["sql"] for query in queries.captured_queries if '"flashcards_review"' in query["sql"]]
+        self.assertEqual(len(review_queries), 1)
+        self.assertIn('"next_review_date" >=', review_queries[0])
+
+    def test_cards_due_later_today_are_not_due_yet(self):
+        morning = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time())) + timedelta(hours=9)
+        Review.objects.create(
+            user=self.user, next_review_date=morning + timedelta(hours=13),
+            flashcard=Flashcard.objects.create(front="Evening", back="Back", flashcard_set=self.sets[1]),
+        )
+        call_command("rebuild_due_counts", stdout=StringIO())
+
+        with mock.patch("django.utils.timezone.now", return_value=morning):
+            self.assertEqual(get_due_counts_by_set(self.user), {self.sets[0].id: 3})
+            response = self.client.get(reverse("index"))
+            self.assertEqual([flashcard_set.due_count for flashcard_set in response.context["flashcard_sets"]],
+                             [3, 0])
+            self.assertEqual((response.context["due_now"], response.context["due_later_today"]), (3, 1))
+
+        with mock.patch("django.utils.timezone.now", return_value=morning + timedelta(hours=14)):
+            self.assertEqual(get_due_counts_by_set(self.user), {self.sets[0].id: 3, self.sets[1].id: 1})
+
+    def test_dashboard_shows_due_counts(self):
+        response = self.client.get(reverse("index"))
+        self.assertEqual([flashcard_set.due_count for flashcard_set in response.context["flashcard_sets"]], [3, 0])
+        self.assertEqual((response.context["due_now"], response.context["due_later_today"],
+                          response.context["due_tomorrow"], response.context["due_next_week"]), (3, 0, 3, 4))
+
+        # Rating the overdue cards moves them out of today's counts
+        for review in Review.objects.filter(flashcard__flashcard_set=self.sets[0], next_review_date__lt=timezone.now()):
+            submit_review(self.user, review.flashcard, 3)
+        self.assertEqual(self.client.get(reverse("index")).context["due_now"], 0)
+
+
+class DueQueueTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        now = timezone.now()
+        for i in range(7):
+            flashcard = Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=self.flashcard_set)
+            # Pairs of cards share a due date to exercise the flashcard_id tie-breaker
+            Review.objects.create(user=self.user, flashcard=flashcard, next_review_date=now - timedelta(hours=i // 2))
+        self.due_ids = list(
+            Review.objects.order_by("next_review_date", "flashcard_id").values_list("flashcard_id", flat=True)
+        )
+        Review.objects.create(
+            user=self.user, next_review_date=now + timedelta(days=1),
+            flashcard=Flashcard.objects.create(front="Later", back="Back", flashcard_set=self.flashcard_set)
+        )
+
+    def test_pages_cover_due_cards_in_order(self):
+        seen_ids, cursor = [], None
+        while True:
+            response = self.client.get(reverse("due-queue-api"), {"limit": 3, "cursor": cursor or ""})
+            self.assertEqual(response.status_code, 200)
+            seen_ids += [card["id"] for card in response.json()["cards"]]
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen_ids, self.due_ids)
+
+    def test_invalid_parameters(self):
+        response = self.client.get(reverse("due-queue-api"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse("due-queue-api"), {"set": "abc"}).status_code, 400)
+
+
+class ReviewSessionTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        now = timezone.now()
+        self.due_ids = []
+        for i in range(4):
+            flashcard = Flashcard.objects.create(front=f"Front {i}", back="Back", flashcard_set=self.flashcard_set)
+            Review.objects.create(user=self.user, flashcard=flashcard, next_review_date=now - timedelta(hours=4 - i))
+            self.due_ids.append(flashcard.id)
+
+    def test_session_walks_due_cards_in_order(self):
+        response = self.client.get(reverse("start-set-review", args=[self.flashcard_set.id]))
+        self.assertRedirects(response, reverse("review-due-card", args=[self.due_ids[0]]))
+
+        response = self.client.get(reverse("review-due-card", args=[self.due_ids[0]]))
+        self.assertEqual(response.context["remaining_in_session"], 4)
+
+        for current_id, next_id in zip(self.due_ids, self.due_ids[1:]):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse("review-due-card", args=[current_id]), {"rating": 3})
+            self.assertRedirects(response, reverse("review-due-card", args=[next_id]), fetch_redirect_response=False)
+            # The Django session is not rewritten for every card
+            self.assertFalse([
+                query for query in context.captured_queries
+                if "django_session" in query["sql"] and not query["sql"].startswith("SELECT")
+            ])
+
+        response = self.client.post(reverse("review-due-card", args=[self.due_ids[-1]]), {"rating": 3})
+        self.assertRedirects(response, reverse("review-due"))
+        self.assertFalse(ReviewSession.objects.exists())
+        self.assertEqual(Review.objects.filter(repetitions=1).count(), 4)
+
+    def test_card_outside_session_is_rejected(self):
+        self.client.get(reverse("start-set-review", args=[self.flashcard_set.id]))
+        response = self.client.get(reverse("review-due-card", args=[self.due_ids[2]]))
+        self.assertRedirects(response, reverse("review-due"))
+        self.assertFalse(ReviewSession.objects.exists())
+
+
+class GlobalReviewSessionTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        now = timezone.now()
+        self.cards_by_set = {}
+        # Set A holds the 30 most overdue cards, set B the 5 cards due after them
+        for title, count, offset in [("A", 30, 100), ("B", 5, 10)]:
+            flashcard_set = FlashcardSet.objects.create(title=title, description="Description", created_by=self.user)
+            self.cards_by_set[title] = []
+            for i in range(count):
+                flashcard = Flashcard.objects.create(front=f"{title} {i}", back="Back", flashcard_set=flashcard_set)
+                Review.objects.create(
+                    user=self.user, flashcard=flashcard, next_review_date=now - timedelta(hours=offset - i)
+                )
+                self.cards_by_set[title].append(flashcard.id)
+
+    def review_session(self, url):
+        response = self.client.get(url)
+        reviewed = []
+        while response.url.startswith("/flashcards/review-due-card/"):
+            flashcard_id = int(response.url.rstrip("/").split("/")[-1])
+            reviewed.append(flashcard_id)
+            response = self.client.post(response.url, {"rating": 3})
+        return reviewed
+
+    def test_session_follows_due_order_across_sets(self):
+        reviewed = self.review_session(reverse("start-due-review"))
+        self.assertEqual(reviewed, self.cards_by_set["A"] + self.cards_by_set["B"])
+        self.assertFalse(ReviewSession.objects.exists())
+
+    def test_interleaved_session_alternates_sets(self):
+        reviewed = self.review_session(reverse("start-due-review") + "?interleave=1")
+        cards_a, cards_b = self.cards_by_set["A"], self.cards_by_set["B"]
+        self.assertEqual(reviewed[:10], [card for pair in zip(cards_a, cards_b) for card in pair])
+        self.assertEqual(reviewed[10:], cards_a[5:])
+
+    def test_interleaved_refill_reads_a_bounded_share_of_each_set(self):
+        review_session = ReviewSession(user=self.user, interleave=True, started_at=timezone.now(),
+                                       set_cursors=[[set_id, None, None] for set_id in
+                                                    FlashcardSet.objects.order_by("title").values_list("id", flat=True)])
+        with CaptureQueriesContext(connection) as queries:
+            refill_buffer(review_session)
+        self.assertEqual(len(queries.captured_queries), 2)
+        for query in queries.captured_queries:
+            self.assertIn("LIMIT 10", query["sql"])
+            self.assertNotIn("ROW_NUMBER", query["sql"])
+        self.assertEqual(len(review_session.buffer), 15)
+
+    @override_settings(DAILY_REVIEW_LIMIT=12)
+    def test_session_respects_daily_limit(self):
+        self.assertEqual(len(self.review_session(reverse("start-due-review"))), 12)
+        self.assertEqual(self.review_session(reverse("start-due-review")), [])
+
+
+class StubGeminiServer:
+    """
+    A local HTTP server standing in for the Gemini API. Every POST pops the next (status, flashcards) response;
+    the last response is repeated once the list runs out. Responses are delayed by delay seconds.
+    """
+
+    def __init__(self, responses, delay=0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.client_ports = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse is visible
+
+            def do_POST(self):
+                stub.requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                stub.client_ports.append(self.client_address[1])
+                status, flashcards = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                time.sleep(stub.delay)
+                body = json.dumps({"candidates": [{"content": {"parts": [{"text": json.dumps(flashcards)}]}}]})
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/generate"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.patch = mock.patch("flashcards.gemini.GEMINI_API_URL", self.url)
+        self.patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GeminiClientTest(TestCase):
+    def client_for_test(self, **options):
+        options = {"connect_timeout": 1, "read_timeout": 1, "max_retries": 2, "backoff_base": 0.001, **options}
+        client = GeminiClient(**options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_connections_are_reused(self):
+        client = self.client_for_test()
+        with StubGeminiServer([(200, [])]) as gemini:
+            for _ in range(3):
+                client.generate_content({})
+        self.assertEqual(len(set(gemini.client_ports)), 1)
+
+    def test_slow_response_times_out(self):
+        client = self.client_for_test(read_timeout=0.1, max_retries=0)
+        with StubGeminiServer([(200, [])], delay=1):
+            started = time.monotonic()
+            with self.assertRaises(requests.exceptions.Timeout):
+                client.generate_content({})
+            self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_server_errors_are_retried(self):
+        client = self.client_for_test()
+        with StubGeminiServer([(429, []), (503, []), (200, [{"front": "Q", "back": "A"}])]) as gemini:
+            data = client.generate_content({})
+        self.assertEqual(len(gemini.requests), 3)
+        self.assertIn("candidates", data)
+
+    def test_retries_are_bounded(self):
+        client = self.client_for_test()
+        with StubGeminiServer([(500, [])]) as gemini:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.generate_content({})
+        self.assertEqual(len(gemini.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.client_for_test()
+        with StubGeminiServer([(400, [])]) as gemini:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.generate_content({})
+        self.assertEqual(len(gemini.requests), 1)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        client = self.client_for_test(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+        with StubGeminiServer([(503, []), (503, []), (200, [])]) as gemini:
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    client.generate_content({})
+            with self.assertRaises(CircuitOpenError):
+                client.generate_content({})
+            self.assertEqual(len(gemini.requests), 2)
+
+            time.sleep(0.2)
+            client.generate_content({})
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_of_half_open_trial_reopens_the_circuit(self):
+        client = self.client_for_test(max_retries=0, failure_threshold=1, reset_timeout=0.1)
+        with StubGeminiServer([(503, []), (200, [])]):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.generate_content({})
+            time.sleep(0.1)
+            with mock.patch.object(client.session, "post",
+                                   side_effect=requests.exceptions.ChunkedEncodingError("Connection broken")):
+                with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                    client.generate_content({})
+            self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+            time.sleep(0.1)
+            client.generate_content({})
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit_is_reported_as_client_error(self):
+        client = self.client_for_test(max_retries=0)
+        with StubGeminiServer([(429, [])]):
+            with self.assertRaisesRegex(requests.exceptions.HTTPError, "429 Client Error"):
+                client.generate_content({})
+
+    def test_backoff_is_jittered_and_capped(self):
+        client = self.client_for_test(backoff_base=1, backoff_max=4)
+        delays = [client.backoff(3) for _ in range(100)]
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertEqual(client.backoff(0, retry_after="3"), 3)
+
+
+@override_settings(GEMINI_MAX_RETRIES=0)
+class AIGenerationTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        self.flashcards = [{"front": f"Question {i}", "back": f"Answer {i}"} for i in range(3)]
+        get_generation_cache().clear()
+        caches["default"].clear()
+
+    def enqueue(self, flashcard_set=None):
+        response = self.client.post(
+            reverse("add-flashcard", args=[(flashcard_set or self.flashcard_set).id]),
+            {"generate_with_ai": "on", "topic": "SQL", "num_flashcards": 3},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+
+class GenerationJobTest(AIGenerationTestCase):
+    def test_request_enqueues_without_calling_the_ai_service(self):
+        with StubGeminiServer([(200, self.flashcards)]) as gemini:
+            data = self.enqueue()
+        self.assertEqual(gemini.requests, [])
+        self.assertEqual(Flashcard.objects.filter(flashcard_set=self.flashcard_set).count(), 0)
+
+        job = GenerationJob.objects.get(id=data["job_id"])
+        self.assertEqual((job.status, job.text, job.num_flashcards), (GenerationJobStatus.PENDING, "SQL", 3))
+        self.assertEqual(self.client.get(data["status_url"]).json()["status"], "pending")
+
+    def test_worker_generates_flashcards(self):
+        data = self.enqueue()
+        with StubGeminiServer([(200, self.flashcards)]) as gemini:
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+        self.assertEqual(len(gemini.requests), 1)
+        self.assertEqual(Flashcard.objects.filter(flashcard_set=self.flashcard_set).count(), 3)
+
+        status = self.client.get(data["status_url"]).json()
+        self.assertEqual((status["status"], status["count"], status["error"]), ("succeeded", 3, ""))
+
+    def run_after_retry_delay(self):
+        GenerationJob.objects.filter(not_before__isnull=False).update(not_before=timezone.now())
+        call_command("run_generation_worker", "--once", stdout=StringIO())
+
+    def test_service_errors_are_retried_after_a_delay(self):
+        data = self.enqueue()
+        with StubGeminiServer([(503, []), (200, self.flashcards)]) as gemini:
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+            # Not claimed again before the retry delay has passed
+            self.assertEqual(len(gemini.requests), 1)
+            job = GenerationJob.objects.get(id=data["job_id"])
+            self.assertEqual(job.status, GenerationJobStatus.PENDING)
+            self.assertGreaterEqual(job.not_before, timezone.now() + RETRY_DELAY - timedelta(seconds=5))
+            self.assertIsNone(claim_next_job())
+
+            self.run_after_retry_delay()
+        self.assertEqual(len(gemini.requests), 2)
+        job = GenerationJob.objects.get(id=data["job_id"])
+        self.assertEqual((job.status, job.attempts, job.created_count), (GenerationJobStatus.SUCCEEDED, 2, 3))
+
+    def test_job_fails_after_max_attempts(self):
+        data = self.enqueue()
+        with StubGeminiServer([(500, [])]) as gemini:
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+            for _ in range(MAX_ATTEMPTS):
+                self.run_after_retry_delay()
+        self.assertEqual(len(gemini.requests), MAX_ATTEMPTS)
+        status = self.client.get(data["status_url"]).json()
+        self.assertEqual(status["status"], "failed")
+        self.assertIn("AI service error", status["error"])
+
+    @override_settings(GEMINI_CIRCUIT_RESET_TIMEOUT=60)  # A fresh client, dropped again after the test
+    def test_open_circuit_defers_jobs_without_using_attempts(self):
+        for _ in range(3):
+            self.enqueue()
+        breaker = get_client().breaker
+        breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic()
+
+        with StubGeminiServer([(200, self.flashcards)]) as gemini:
+            self.assertEqual(run_worker(once=True), 3)
+        self.assertEqual(gemini.requests, [])
+        for job in GenerationJob.objects.all():
+            self.assertEqual((job.status, job.attempts), (GenerationJobStatus.PENDING, 0))
+            self.assertIn("circuit breaker is open", job.error)
+            self.assertAlmostEqual((job.not_before - timezone.now()).total_seconds(), 60, delta=5)
+
+    def test_worker_survives_a_job_deleted_while_it_runs(self):
+        data = self.enqueue()
+
+        def delete_set(text, num_flashcards):
+            self.flashcard_set.delete()
+            return []
+
+        with mock.patch("flashcards.jobs.generate_flashcards_data_with_ai", side_effect=delete_set):
+            self.assertEqual(run_worker(once=True), 1)
+        self.assertFalse(GenerationJob.objects.filter(id=data["job_id"]).exists())
+
+    def test_worker_continues_after_an_unexpected_error(self):
+        self.enqueue()
+        second = self.enqueue()
+        with mock.patch("flashcards.jobs.run_generation_job", side_effect=[DatabaseError("Database is locked"), None]):
+            self.assertEqual(run_worker(once=True), 2)
+        self.assertEqual(GenerationJob.objects.get(id=second["job_id"]).status, GenerationJobStatus.RUNNING)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        self.enqueue()
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        data = self.enqueue()
+        claim_next_job()
+        long_ago = timezone.now() - timedelta(hours=1)
+        # Running for an hour (e.g. chunked generation with retries), but the worker is alive
+        GenerationJob.objects.update(started_at=long_ago)
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+        GenerationJob.objects.update(heartbeat_at=long_ago)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(GenerationJob.objects.get(id=data["job_id"]).status, GenerationJobStatus.PENDING)
+
+    def test_abandoned_job_fails_after_max_attempts(self):
+        data = self.enqueue()
+        claim_next_job()
+        GenerationJob.objects.update(attempts=MAX_ATTEMPTS, heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        status = self.client.get(data["status_url"]).json()
+        self.assertEqual(status["status"], "failed")
+        self.assertIn("stopped responding", status["error"])
+
+    def test_status_of_other_users_job_is_hidden(self):
+        data = self.enqueue()
+        get_user_model().objects.create_user(username="other", email="other@example.com", password="password")
+        self.client.login(username="other", password="password")
+        self.assertEqual(self.client.get(data["status_url"]).status_code, 404)
+
+
+class GenerationJobHeartbeatTest(TransactionTestCase):
+    def test_heartbeat_is_refreshed_while_the_job_runs(self):
+        user = get_user_model().objects.create_user(username="testuser", password="password")
+        flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=user)
+        GenerationJob.objects.create(user=user, flashcard_set=flashcard_set, text="SQL", num_flashcards=3)
+        job = claim_next_job()
+
+        with heartbeat(job, interval=timedelta(seconds=0.05)):
+            time.sleep(0.3)
+        beat_at = GenerationJob.objects.get(id=job.id).heartbeat_at
+        self.assertGreater(beat_at, job.heartbeat_at)
+
+        time.sleep(0.1)
+        self.assertEqual(GenerationJob.objects.get(id=job.id).heartbeat_at, beat_at)
+
+
+LRU_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "ai_generation": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "lru-test",
+        "TIMEOUT": 1,
+        "OPTIONS": {"MAX_ENTRIES": 2, "CULL_FREQUENCY": 2},
+    },
+}
+
+
+class GenerationCacheTest(AIGenerationTestCase):
+    def test_identical_request_is_served_from_cache(self):
+        self.enqueue()
+        with StubGeminiServer([(200, self.flashcards)]) as gemini:
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+
+            other_set = FlashcardSet.objects.create(title="Copy", description="Description", created_by=self.user)
+            data = self.enqueue(other_set)
+        self.assertEqual(len(gemini.requests), 1)
+
+        job = GenerationJob.objects.get(id=data["job_id"])
+        self.assertEqual((job.status, job.created_count), (GenerationJobStatus.SUCCEEDED, 3))
+        self.assertEqual(
+            list(Flashcard.objects.filter(flashcard_set=other_set).values("front", "back")), self.flashcards
+        )
+        self.assertEqual(get_cache_stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_skipped_items_are_reported_from_cache_too(self):
+        first = self.enqueue()
+        with StubGeminiServer([(200, self.flashcards + [{"front": "Question"}])]):
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+            other_set = FlashcardSet.objects.create(title="Copy", description="Description", created_by=self.user)
+            second = self.enqueue(other_set)
+
+        errors = [GenerationJob.objects.get(id=data["job_id"]).error for data in (first, second)]
+        self.assertEqual(errors, ["Skipped 1 invalid or duplicate flashcard(s): 3: Missing back"] * 2)
+
+    def test_key_covers_text_and_parameters(self):
+        key = generation_cache_key("Text", "Template {text}", num_flashcards=3)
+        self.assertEqual(key, generation_cache_key("Text", "Template {text}", num_flashcards=3))
+        self.assertNotEqual(key, generation_cache_key("Text.", "Template {text}", num_flashcards=3))
+        self.assertNotEqual(key, generation_cache_key("Text", "Other {text}", num_flashcards=3))
+        self.assertNotEqual(key, generation_cache_key("Text", "Template {text}", num_flashcards=4))
+
+    @override_settings(CACHES=LRU_CACHES)
+    def test_least_recently_used_entry_is_evicted(self):
+        cache_flashcards("a", self.flashcards)
+        cache_flashcards("b", self.flashcards)
+        get_cached_flashcards("a", record_stats=False)
+        cache_flashcards("c", self.flashcards)
+        self.assertIsNotNone(get_cached_flashcards("a", record_stats=False))
+        self.assertIsNone(get_cached_flashcards("b", record_stats=False))
+
+    @override_settings(CACHES=LRU_CACHES)
+    def test_stats_survive_evictions_and_are_logged(self):
+        with self.assertLogs("flashcards.generation_cache", "INFO") as logs:
+            for i in range(STATS_LOG_INTERVAL):
+                if get_cached_flashcards(str(i % 3)) is None:
+                    cache_flashcards(str(i % 3), self.flashcards)
+        self.assertEqual(get_cache_stats()["hits"] + get_cache_stats()["misses"], STATS_LOG_INTERVAL)
+        self.assertEqual(len([line for line in logs.output if "hit rate" in line]), 1)
+
+    @override_settings(CACHES=LRU_CACHES)
+    def test_entries_expire(self):
+        cache_flashcards("a", self.flashcards)
+        time.sleep(1.1)
+        self.assertIsNone(get_cached_flashcards("a", record_stats=False))
+
+
+class ChunkedGenerationTest(TestCase):
+    def test_long_text_is_split_into_bounded_overlapping_chunks(self):
+        words = [f"word{i:03d}" for i in range(500)]
+        chunks = split_into_chunks(" ".join(words), max_tokens=50, overlap_tokens=10)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(estimate_tokens(chunk) <= 50 for chunk in chunks))
+        chunk_words = [chunk.split() for chunk in chunks]
+        for previous, current in zip(chunk_words, chunk_words[1:]):
+            self.assertIn(current[0], previous)
+        self.assertEqual(sorted(set(word for chunk in chunk_words for word in chunk)), words)
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(split_into_chunks("A short topic", max_tokens=50), ["A short topic"])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def generate(text, num_flashcards):
+            with lock:
+                in_flight.append(text)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(text)
+            return [{"front": text[:20], "back": "Answer"}]
+
+        text = " ".join(f"word{i:03d}" for i in range(500))
+        flashcards, errors = generate_in_chunks(text, 20, generate, max_tokens=50, max_concurrency=3)
+        self.assertEqual((max(peak), errors), (3, []))
+        self.assertEqual(len(flashcards), len(peak))
+
+    def test_merge_takes_sections_in_turn_and_drops_duplicates(self):
+        results = [
+            [{"front": "What is A?", "back": "1"}, {"front": "What is B?", "back": "2"}],
+            [{"front": "what is a", "back": "3"}, {"front": "What is C?", "back": "4"}],
+            [{"front": "What is D?", "back": "5"}],
+        ]
+        merged = merge_flashcards(results, 3)
+        self.assertEqual([card["back"] for card in merged], ["1", "5", "2"])
+
+    def test_failed_sections_are_skipped(self):
+        def generate(text, num_flashcards):
+            if text.startswith("word000"):
+                raise requests.exceptions.ConnectionError("Connection refused")
+            return [{"front": text[:20], "back": "Answer"}]
+
+        text = " ".join(f"word{i:03d}" for i in range(100))
+        flashcards, errors = generate_in_chunks(text, 5, generate, max_tokens=50)
+        self.assertTrue(flashcards)
+        self.assertEqual(len(errors), 1)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            generate_in_chunks(text, 5, lambda text, num: generate("word000", num), max_tokens=50)
+
+
+@override_settings(AI_CHUNK_TOKENS=100, AI_CHUNK_OVERLAP_TOKENS=10)
+class ChunkedGenerationJobTest(AIGenerationTestCase):
+    def test_sections_are_generated_and_merged(self):
+        response = self.client.post(
+            reverse("add-flashcard", args=[self.flashcard_set.id]),
+            {"generate_with_ai": "on", "topic": " ".join(f"word{i:03d}" for i in range(120)), "num_flashcards": 3},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        with StubGeminiServer([(200, self.flashcards)]) as gemini:
+            call_command("run_generation_worker", "--once", stdout=StringIO())
+
+        self.assertEqual(len(gemini.requests), 3)
+        job = GenerationJob.objects.get(id=response.json()["job_id"])
+        self.assertEqual((job.status, job.created_count), (GenerationJobStatus.SUCCEEDED, 3))
+
+    def test_partial_result_is_not_cached(self):
+        topic = " ".join(f"word{i:03d}" for i in range(120))
+        for flashcard_set in [self.flashcard_set, FlashcardSet.objects.create(
+                title="Copy", description="Description", created_by=self.user)]:
+            response = self.client.post(
+                reverse("add-flashcard", args=[flashcard_set.id]),
+                {"generate_with_ai": "on", "topic": topic, "num_flashcards": 3},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+            job = GenerationJob.objects.get(id=response.json()["job_id"])
+            # The second request misses the cache and is queued again
+            self.assertEqual(job.status, GenerationJobStatus.PENDING)
+            with StubGeminiServer([(500, []), (200, self.flashcards)]) as gemini:
+                call_command("run_generation_worker", "--once", stdout=StringIO())
+            self.assertEqual(len(gemini.requests), 3)
+            job.refresh_from_db()
+            self.assertEqual(job.status, GenerationJobStatus.SUCCEEDED)
+
+
+def make_pdf(page_count):
+    """ Returns the bytes of a PDF whose pages read "Page <number>" followed by some filler text. """
+    with fitz.open() as doc:
+        for i in range(page_count):
+            doc.new_page().insert_text((72, 72), f"Page {i} " + "lorem ipsum " * 5)
+        return doc.tobytes()
+
+
+class PdfExtractionTest(AIGenerationTestCase):
+    def upload(self, page_count):
+        return SimpleUploadedFile("notes.pdf", make_pdf(page_count), content_type="application/pdf")
+
+    def test_extraction_stops_at_page_budget(self):
+        with spooled_upload(self.upload(5)) as path:
+            text = extract_pdf_text(path, max_pages=3)
+        self.assertIn("Page 2", text)
+        self.assertNotIn("Page 3", text)
+
+    def test_extraction_stops_at_character_budget(self):
+        with spooled_upload(self.upload(5)) as path:
+            full_text = extract_pdf_text(path)
+            text = extract_pdf_text(path, max_chars=100)
+        self.assertEqual(text, full_text[:100])
+
+    def test_spooled_file_is_removed(self):
+        with spooled_upload(self.upload(1)) as path:
+            self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(PDF_MAX_PAGES=2)
+    def test_uploaded_pdf_is_extracted_in_process_pool(self):
+        response = self.client.post(
+            reverse("add-flashcard", args=[self.flashcard_set.id]),
+            {"generate_with_ai": "on", "num_flashcards": 3, "pdf_file": self.upload(4)},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        job = GenerationJob.objects.get(id=response.json()["job_id"])
+        self.assertIn("Page 1", job.text)
+        self.assertNotIn("Page 2", job.text)
+
+    @override_settings(PDF_EXTRACTION_TIMEOUT=0.01)
+    def test_timed_out_extraction_is_terminated(self):
+        executor = get_executor()
+        processes = executor._processes
+        with self.assertRaises(TimeoutError):
+            extract_text_from_upload(self.upload(1))
+
+        self.assertTrue(processes)
+        for process in processes.values():
+            process.join(timeout=10)
+            self.assertFalse(process.is_alive())
+        self.assertIsNot(get_executor(), executor)
+
+    def test_unreadable_pdf_falls_back_to_topic(self):
+        response = self.client.post(
+            reverse("add-flashcard", args=[self.flashcard_set.id]),
+            {"generate_with_ai": "on", "topic": "SQL", "num_flashcards": 3,
+             "pdf_file": SimpleUploadedFile("notes.pdf", b"not a pdf", content_type="application/pdf")},
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(GenerationJob.objects.get(id=response.json()["job_id"]).text, "SQL")
+
+
+class AIFlashcardBulkInsertTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        FlashcardSetProgress.objects.create(user=self.user, flashcard_set=self.flashcard_set)
+
+    def cards(self, count, start=0):
+        return [{"front": f"Question {i}", "back": f"Answer {i}"} for i in range(start, start + count)]
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        query_counts = []
+        for start, count in ((0, 5), (5, 150)):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(create_flashcards_from_ai_data(self.cards(count, start), self.flashcard_set),
+                                 (count, []))
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(FlashcardSetProgress.objects.get(flashcard_set=self.flashcard_set).total_cards, 155)
+
+    def test_invalid_items_are_reported(self):
+        data = self.cards(1) + ["Question", {"front": "Question"}, {"front": "Q" * 256, "back": "Answer"},
+                                {"front": "  ", "back": "Answer"}]
+        created_count, errors = create_flashcards_from_ai_data(data, self.flashcard_set)
+        self.assertEqual(created_count, 1)
+        self.assertEqual(errors, [
+            {"index": 1, "message": "Flashcard is not an object"},
+            {"index": 2, "message": "Missing back"},
+            {"index": 3, "message": "Front is longer than 255 characters"},
+            {"index": 4, "message": "Missing front"},
+        ])
+
+    def test_payload_without_valid_items_creates_nothing(self):
+        with self.assertRaises(ValueError):
+            create_flashcards_from_ai_data([{"front": "Question"}], self.flashcard_set)
+        self.assertFalse(Flashcard.objects.exists())
+        self.assertEqual(FlashcardSetProgress.objects.get(flashcard_set=self.flashcard_set).total_cards, 0)
+
+
+def write_apkg(path, cards, created=1_700_000_000, member="collection.anki21"):
+    """
+    Writes a minimal Anki package. cards holds (fields, type, due, interval, memory_state) tuples;
+    fields is a list of note fields and memory_state an FSRS {"s", "d"} dictionary or None.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        collection_path = os.path.join(directory, "collection")
+        with closing(sqlite3.connect(collection_path)) as anki:
+            anki.executescript("""
+                CREATE TABLE col (crt INTEGER);
+                CREATE TABLE notes (id INTEGER PRIMARY KEY, flds TEXT);
+                CREATE TABLE cards (id INTEGER PRIMARY KEY, nid INTEGER, ord INTEGER, type INTEGER, queue INTEGER,
+                                    due INTEGER, ivl INTEGER, reps INTEGER, lapses INTEGER, data TEXT);
+            """)
+            anki.execute("INSERT INTO col VALUES (?)", [created])
+            for i, (fields, card_type, due, interval, memory_state) in enumerate(cards, start=1):
+                anki.execute("INSERT INTO notes VALUES (?, ?)", [i, "\x1f".join(fields)])
+                data = json.dumps(memory_state) if memory_state else ""
+                for ordinal in (0, 1):  # Every note also has a reverse card, which is not imported
+                    anki.execute("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, 3, 1, ?)",
+                                 [i * 2 + ordinal, i, ordinal, card_type, card_type, due, interval, data])
+            anki.commit()
+        with zipfile.ZipFile(path, "w") as package:
+            package.write(collection_path, member)
+
+
+class FlashcardImportTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(content)
+        return path
+
+    def test_csv_upload_with_review_state(self):
+        content = (
+            "Question,Answer,State,Stability,Difficulty,Due\n"
+            "What is SQL?,Structured Query Language,Review,25.5,4.2,2030-01-01T00:00:00+00:00\n"
+            "\"Comma, quoted\",Yes,,,,\n"
+            ",Missing front,,,,\n"
+        )
+        upload = SimpleUploadedFile("My deck.csv", content.encode("utf-8-sig"), content_type="text/csv")
+        response = self.client.post(reverse("import-flashcards"), {"file": upload, "with_reviews": "on"})
+        self.assertRedirects(response, reverse("index"), fetch_redirect_response=False)
+
+        flashcard_set = FlashcardSet.objects.get(created_by=self.user)
+        self.assertEqual(flashcard_set.title, "My deck")
+        self.assertEqual(
+            list(Flashcard.objects.filter(flashcard_set=flashcard_set).order_by("id").values_list("front", "back")),
+            [("What is SQL?", "Structured Query Language"), ("Comma, quoted", "Yes")],
+        )
+        review = Review.objects.get(user=self.user)
+        self.assertEqual((review.flashcard.front, review.state, review.stability, review.difficulty),
+                         ("What is SQL?", ReviewState.REVIEW, 25.5, 4.2))
+        self.assertEqual(review.next_review_date.year, 2030)
+
+    def test_failed_upload_leaves_no_set(self):
+        corrupt = SimpleUploadedFile("deck.apkg", b"Not a zip file")
+        response = self.client.post(reverse("import-flashcards"), {"file": corrupt}, follow=True)
+        self.assertContains(response, "Import failed")
+
+        # Fails after the first batch of 1000 cards was written
+        content = "".join(f"Front {i},Back {i}\n" for i in range(1500)).encode() + b"\xff,Back\n"
+        self.client.post(reverse("import-flashcards"), {"file": SimpleUploadedFile("deck.csv", content)})
+        self.assertFalse(FlashcardSet.objects.exists())
+        self.assertFalse(Flashcard.objects.exists())
+
+    def test_malformed_files_are_reported(self):
+        oversized = "front,back\nQuestion," + "x" * (csv.field_size_limit() + 1) + "\n"
+        response = self.client.post(reverse("import-flashcards"),
+                                    {"file": SimpleUploadedFile("deck.csv", oversized.encode())}, follow=True)
+        self.assertContains(response, "Import failed")
+
+        for name, content in [("deck.csv", oversized), ("deck.apkg", "Not a zip file")]:
+            with self.assertRaisesMessage(CommandError, "Import failed"):
+                call_command("import_flashcards", self.write_file(name, content), "--user", "testuser",
+                             stdout=StringIO())
+
+    def test_headerless_tsv_command(self):
+        path = self.write_file("deck.tsv", "Front 1\tBack 1\nFront 2\tBack 2\n\nFront 3\tBack 3\n")
+        call_command("import_flashcards", path, "--user", "testuser", "--title", "TSV", stdout=StringIO())
+        flashcard_set = FlashcardSet.objects.get(title="TSV")
+        self.assertEqual(Flashcard.objects.filter(flashcard_set=flashcard_set).count(), 3)
+        self.assertFalse(Review.objects.exists())
+
+    def test_anki_package_command(self):
+        path = os.path.join(self.directory, "deck.apkg")
+        write_apkg(path, [
+            (["<b>Capital</b> of France?", "Paris&nbsp;"], 2, 30, 10, {"s": 42.0, "d": 6.5}),
+            (["New card", "Not reviewed yet"], 0, 1, 0, None),
+            (["Learning<br>card", "Back"], 1, 1_700_000_600, 0, None),
+        ])
+        flashcard_set = FlashcardSet.objects.create(title="Anki", description="Description", created_by=self.user)
+        FlashcardSetProgress.objects.create(user=self.user, flashcard_set=flashcard_set)
+
+        call_command("import_flashcards", path, "--user", "testuser", "--set", str(flashcard_set.id),
+                     "--with-reviews", stdout=StringIO())
+
+        self.assertEqual(
+            list(Flashcard.objects.filter(flashcard_set=flashcard_set).order_by("id").values_list("front", "back")),
+            [("Capital of France?", "Paris"), ("New card", "Not reviewed yet"), ("Learning\ncard", "Back")],
+        )
+        reviews = {review.flashcard.front: review for review in Review.objects.filter(user=self.user)}
+        self.assertEqual(set(reviews), {"Capital of France?", "Learning\ncard"})
+        created = datetime.fromtimestamp(1_700_000_000, dt_timezone.utc)
+        review = reviews["Capital of France?"]
+        self.assertEqual((review.state, review.stability, review.difficulty), (ReviewState.REVIEW, 42.0, 6.5))
+        self.assertEqual(review.next_review_date, created + timedelta(days=30))
+        self.assertEqual(review.last_review_date, created + timedelta(days=20))
+        self.assertEqual(reviews["Learning\ncard"].next_review_date, created + timedelta(seconds=600))
+
+        progress = FlashcardSetProgress.objects.get(flashcard_set=flashcard_set)
+        self.assertEqual((progress.total_cards, progress.cards_reviewed, progress.cards_mastered), (3, 2, 1))
+
+    def test_compressed_anki_package_is_rejected(self):
+        path = os.path.join(self.directory, "deck.apkg")
+        write_apkg(path, [], member="collection.anki21b")
+        with self.assertRaisesMessage(CommandError, "Support older Anki versions"):
+            call_command("import_flashcards", path, "--user", "testuser", stdout=StringIO())
+
+    def test_cards_are_inserted_in_batches(self):
+        path = self.write_file("deck.csv", "".join(f"Front {i},Back {i}\n" for i in range(35)))
+        with CaptureQueriesContext(connection) as queries:
+            call_command("import_flashcards", path, "--user", "testuser", "--batch-size", "10", stdout=StringIO())
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "flashcards_flashcard"')]
+        self.assertEqual(len(inserts), 4)
+        self.assertEqual(Flashcard.objects.count(), 35)
+
+
+class FlashcardExportTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="SQL", description="Description", created_by=self.user)
+        self.reviewed = Flashcard.objects.create(front="What is SQL?", back="Structured, \"Query\"\nLanguage",
+                                                 flashcard_set=self.flashcard_set)
+        Flashcard.objects.create(front="New card", back="Not reviewed", flashcard_set=self.flashcard_set)
+        self.review = Review.objects.create(
+            user=self.user, flashcard=self.reviewed, state=ReviewState.REVIEW, stability=25.5, difficulty=4.2,
+            repetitions=3, lapses=1, last_review_date=timezone.now() - timedelta(days=10),
+            next_review_date=timezone.now() + timedelta(days=15),
+        )
+        # Another user's review of the same card is not exported
+        other = get_user_model().objects.create_user(username="other", email="other@example.com", password="password")
+        Review.objects.create(user=other, flashcard=self.reviewed, next_review_date=timezone.now())
+
+        self.other_set = FlashcardSet.objects.create(title="Chemistry", description="Elements, bonds",
+                                                     created_by=self.user)
+        Flashcard.objects.create(front="Symbol of gold?", back="Au", flashcard_set=self.other_set)
+
+    def export(self, export_format):
+        response = self.client.get(reverse("export-flashcards"), {"format": export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def assert_round_trip(self, content, import_format):
+        originals = [self.flashcard_set, self.other_set]
+        upload = SimpleUploadedFile(f"export.{import_format}", content)
+        self.client.post(reverse("import-flashcards"), {"file": upload, "title": "Copy", "with_reviews": "on"})
+
+        copies = list(FlashcardSet.objects.exclude(id__in=[original.id for original in originals]).order_by("id"))
+        self.assertEqual([(copy.title, copy.description) for copy in copies],
+                         [(original.title, original.description) for original in originals])
+        for original, copy in zip(originals, copies):
+            self.assertEqual(
+                list(Flashcard.objects.filter(flashcard_set=copy).order_by("id").values_list("front", "back")),
+                list(Flashcard.objects.filter(flashcard_set=original).order_by("id").values_list("front", "back")),
+            )
+        review = Review.objects.get(user=self.user, flashcard__flashcard_set__in=copies)
+        self.assertEqual(review.flashcard.flashcard_set, copies[0])
+        self.assertEqual(
+            [getattr(review, field) for field in REVIEW_FIELDS],
+            [getattr(self.review, field) for field in REVIEW_FIELDS],
+        )
+
+    def test_csv_round_trip(self):
+        self.assert_round_trip(self.export("csv"), "csv")
+
+    def test_ndjson_round_trip(self):
+        content = self.export("ndjson")
+        lines = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([line["review"] is None for line in lines], [False, True, True])
+        self.assert_round_trip(content, "ndjson")
+
+    def test_export_is_read_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export_rows(self.user, chunk_size=1))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(queries), 1)  # One server-side cursor, fetched in chunks
+
+    def test_other_users_sets_are_not_exported(self):
+        other_set = FlashcardSet.objects.create(title="Other", description="Description",
+                                                created_by=get_user_model().objects.get(username="other"))
+        Flashcard.objects.create(front="Private", back="Card", flashcard_set=other_set)
+        content = b"".join(self.client.get(reverse("export-flashcards")).streaming_content).decode()
+        self.assertNotIn("Private", content)
+        self.assertEqual(self.client.get(reverse("export-flashcards"), {"set": other_set.id}).status_code, 404)
+        self.assertEqual(self.client.get(reverse("export-flashcards"), {"set": "abc"}).status_code, 400)
+
+    def test_command_exports_all_users(self):
+        other_set = FlashcardSet.objects.create(title="Other", description="Description",
+                                                created_by=get_user_model().objects.get(username="other"))
+        Flashcard.objects.create(front="Private", back="Card", flashcard_set=other_set)
+        output = StringIO()
+        call_command("export_flashcards", "--format", "ndjson", stdout=output)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([(line["user"], line["front"]) for line in lines],
+                         [("testuser", "What is SQL?"), ("testuser", "New card"), ("testuser", "Symbol of gold?"),
+                          ("other", "Private")])
+
+
+class FlashcardSearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.client.login(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Biology", description="Description", created_by=self.user)
+        self.photosynthesis = Flashcard.objects.create(front="What is photosynthesis?", back="Light to sugar",
+                                                       flashcard_set=self.flashcard_set)
+        self.chlorophyll = Flashcard.objects.create(front="What absorbs light?", back="Chlorophyll, for photosynthesis",
+                                                    flashcard_set=self.flashcard_set)
+        other = get_user_model().objects.create_user(username="other", email="other@example.com", password="password")
+        other_set = FlashcardSet.objects.create(title="Other", description="Description", created_by=other)
+        Flashcard.objects.create(front="Photosynthesis", back="Private", flashcard_set=other_set)
+
+    def search(self, query, **kwargs):
+        return search_flashcards(self.user, query, **kwargs)[0]
+
+    def test_ranks_front_matches_first_and_matches_prefixes(self):
+        self.assertEqual(self.search("photo"), [self.photosynthesis, self.chlorophyll])
+        self.assertEqual(self.search("LIGHT chloro"), [self.chlorophyll])
+        self.assertEqual(self.search("\"light\" -sugar*"), [self.photosynthesis])  # Operators are ignored
+        self.assertEqual(self.search("  "), [])
+
+    def test_index_follows_edits_bulk_inserts_and_deletes(self):
+        self.photosynthesis.front = "What is respiration?"
+        self.photosynthesis.save()
+        self.assertEqual(self.search("respiration"), [self.photosynthesis])
+        self.assertEqual(self.search("photosynthesis"), [self.chlorophyll])
+
+        created = Flashcard.objects.bulk_create([
+            Flashcard(front=f"Cell {i}", back="Mitochondria", flashcard_set=self.flashcard_set) for i in range(3)
+        ])
+        self.assertEqual(self.search("mito"), created)
+
+        self.chlorophyll.delete()
+        self.assertEqual(self.search("photosynthesis"), [])
+        self.flashcard_set.delete()
+        self.assertEqual(self.search("mito"), [])
+
+    def test_pagination(self):
+        Flashcard.objects.bulk_create([
+            Flashcard(front=f"Enzyme {i}", back="Protein", flashcard_set=self.flashcard_set) for i in range(5)
+        ])
+        first, has_next = search_flashcards(self.user, "enzyme", page=1, page_size=2)
+        last, last_has_next = search_flashcards(self.user, "enzyme", page=3, page_size=2)
+        self.assertTrue(has_next)
+        self.assertFalse(last_has_next)
+        self.assertEqual(len(last), 1)
+        self.assertEqual(first + search_flashcards(self.user, "enzyme", page=2, page_size=2)[0] + last,
+                         list(Flashcard.objects.filter(front__startswith="Enzyme").order_by("id")))
+
+    def test_fallback_matches_the_same_cards(self):
+        ids = _search_like(self.user, ["photosynthesis"], None, limit=10, offset=0)
+        self.assertEqual(sorted(ids), sorted([self.photosynthesis.id, self.chlorophyll.id]))
+
+    def test_search_api(self):
+        response = self.client.get(reverse("search-api"), {"q": "photo", "limit": 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([card["id"] for card in data["cards"]], [self.photosynthesis.id])
+        self.assertEqual(data["cards"][0]["flashcard_set_title"], "Biology")
+        self.assertEqual(data["next_page"], 2)
+
+        self.assertEqual(self.client.get(reverse("search-api"), {"q": "photo", "page": 0}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("search-api"), {"q": "photo", "set": "abc"}).status_code, 400)
+        other_set = FlashcardSet.objects.get(title="Other")
+        self.assertEqual(self.client.get(reverse("search-api"), {"q": "photo", "set": other_set.id}).status_code, 404)
+
+
+class DuplicateDetectionTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="password")
+        self.flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=self.user)
+        FlashcardSetProgress.objects.create(user=self.user, flashcard_set=self.flashcard_set)
+        self.original = Flashcard.objects.create(
+            front="What is photosynthesis?", back="The process by which plants turn light into sugar",
+            flashcard_set=self.flashcard_set,
+        )
+
+    def test_finds_near_duplicates_only(self):
+        duplicate = Flashcard.objects.create(
+            front="what is Photosynthesis ?!", back="The process by which plants turn light into sugar.",
+            flashcard_set=self.flashcard_set,
+        )
+        Flashcard.objects.create(front="What is respiration?", back="The process by which cells turn sugar into energy",
+                                 flashcard_set=self.flashcard_set)
+        Flashcard.objects.create(front="What is 2 + 2?", back="4", flashcard_set=self.flashcard_set)
+        Flashcard.objects.create(front="What is 2 + 3?", back="5", flashcard_set=self.flashcard_set)
+
+        self.assertEqual(find_duplicates(Flashcard.objects.all()), [(duplicate.id, self.original.id)])
+
+    def test_large_sets_are_checked_in_batches(self):
+        rng = random.Random(1)
+        words = ["".join(rng.choice("abcdefghijklmnop") for _ in range(6)) for _ in range(2000)]
+        cards = [(i, " ".join(rng.choices(words, k=8)), " ".join(rng.choices(words, k=6))) for i in range(5000)]
+        # Every 50th card comes back with changed case and punctuation
+        cards += [(5000 + i, front.upper() + "?", back + ".") for i, front, back in cards[::50]]
+
+        index = DuplicateIndex()
+        duplicates = index.add_unique(cards)
+        self.assertEqual(duplicates, [None] * 5000 + [i for i, _, _ in cards[:5000:50]])
+        # The band keys of the 11 batches are kept in merged sorted runs, not one array copied per batch
+        self.assertLessEqual(len(index._runs), math.ceil(math.log2(11)) + 1)
+
+    def test_ai_pipeline_skips_duplicates(self):
+        data = [
+            {"front": "What is photosynthesis", "back": "The process by which plants turn light into sugar!"},
+            {"front": "What is respiration?", "back": "Cells turning sugar into energy"},
+            "Invalid",
+            {"front": "What is respiration?", "back": "Cells turning sugar into energy."},
+        ]
+        created_count, errors = create_flashcards_from_ai_data(data, self.flashcard_set)
+
+        self.assertEqual(created_count, 1)
+        self.assertEqual(errors, [
+            {"index": 0, "message": "Near-duplicate of another flashcard"},
+            {"index": 2, "message": "Flashcard is not an object"},
+            {"index": 3, "message": "Near-duplicate of another flashcard"},
+        ])
+        self.assertEqual(FlashcardSetProgress.objects.get(flashcard_set=self.flashcard_set).total_cards, 1)
+
+        with override_settings(DUPLICATE_FILTER=False):
+            self.assertEqual(create_flashcards_from_ai_data(data, self.flashcard_set)[0], 3)
+
+    def test_import_skips_duplicates(self):
+        rows = [("What is photosynthesis?", "The process by which plants turn light into sugar", None, None),
+                ("Mitochondria", "Powerhouse of the cell", None, None),
+                ("mitochondria", "powerhouse of the cell", None, None)]
+        result = import_cards(rows, self.flashcard_set, batch_size=2)
+        self.assertEqual((result["created"], result["skipped"], result["duplicates"]), (1, 2, 2))
+        self.assertEqual([error["row"] for error in result["errors"]], [1, 3])
+
+        result = import_cards(rows, self.flashcard_set, deduplicate=False)
+        self.assertEqual(result["created"], 3)
+
+    def test_web_import_can_keep_duplicates(self):
+        self.client.login(username="testuser", password="password")
+        content = b"front,back\nMitochondria,Powerhouse of the cell\nmitochondria,powerhouse of the cell\n"
+        self.client.post(reverse("import-flashcards"), {"file": SimpleUploadedFile("deck.csv", content)})
+        self.client.post(reverse("import-flashcards"), {"file": SimpleUploadedFile("kept.csv", content),
+                                                        "keep_duplicates": "on"})
+
+        self.assertEqual(Flashcard.objects.filter(flashcard_set__title="deck").count(), 1)
+        self.assertEqual(Flashcard.objects.filter(flashcard_set__title="kept").count(), 2)
+
+    def test_command_deletes_duplicates(self):
+        Flashcard.objects.create(front="What is photosynthesis", back=self.original.back, flashcard_set=self.flashcard_set)
+        FlashcardSetProgress.objects.filter(flashcard_set=self.flashcard_set).update(total_cards=2)
+
+        output = StringIO()
+        call_command("find_duplicates", "--user", "testuser", stdout=output)
+        self.assertIn("Found 1 near-duplicate flashcard(s).", output.getvalue())
+        self.assertEqual(Flashcard.objects.count(), 2)
+
+        call_command("find_duplicates", "--delete", stdout=StringIO())
+        self.assertEqual(list(Flashcard.objects.all()), [self.original])
+        self.assertEqual(FlashcardSetProgress.objects.get(flashcard_set=self.flashcard_set).total_cards, 1)
+
+
+class WorkloadSimulatorTest(TestCase):
+    REVIEW = FSRS.STATE_CODES[ReviewState.REVIEW]
+
+    def simulate(self, due, stability=1e6, **kwargs):
+        count = len(due)
+        return simulate_workload(
+            FSRS(), np.full(count, self.REVIEW), np.full(count, stability), np.full(count, 5.0),
+            np.full(count, -1.0), np.array(due, dtype=float), rng=np.random.default_rng(0), **kwargs
+        )
+
+    def test_well_known_cards_are_reviewed_once_when_due(self):
+        forecast = self.simulate([-2.0, 0.5, 3.5, 3.9, 40.0], days=5)
+        self.assertEqual(forecast["due"].tolist(), [2, 0, 0, 2, 0])
+        self.assertEqual(forecast["reviews"].tolist(), [2, 0, 0, 2, 0])
+        self.assertEqual(forecast["writes"].tolist(), [2 * WRITES_PER_REVIEW, 0, 0, 2 * WRITES_PER_REVIEW, 0])
+
+    def test_daily_limit_carries_the_backlog_over(self):
+        forecast = self.simulate([-1.0] * 100, days=5, daily_limit=30)
+        self.assertEqual(forecast["reviews"].tolist(), [30, 30, 30, 10, 0])
+        self.assertEqual(forecast["due"].tolist(), [100, 70, 40, 10, 0])
+
+    def test_forgotten_cards_are_relearned(self):
+        # Stability of a few minutes: the cards are forgotten when reviewed a day late and relearned the same day
+        forecast = self.simulate([-1.0] * 50, stability=0.01, days=1)
+        self.assertGreater(forecast["reviews"][0], 50)
+
+    def test_new_cards_are_introduced_at_the_given_rate(self):
+        forecast = self.simulate([], days=5, new_cards_per_day=5, unseen_cards=12,
+                                 first_ratings=np.array([0.0, 0.0, 0.0, 1.0]))
+        self.assertEqual(forecast["new"].tolist(), [5, 5, 2, 0, 0])
+        # Rated Easy, so each new card is reviewed once on its first day and comes back after about 4 days
+        self.assertEqual(forecast["reviews"][:3].tolist(), [5, 5, 2])
+        self.assertGreaterEqual(forecast["reviews"][3], 5)
+        self.assertEqual(forecast["writes"][0], 5 * WRITES_PER_REVIEW + 5 * WRITES_PER_NEW_CARD)
+
+    def test_user_forecast_and_command(self):
+        now = timezone.now()
+        for username in ("testuser", "other"):
+            user = get_user_model().objects.create_user(username=username, email=f"{username}@example.com",
+                                                        password="password")
+            flashcard_set = FlashcardSet.objects.create(title="Set", description="Description", created_by=user)
+            for i in range(3):
+                flashcard = Flashcard.objects.create(front=f"Question {i}", back="Answer", flashcard_set=flashcard_set)
+                Review.objects.create(user=user, flashcard=flashcard, state=ReviewState.REVIEW, stability=1e6,
+                                      repetitions=1, last_review_date=now - timedelta(days=1),
+                                      next_review_date=now + timedelta(days=i, hours=1))
+                ReviewLog.objects.create(user=user, flashcard=flashcard, rating=4, state=ReviewState.NEW,
+                                         stability=0, difficulty=5, reviewed_at=now - timedelta(days=1))
+            Flashcard.objects.create(front="Unseen", back="Answer", flashcard_set=flashcard_set)
+
+        user = get_user_model().objects.get(username="testuser")
+        first_ratings, _ = rating_distributions(user)
+        self.assertAlmostEqual(first_ratings.sum(), 1.0)
+        self.assertGreater(first_ratings[3], 0.1)  # The user's Easy first ratings shift the default distribution
+
+        forecast = forecast_user_workload(user, days=3, now=now, new_cards_per_day=0, seed=1)
+        self.assertEqual(forecast["reviews"].tolist(), [1, 1, 1])
+
+        output = StringIO()
+        call_command("forecast_workload", "--days", "3", "--new-cards-per-day", "0", "--seed", "1", stdout=output)
+        self.assertIn("Forecast for 2 user(s): 6 review(s) in 3 day(s)", output.getvalue())
+
+        self.client.login(username="testuser", password="password")
+        response = self.client.get(reverse("workload-forecast-api"), {"days": 2})
+        self.assertEqual([day["due"] for day in response.json()["days"]][:1], [1])
@@ -10,8 +10,15 @@ urlpatterns = [
     path("add-flashcard/<int:flashcard_set_id>/", views.add_flashcard, name="add-flashcard"),
     path("delete-flashcard/<int:flashcard_id>/", views.delete_flashcard, name="delete-flashcard"),
     path("add-flashcard-set/", views.add_flashcard_set, name="add-flashcard-set"),
+    path("import/", views.import_flashcards, name="import-flashcards"),
+    path("export/", views.export_flashcards, name="export-flashcards"),
+    path("generation-jobs/<int:job_id>/", views.generation_job_status, name="generation-job-status"),
     path("delete-flashcard-set/<int:flashcard_set_id>/", views.delete_flashcard_set, name="delete-flashcard-set"),
     path("review-due/", views.review_due, name="review-due"),
     path("review-set/start/<int:set_id>/", views.start_set_review_session, name="start-set-review"),
+    path("review-all/start/", views.start_due_review_session, name="start-due-review"),
     path("review-due-card/<int:flashcard_id>/", views.review_due_card_view, name="review-due-card"),
+    path("api/due/", views.due_queue_api, name="due-queue-api"),
+    path("api/search/", views.search_api, name="search-api"),
+    path("api/forecast/", views.workload_forecast_api, name="workload-forecast-api"),
 ]
@@ -1,26 +1,58 @@
 import json
-import os
-import fitz
-import requests
 import logging
+from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
 from django.http import JsonResponse
-from django.utils import timezone
 from django.shortcuts import redirect
-from dotenv import load_dotenv
-from datetime import timedelta
-from .models import Review, ReviewState
-from .fsrs import FSRS
+from django.urls import reverse
+from django.utils import timezone
 
-from flashcards.models import FlashcardSet, Flashcard
-from .services import update_stats_after_review
+from flashcards.models import FlashcardSet, Flashcard, GenerationJob, GenerationJobStatus
+from . import gemini
+from .chunking import generate_in_chunks
+from .dedup import get_duplicate_index
+from .gemini import get_client
+from .generation_cache import generation_cache_key, get_cached_flashcards, cache_flashcards
+from .pdf_extraction import extract_text_from_upload
+from .services import submit_review, register_flashcards_added
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+FLASHCARD_PROMPT_TEMPLATE = """Create {num_flashcards} flashcards from the following content:
+    {text}
+
+    Each flashcard should have:
+    - A clear, specific question (front)
+    - A concise, accurate answer (back)
+    - Focus on key concepts and important information
+
+    Format response as JSON array of objects with "front" and "back" keys.
+    Example: [{{"front": "What is SQL?", "back": "Structured Query Language"}}]"""
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "response_mime_type": "application/json",
+}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
 
 
 def extract_and_validate_form_data(request, is_flashcard_set=True):
@@ -91,8 +123,11 @@ def create_flashcard_set(user, form_data):
 
 def handle_ai_generation(request, target_object, form_data):
     """
-    Handles AI-based flashcard generation for a flashcard set or individual flashcard context.
+    Queues AI-based flashcard generation for a flashcard set or individual flashcard context.
 
+    The content is extracted from the request here, while the call to the AI service runs later in the
+    generation worker (see jobs.py), so the request returns immediately. Content found in the generation
+    cache is added to the set right away.
     This function supports both standard HTTP requests and AJAX (XHR) requests, adjusting
     its response format accordingly.
 
@@ -115,34 +150,35 @@ def handle_ai_generation(request, target_object, form_data):
         messages.warning(request, error_message)
         return False, None
 
-    try:
-        flashcards = generate_flashcards_data_with_ai(text_input, form_data["num_flashcards"])
-        created_count = create_flashcards_from_ai_data(flashcards, target_object)
-
-        success_message = f"Successfully generated {created_count} flashcard(s)!"
-        messages.success(request, success_message)
-
-        if is_ajax(request):
-            return True, {"count": created_count}  # SUCCESS — AJAX: Return flashcard count in JSON
-        return True, None  # SUCCESS — HTTP: Just return success, no JSON needed
-
-    except requests.exceptions.RequestException as e:
-        error_message = f"AI service error: {e}"
-    except Exception as e:
-        error_message = f"An unexpected error occurred: {e}"
+    job = GenerationJob(
+        user=request.user,
+        flashcard_set=target_object,
+        text=text_input,
+        num_flashcards=form_data["num_flashcards"],
+    )
 
-    logger.error(error_message)
+    # Content generated before is added right away instead of being queued
+    cached_flashcards = get_cached_flashcards(get_ai_cache_key(text_input, form_data["num_flashcards"]))
+    if cached_flashcards is not None:
+        job.created_count, errors = create_flashcards_from_ai_data(cached_flashcards, target_object)
+        job.error = describe_skipped_flashcards(errors)
+        job.status = GenerationJobStatus.SUCCEEDED
+        job.started_at = job.finished_at = timezone.now()
+        job.save()
+        messages.success(request, f"Successfully generated {job.created_count} flashcard(s)!")
+    else:
+        job.save()
+        messages.info(request, "Generating flashcards in the background, they will appear in the set shortly.")
 
     if is_ajax(request):
-        return False, {"status": "error", "message": error_message}
-
-    messages.error(request, error_message)
-    return False, None
+        return True, {"job_id": job.id, "status_url": reverse("generation-job-status", args=[job.id])}
+    return True, None
 
 
 def extract_text_for_ai(request, form_data):
     """
     Extracts text from the provided PDF file or topic for AI processing.
+    PDFs are read page by page up to the PDF_MAX_PAGES and PDF_MAX_CHARS budgets (see pdf_extraction.py).
 
     :param request: The HTTP request object.
     :param form_data: A dictionary containing the form data.
@@ -152,9 +188,7 @@ def extract_text_for_ai(request, form_data):
 
     if form_data["pdf_file"]:
         try:
-            pdf_bytes = form_data["pdf_file"].read()
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-                text_for_ai = "\n".join([page.get_text() for page in doc])
+            text_for_ai = extract_text_from_upload(form_data["pdf_file"])
         except Exception as e:
             print(f"Error processing PDF: {e}")
             messages.warning(request, "PDF processing failed, using topic text instead.")
@@ -163,58 +197,58 @@ def extract_text_for_ai(request, form_data):
     return text_for_ai
 
 
+def get_ai_cache_key(text, num_flashcards):
+    """ Returns the generation cache key of an AI request (see generation_cache.py). """
+    return generation_cache_key(
+        text, FLASHCARD_PROMPT_TEMPLATE, num_flashcards=num_flashcards, model=gemini.GEMINI_API_URL,
+        generation_config=GENERATION_CONFIG, safety_settings=SAFETY_SETTINGS,
+        chunk_tokens=settings.AI_CHUNK_TOKENS, chunk_overlap_tokens=settings.AI_CHUNK_OVERLAP_TOKENS,
+    )
+
+
 def generate_flashcards_data_with_ai(text, num_flashcards):
     """
     Leverages the Gemini API to extract key concepts and formulate them
     into question-and-answer pairs suitable for flashcards.
+    Long texts are split into sections that are generated concurrently (see chunking.py).
+    Results are stored in the generation cache and reused for identical requests, unless a section failed.
 
     :param text: The text content to generate flashcards from.
     :param num_flashcards: The number of flashcards to generate.
     :return: A list of dictionaries, where each dictionary represents a flashcard
             with "front" and "back" keys (both strings).
     """
-    prompt = f"""Create {num_flashcards} flashcards from the following content:
-    {text}
+    cache_key = get_ai_cache_key(text, num_flashcards)
+    # Another job may have generated the same content since this one was queued
+    cached_flashcards = get_cached_flashcards(cache_key, record_stats=False)
+    if cached_flashcards is not None:
+        return cached_flashcards
+
+    flashcards_data, errors = generate_in_chunks(
+        text, num_flashcards, request_flashcards_from_ai,
+        max_tokens=settings.AI_CHUNK_TOKENS,
+        overlap_tokens=settings.AI_CHUNK_OVERLAP_TOKENS,
+        max_concurrency=settings.AI_MAX_CONCURRENT_REQUESTS,
+    )
+    # A partial result is used once, but the next request for the text tries the failed sections again
+    if not errors and validate_ai_flashcards(flashcards_data)[0]:
+        cache_flashcards(cache_key, flashcards_data)
+    return flashcards_data
 
-    Each flashcard should have:
-    - A clear, specific question (front)
-    - A concise, accurate answer (back)
-    - Focus on key concepts and important information
 
-    Format response as JSON array of objects with "front" and "back" keys.
-    Example: [{{"front": "What is SQL?", "back": "Structured Query Language"}}]"""
+def request_flashcards_from_ai(text, num_flashcards):
+    """
+    Sends one generation request to the Gemini API.
 
-    response = requests.post(
-        GEMINI_API_URL + f"?key={GEMINI_API_KEY}",
-        headers={"Content-Type": "application/json"},
-        json={
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": 0.7,
-                "response_mime_type": "application/json",
-            },
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-        }
-    )
-    response.raise_for_status()
-    gemini_data = response.json()
+    :return: The list of flashcard dictionaries returned by the model.
+    """
+    prompt = FLASHCARD_PROMPT_TEMPLATE.format(num_flashcards=num_flashcards, text=text)
+
+    gemini_data = get_client().generate_content({
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": GENERATION_CONFIG,
+        "safetySettings": SAFETY_SETTINGS,
+    })
 
     if (gemini_data.get("candidates") and
             gemini_data["candidates"][0].get("content", {}).get("parts")):
@@ -227,81 +261,106 @@ def generate_flashcards_data_with_ai(text, num_flashcards):
     raise ValueError("No valid response from AI service")
 
 
-def create_flashcards_from_ai_data(flashcards_data, flashcard_set):
+def validate_ai_flashcards(flashcards_data):
+    """
+    Validates the flashcards returned by the AI service.
+
+    :param flashcards_data: List of flashcard dictionaries with "front" and "back" keys.
+    :return: Tuple (valid, errors): valid is a list of (front, back) tuples with stripped text,
+             errors a list of {"index": int, "message": str} dictionaries for the rejected items.
+    :raises ValueError: If flashcards_data is not a list.
+    """
     if not isinstance(flashcards_data, list):
         raise ValueError("Expected list of flashcards from AI")
 
-    created_count = 0
-    for card_data in flashcards_data:
-        try:
-            if isinstance(card_data, dict) and card_data.get("front") and card_data.get("back"):
-                Flashcard.objects.create(
-                    front=card_data["front"].strip(),
-                    back=card_data["back"].strip(),
-                    flashcard_set=flashcard_set
-                )
-                created_count += 1
-        except Exception as e:
-            print(f"Error creating flashcard: {e}")
-            continue
+    max_lengths = {field: Flashcard._meta.get_field(field).max_length for field in ("front", "back")}
 
-    if created_count == 0:
-        raise ValueError("No valid flashcards created from AI data")
-    return created_count
+    valid = []
+    errors = []
+    for index, card_data in enumerate(flashcards_data):
+        if not isinstance(card_data, dict):
+            errors.append({"index": index, "message": "Flashcard is not an object"})
+            continue
 
+        sides = {}
+        for field, max_length in max_lengths.items():
+            value = card_data.get(field)
+            if not isinstance(value, str) or not value.strip():
+                errors.append({"index": index, "message": f"Missing {field}"})
+                break
+            if len(value.strip()) > max_length:
+                message = f"{field.capitalize()} is longer than {max_length} characters"
+                errors.append({"index": index, "message": message})
+                break
+            sides[field] = value.strip()
+        else:
+            valid.append((sides["front"], sides["back"]))
 
-def is_ajax(request):
-    """ Check if the request is an AJAX request. """
-    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
+    return valid, errors
 
 
-def update_review_state(user, flashcard, rating):
-    now = timezone.now()
-    review_state, created = Review.objects.get_or_create(
-        user=user,
-        flashcard=flashcard,
-        defaults={
-            "state": ReviewState.NEW,
-            "stability": 0.0, # Initial S before first calc
-            "difficulty": FSRS.DEFAULT_PARAMS[4], # Initial D often set near w[4]
-            "repetitions": 0,
-            "lapses": 0,
-            "last_review_date": None,
-            "next_review_date": now # Set initial next_review_date to now to make it appear immediately
-        }
-    )
+def create_flashcards_from_ai_data(flashcards_data, flashcard_set):
+    """
+    Validates the flashcards returned by the AI service and adds the valid ones to the set
+    with a single bulk insert. Near-duplicates of the set's cards or of each other are skipped
+    if settings.DUPLICATE_FILTER is on (see dedup.py).
+
+    :param flashcards_data: List of flashcard dictionaries with "front" and "back" keys.
+    :param flashcard_set: The FlashcardSet the flashcards are added to.
+    :return: Tuple (created_count, errors) with the errors of the skipped items (see validate_ai_flashcards).
+    :raises ValueError: If the data is not a list or holds no valid flashcard.
+    """
+    valid, errors = validate_ai_flashcards(flashcards_data)
+    if not valid:
+        for error in errors:
+            logger.warning(f"Skipping AI flashcard {error['index']}: {error['message']}")
+        raise ValueError("No valid flashcards created from AI data")
 
-    # Instantiate the FSRS calculator
-    fsrs_calc = FSRS()
-
-    # Perform the FSRS calculation
-    result = fsrs_calc.update_state(
-        current_state=review_state.state,
-        current_s=review_state.stability,
-        current_d=review_state.difficulty,
-        last_review_date=review_state.last_review_date,
-        now=now,
-        app_rating=rating
-    )
+    if settings.DUPLICATE_FILTER:
+        rejected = {error["index"] for error in errors}
+        indices = [index for index in range(len(flashcards_data)) if index not in rejected]
+        duplicates = get_duplicate_index(flashcard_set).add_unique(
+            (f"new-{index}", front, back) for index, (front, back) in zip(indices, valid)
+        )
+        errors += [{"index": index, "message": "Near-duplicate of another flashcard"}
+                   for index, duplicate in zip(indices, duplicates) if duplicate is not None]
+        valid = [card for card, duplicate in zip(valid, duplicates) if duplicate is None]
+        errors.sort(key=lambda error: error["index"])
+
+    for error in errors:
+        logger.warning(f"Skipping AI flashcard {error['index']}: {error['message']}")
+
+    with transaction.atomic():
+        Flashcard.objects.bulk_create([
+            Flashcard(front=front, back=back, flashcard_set=flashcard_set) for front, back in valid
+        ])
+        register_flashcards_added(flashcard_set, len(valid))
+    return len(valid), errors
+
+
+def describe_skipped_flashcards(errors):
+    """
+    Describes the flashcards skipped by create_flashcards_from_ai_data, for the error of a generation job.
 
-    # Update the Review object with the new state
-    review_state.stability = result["new_s"]
-    review_state.difficulty = result["new_d"]
-    review_state.state = result["new_state"]
-    review_state.last_review_date = now
-    review_state.next_review_date = now + timedelta(days=result["interval"])
+    :param errors: List of {"index": int, "message": str} dictionaries.
+    :return: E.g. "Skipped 2 invalid or duplicate flashcard(s): 1: Missing back; 3: Near-duplicate of another
+             flashcard", or an empty string if nothing was skipped.
+    """
+    if not errors:
+        return ""
+    details = "; ".join(f"{error['index']}: {error['message']}" for error in errors)
+    return f"Skipped {len(errors)} invalid or duplicate flashcard(s): {details}"
 
-    # Update repetitions and lapses
-    review_state.repetitions += 1
-    if rating == 1:
-        review_state.lapses += 1
 
-    # Store the last rating given (optional)
-    # review_state.last_performance_rating = user_rating
+def is_ajax(request):
+    """ Check if the request is an AJAX request. """
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
 
-    review_state.save()
 
-    # Update daily stats and set progress (rating > 2, maybe change number later)
-    update_stats_after_review(review_state, performance_correct=(rating > 2))
+def update_review_state(user, flashcard, rating):
+    """
+    Applies a rating to the user's review state of a flashcard.
 
-    return review_state
+    See services.submit_review for the transactional details.
+    """
+    return submit_review(user, flashcard, rating)
@@ -1,16 +1,30 @@
+import csv
 import os
+import sqlite3
+import zipfile
 from datetime import timedelta
 
-from django.db.models import Count, Q
+from django.db import transaction
 from django.utils import timezone
 from django.contrib import messages
 from django.urls import reverse
 from dotenv import load_dotenv
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
-from .models import Flashcard, FlashcardSet, DailyUserStats, Review, ReviewState
+from .models import Flashcard, FlashcardSet, DailyUserStats, GenerationJob, Review
+from .due_queue import DEFAULT_PAGE_SIZE, get_due_page
+from .exporters import CONTENT_TYPES, EXPORT_FORMATS, export_csv, export_ndjson, export_rows
+from .importers import ImportedSets, detect_format, import_cards, open_text, parse_apkg, parse_text
+from .pdf_extraction import spooled_upload
+from .search import DEFAULT_PAGE_SIZE as SEARCH_PAGE_SIZE, search_flashcards
+from .simulator import forecast_user_workload
+from .review_sessions import (SESSION_KEY, start_review_session, get_review_session, advance_review_session,
+                              get_remaining_daily_reviews)
+from .due_counts import get_due_counts_by_set, get_due_forecast
+from .services import (get_flashcard_sets_with_progress, calculate_progress_data, get_current_streak,
+                       register_flashcards_added, register_flashcard_removed)
 from .utils import extract_and_validate_form_data, create_flashcard_set, handle_ai_generation, update_review_state
 
 load_dotenv()
@@ -24,45 +38,29 @@ def index(request):
     user = request.user
     today = timezone.now().date()
 
-    # Fetch all flashcard sets
-    flashcard_sets = FlashcardSet.objects.all().filter(created_by=request.user)
+    # Fetch all flashcard sets together with their progress counts in one query
+    flashcard_sets = get_flashcard_sets_with_progress(user)
 
+    due_counts = get_due_counts_by_set(user)
     for flashcard_set in flashcard_sets:
-        flashcards = flashcard_set.flashcard_set.all()
-        total_cards = flashcards.count()
-
-        progress_data = {
-            "green": 0,
-            "yellow": 0,
-            "gray": 0,
-        }
-
-        if total_cards > 0:
-            reviewed = Review.objects.filter(user=user, flashcard__in=flashcards)
-
-            # Still to be figured out
-            green = reviewed.filter(state__in=[ReviewState.REVIEW]).count()
-            yellow = reviewed.filter(state__in=[ReviewState.LEARNING, ReviewState.RELEARNING]).count()
-
-            # calculate percentages
-            progress_data["green"] = int((green / total_cards) * 100)
-            progress_data["yellow"] = int((yellow / total_cards) * 100)
-            progress_data["gray"] = max(0, 100 - (progress_data["green"] + progress_data["yellow"]))
-
-        flashcard_set.progress = progress_data
+        flashcard_set.progress = calculate_progress_data(
+            flashcard_set.total_cards,
+            flashcard_set.green_cards,
+            flashcard_set.yellow_cards,
+        )
+        flashcard_set.due_count = due_counts.get(flashcard_set.id, 0)
 
+    # Cards due now (as in a review session), later today, tomorrow and over the next week
+    due_now = sum(due_counts.values())
+    due_forecast = get_due_forecast(user)
 
     # Daily stats
     today_stats = DailyUserStats.objects.filter(user=user, date=today).first()
     total_reviews = Review.objects.filter(user=user).count()
     total_cards = Flashcard.objects.filter(flashcard_set__created_by=user).count()
 
-    # Number of consecutive days with reviews
-    streak = 0
-    day_cursor = today
-    while DailyUserStats.objects.filter(user=user, date=day_cursor, total_reviews__gt=0).exists():
-        streak += 1
-        day_cursor -= timedelta(days=1)
+    # Number of consecutive days with reviews, maintained on every review
+    streak = get_current_streak(today_stats)
 
     # Pass flashcard_sets and stats to the template
     context = {
@@ -71,6 +69,10 @@ def index(request):
         "total_cards": total_cards,
         "today_reviews": today_stats.total_reviews if today_stats else 0,
         "streak": streak,
+        "due_now": due_now,
+        "due_later_today": max(0, due_forecast[0] - due_now),
+        "due_tomorrow": due_forecast[1],
+        "due_next_week": sum(due_forecast[1:]),
     }
     return render(request, "flashcards/index.html", context)
 
@@ -146,7 +148,7 @@ def add_flashcard(request, flashcard_set_id):
                 success, result = handle_ai_generation(request, flashcard_set, form_data)
                 if not success:
                     return JsonResponse(result, status=400)
-                return JsonResponse({"status": "success", "count": result["count"]})
+                return JsonResponse({"status": "success", **result}, status=202)
 
             # Manual creation
             Flashcard.objects.create(
@@ -154,6 +156,7 @@ def add_flashcard(request, flashcard_set_id):
                 back=form_data["back"],
                 flashcard_set=flashcard_set
             )
+            register_flashcards_added(flashcard_set)
             return JsonResponse({"status": "success", "count": 1})
 
         except Exception as e:
@@ -172,7 +175,9 @@ def delete_flashcard(request, flashcard_id):
         previous_card = flashcard.get_previous_card_in_set()
         next_card = flashcard.get_next_card_in_set()
 
-        flashcard.delete()
+        with transaction.atomic():
+            register_flashcard_removed(flashcard)
+            flashcard.delete()
         messages.success(request, "Deleted flashcard successfully!")
 
         # Check if there are any flashcards left in the set
@@ -211,6 +216,93 @@ def add_flashcard_set(request):
     return render(request, "index.html")
 
 
+@login_required
+def import_flashcards(request):
+    """
+    Imports an uploaded CSV/TSV/NDJSON file or Anki package into new flashcard sets: the sets named by the file's
+    set column (as written by the export), and a set with the given title for the cards without one.
+    Uploads are imported in one transaction (unlike the import_flashcards command, which commits every batch).
+    """
+    if request.method != "POST":
+        return redirect("index")
+
+    uploaded_file = request.FILES.get("file")
+    import_format = detect_format(uploaded_file.name) if uploaded_file else None
+    if import_format is None:
+        messages.error(request, "Please upload a CSV, TSV, NDJSON or Anki (.apkg) file")
+        return redirect("index")
+
+    name = os.path.splitext(uploaded_file.name)[0]
+    user_for_reviews = request.user if request.POST.get("with_reviews") == "on" else None
+    deduplicate = False if request.POST.get("keep_duplicates") == "on" else None
+    try:
+        # One transaction, so a failed upload leaves no empty or partially filled set behind
+        with transaction.atomic():
+            flashcard_set = ImportedSets(request.user, request.POST.get("title", "").strip() or name,
+                                         f"Imported from {uploaded_file.name}")
+            if import_format == "apkg":
+                with spooled_upload(uploaded_file, suffix=".apkg") as path:
+                    result = import_cards(parse_apkg(path), flashcard_set, user_for_reviews,
+                                          deduplicate=deduplicate)
+            else:
+                result = import_cards(parse_text(open_text(uploaded_file), import_format), flashcard_set,
+                                      user_for_reviews, deduplicate=deduplicate)
+    except (ValueError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile, sqlite3.DatabaseError) as e:
+        messages.error(request, f"Import failed: {e}")
+        return redirect("index")
+
+    if len(result["sets"]) == 1:
+        messages.success(request, f"Imported {result['created']} flashcard(s) into '{result['sets'][0].title}'.")
+    else:
+        messages.success(request, f"Imported {result['created']} flashcard(s) into {len(result['sets'])} sets.")
+    if result["skipped"]:
+        messages.warning(request, f"Skipped {result['skipped'] - result['duplicates']} invalid row(s) "
+                                  f"and {result['duplicates']} near-duplicate(s).")
+    return redirect("index")
+
+
+@login_required
+def export_flashcards(request):
+    """
+    Streams the user's flashcards and review state as CSV (default) or NDJSON (?format=ndjson).
+    Pass ?set=<id> to export a single set.
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"status": "error", "message": f"Unknown export format: {export_format}"}, status=400)
+
+    flashcard_set = None
+    if request.GET.get("set"):
+        try:
+            set_id = int(request.GET["set"])
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        flashcard_set = get_object_or_404(FlashcardSet, id=set_id, created_by=request.user)
+
+    rows = export_rows(request.user, flashcard_set)
+    response = StreamingHttpResponse(
+        export_csv(rows) if export_format == "csv" else export_ndjson(rows),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="mnemos-export.{export_format}"'
+    return response
+
+
+@login_required
+def generation_job_status(request, job_id):
+    """
+    Returns the status of an AI generation job as JSON, for polling.
+    """
+    job = get_object_or_404(GenerationJob, id=job_id, user=request.user)
+    return JsonResponse({
+        "id": job.id,
+        "status": job.get_status_display().lower(),
+        "flashcard_set_id": job.flashcard_set_id,
+        "count": job.created_count,
+        "error": job.error,
+    })
+
+
 @login_required
 def delete_flashcard_set(request, flashcard_set_id):
     if request.method == "POST":
@@ -227,24 +319,13 @@ def review_due(request):
     """
     Displays Flashcard Sets that have cards due for review for the current user.
     """
-    now = timezone.now()
     user = request.user
 
-    # Find sets that have at least one flashcard with a review due for this user
-    due_sets = FlashcardSet.objects.filter(
-        created_by=user,  # Assuming FlashcardSet is linked to the user
-        flashcard__review__user=user,
-        flashcard__review__next_review_date__lte=now
-    ).annotate(
-        # Count the number of *due* flashcards within each set for this user
-        due_flashcard_count=Count(
-            "flashcard",
-            filter=Q(flashcard__review__user=user, flashcard__review__next_review_date__lte=now)
-        )
-    ).filter(
-        # Ensure we only list sets that actually have due cards
-        due_flashcard_count__gt=0
-    ).distinct().order_by("title")  # Order sets alphabetically by title
+    # Due counts per set from the materialized daily due counts and today's due reviews (see due_counts.py)
+    due_counts = get_due_counts_by_set(user)
+    due_sets = list(FlashcardSet.objects.filter(created_by=user, id__in=due_counts).order_by("title"))
+    for flashcard_set in due_sets:
+        flashcard_set.due_flashcard_count = due_counts[flashcard_set.id]
 
     context = {
         "due_sets": due_sets,
@@ -256,61 +337,66 @@ def review_due(request):
 def start_set_review_session(request, set_id):
     """
     Initializes a review session for due cards within a specific set.
-    Stores the list of due card IDs in the session and redirects to the first card.
+    The session is stored server-side; the Django session only keeps its id.
     """
-    now = timezone.now()
     user = request.user
     flashcard_set = get_object_or_404(FlashcardSet, id=set_id, created_by=user)
 
-    # Get IDs of flashcards in this set that are due for this user
-    due_card_ids = list(Flashcard.objects.filter(
-        flashcard_set=flashcard_set,
-        review__user=user,
-        review__next_review_date__lte=now
-    ).order_by("review__next_review_date", "id").values_list("id", flat=True))
+    review_session = start_review_session(user, flashcard_set)
 
-    if not due_card_ids:
+    if review_session is None:
         messages.info(request, f"No cards currently due for review in '{flashcard_set.title}'.")
         return redirect("review-due")  # Redirect back to the due sets list
 
-    # Store the list of IDs and the set ID in the session
-    request.session["due_review_set_id"] = set_id
-    request.session["due_review_ids"] = due_card_ids
+    request.session[SESSION_KEY] = review_session.id
+
+    # Redirect to the review view for the first card of the session
+    return redirect("review-due-card", flashcard_id=review_session.current_flashcard_id)
+
 
-    # Redirect to the review view for the first card in the list
-    first_card_id = due_card_ids[0]
-    return redirect("review-due-card", flashcard_id=first_card_id)
+@login_required
+def start_due_review_session(request):
+    """
+    Initializes a review session over the due cards of all the user's sets.
+    Pass ?interleave=1 to alternate between sets instead of following the due order.
+    """
+    user = request.user
+    review_session = start_review_session(user, interleave=request.GET.get("interleave") == "1")
+
+    if review_session is None:
+        if get_remaining_daily_reviews(user) == 0:
+            messages.info(request, "Daily review limit reached. Come back tomorrow!")
+        else:
+            messages.info(request, "No cards currently due for review.")
+        return redirect("review-due")
+
+    request.session[SESSION_KEY] = review_session.id
+    return redirect("review-due-card", flashcard_id=review_session.current_flashcard_id)
 
 
 @login_required
 def review_due_card_view(request, flashcard_id):
     """
     Handles the display and rating submission for a card within a 'due review' session.
-    Uses the session to find the next card.
+    Uses the server-side ReviewSession to find the next card.
     """
+    review_session = get_review_session(request)
+
     # Ensure we are in a review session
-    if "due_review_ids" not in request.session or not request.session["due_review_ids"]:
+    if review_session is None:
         messages.warning(request, "Review session not found or ended. Redirecting.")
-        # Clear potentially lingering session variable if list is empty
-        request.session.pop("due_review_set_id", None)
-        request.session.pop("due_review_ids", None)
+        request.session.pop(SESSION_KEY, None)
         return redirect("review-due")  # Or 'index'
 
-    current_card_id = flashcard_id
-    due_ids = request.session["due_review_ids"]
-    set_id = request.session["due_review_set_id"]
-
-    # Verify the requested card is actually part of the current session list
+    # Verify the requested card is the current card of the session
     # (Prevents accessing cards not in the current due queue via URL manipulation)
-    # Convert due_ids elements to int if they aren't already (session might store strings)
-    if current_card_id not in [int(id_val) for id_val in due_ids]:
+    if flashcard_id != review_session.current_flashcard_id:
         messages.error(request, "Invalid card requested for this review session.")
-        # Clear session and redirect
-        request.session.pop("due_review_set_id", None)
-        request.session.pop("due_review_ids", None)
+        review_session.delete()
+        request.session.pop(SESSION_KEY, None)
         return redirect("review-due")
 
-    flashcard = get_object_or_404(Flashcard, id=current_card_id)
+    flashcard = get_object_or_404(Flashcard, id=flashcard_id)
     show_back = request.GET.get("show_back", False)
     user = request.user
 
@@ -319,37 +405,106 @@ def review_due_card_view(request, flashcard_id):
 
         update_review_state(user, flashcard, rating)
 
-        # --- Session Logic for Next Card ---
-        # Remove the just reviewed card ID (convert to int for comparison)
-        try:
-            # Ensure we are working with integers
-            current_due_ids_int = [int(id_val) for id_val in request.session.get("due_review_ids", [])]
-            current_due_ids_int.remove(current_card_id)
-            request.session["due_review_ids"] = current_due_ids_int  # Store updated list back
-        except ValueError:
-            # Should not happen if validation above worked, but handle defensively
-            pass  # Card already removed or wasn't there
-
-        # Find the next card ID from the updated list in the session
-        remaining_ids = request.session.get("due_review_ids", [])
-
-        if remaining_ids:
-            next_card_id = remaining_ids[0]  # Get the next one in the pre-ordered list
+        next_card_id = advance_review_session(review_session)
+        if next_card_id is not None:
             return redirect("review-due-card", flashcard_id=next_card_id)
+
+        # No more cards left in this session
+        if review_session.flashcard_set is not None:
+            messages.success(request, f"Review complete for set '{review_session.flashcard_set.title}'!")
         else:
-            # No more cards left in this session
-            messages.success(request, f"Review complete for set '{flashcard.flashcard_set.title}'!")
-            # Clear session variables
-            request.session.pop("due_review_set_id", None)
-            request.session.pop("due_review_ids", None)
-            return redirect("review-due")  # Go back to the list of due sets
+            messages.success(request, "Review complete!")
+        request.session.pop(SESSION_KEY, None)
+        return redirect("review-due")  # Go back to the list of due sets
 
     # --- GET Request or Initial Load ---
     context = {
         "flashcard": flashcard,
         "show_back": show_back,
         "is_review_session": True,  # Flag for the template (optional)
-        "remaining_in_session": len(request.session.get("due_review_ids", []))  # How many left (optional)
+        "remaining_in_session": review_session.remaining()  # How many left, including this card
     }
     # Reuse the same detail template, potentially adjusting based on 'is_review_session'
     return render(request, "flashcards/flashcard_detail.html", context)
+
+
+@login_required
+def due_queue_api(request):
+    """
+    Returns the user's due cards as JSON, one page at a time.
+    Pass the returned next_cursor as ?cursor= to fetch the following page.
+    """
+    try:
+        flashcard_set = None
+        if request.GET.get("set"):
+            flashcard_set = get_object_or_404(FlashcardSet, id=int(request.GET["set"]), created_by=request.user)
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+        reviews, next_cursor = get_due_page(
+            request.user, cursor=request.GET.get("cursor"), limit=limit, flashcard_set=flashcard_set
+        )
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    cards = [{
+        "id": review.flashcard_id,
+        "front": review.flashcard.front,
+        "back": review.flashcard.back,
+        "flashcard_set_id": review.flashcard.flashcard_set_id,
+        "state": review.state,
+        "next_review_date": review.next_review_date.isoformat(),
+    } for review in reviews]
+
+    return JsonResponse({"cards": cards, "next_cursor": next_cursor})
+
+
+@login_required
+def search_api(request):
+    """
+    Searches the user's cards by front and back (?q=) and returns one page of ranked results as JSON.
+    Pass ?page= for the following pages and ?set=<id> to search a single set.
+    """
+    try:
+        flashcard_set = None
+        if request.GET.get("set"):
+            flashcard_set = get_object_or_404(FlashcardSet, id=int(request.GET["set"]), created_by=request.user)
+        page = int(request.GET.get("page", 1))
+        limit = int(request.GET.get("limit", SEARCH_PAGE_SIZE))
+        flashcards, has_next = search_flashcards(
+            request.user, request.GET.get("q", ""), page=page, page_size=limit, flashcard_set=flashcard_set
+        )
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    cards = [{
+        "id": flashcard.id,
+        "front": flashcard.front,
+        "back": flashcard.back,
+        "flashcard_set_id": flashcard.flashcard_set_id,
+        "flashcard_set_title": flashcard.flashcard_set.title,
+        "url": reverse("flashcard-detail", args=[flashcard.id]),
+    } for flashcard in flashcards]
+
+    return JsonResponse({"cards": cards, "page": page, "next_page": page + 1 if has_next else None})
+
+
+@login_required
+def workload_forecast_api(request):
+    """
+    Returns the simulated number of due cards and reviews for each of the coming days (?days=, at most 90) as JSON.
+    The ratings are sampled with a seed fixed for the user and day, so the forecast is stable over the day.
+    """
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Invalid number of days"}, status=400)
+    days = max(1, min(days, 90))
+
+    now = timezone.now()
+    forecast = forecast_user_workload(request.user, days=days, now=now,
+                                      seed=[request.user.id, now.date().toordinal()])
+    return JsonResponse({"days": [{
+        "date": (now + timedelta(days=day)).date().isoformat(),
+        "due": int(forecast["due"][day]),
+        "reviews": int(forecast["reviews"][day]),
+        "new": int(forecast["new"][day]),
+    } for day in range(days)]})